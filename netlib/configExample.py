@@ -50,6 +50,10 @@ DEFAULT_INTERFACE = 'eth0'
 
 TCPDUMP_COUNT = 100
 
+# Where TCPDumpCache keeps parsed traces and how much disk it may use.
+TRACE_CACHE_DIR = '/tmp/netlib-trace-cache'
+TRACE_CACHE_SIZE = 1024 * 1024 * 1024  # Bytes
+
 header_list = {'User-Agent': 'python-%s.%s' % ('net-lib', '0.1')}
 BANNED_NETLOCS = ['ad.doubleclick.net',
                   'fls.doubleclick.net',
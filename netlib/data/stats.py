@@ -0,0 +1,274 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Small statistics helpers shared by the measurement modules.
+
+The end systems and the controller only have the standard library to work with
+so everything in here is plain Python.
+
+  ConvergenceSummary: Named tuple describing the state of a Convergence.
+  Convergence: Running mean with a confidence interval and a stopping rule.
+  Mean: Arithmetic mean of a list.
+  StdDev: Sample standard deviation of a list.
+  Percentile: Linearly interpolated percentile of a list.
+  JainIndex: Jain's fairness index of a list of allocations.
+  TValue: Two sided critical value of Student's t distribution.
+
+Simple usage:
+  conv = Convergence(width=0.05)
+  for sample in samples:
+    if conv.Add(sample):
+      break
+  print conv.Summary()
+"""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import collections
+import math
+
+
+# Two sided critical values of Student's t distribution indexed by confidence
+# and then by degrees of freedom.  Anything past the largest listed degrees of
+# freedom uses the normal approximation stored under None.
+T_TABLE = {
+    0.90: {1: 6.314, 2: 2.920, 3: 2.353, 4: 2.132, 5: 2.015, 6: 1.943,
+           7: 1.895, 8: 1.860, 9: 1.833, 10: 1.812, 12: 1.782, 15: 1.753,
+           20: 1.725, 25: 1.708, 30: 1.697, None: 1.645},
+    0.95: {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447,
+           7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228, 12: 2.179, 15: 2.131,
+           20: 2.086, 25: 2.060, 30: 2.042, None: 1.960},
+    0.99: {1: 63.657, 2: 9.925, 3: 5.841, 4: 4.604, 5: 4.032, 6: 3.707,
+           7: 3.499, 8: 3.355, 9: 3.250, 10: 3.169, 12: 3.055, 15: 2.947,
+           20: 2.845, 25: 2.787, 30: 2.750, None: 2.576},
+}
+
+
+def TValue(df, confidence=0.95):
+  """Two sided critical value of Student's t distribution.
+
+  Degrees of freedom that are not in the table round down to the closest
+  listed value which errs on the side of a wider interval.
+
+  Args:
+    df: degrees of freedom (int >= 1).
+    confidence: one of the confidence levels in T_TABLE.
+
+  Returns:
+    t: the critical value (float).
+
+  Raises:
+    No exceptions handled here.
+    No new exceptions generated here.
+  """
+  assert confidence in T_TABLE
+  assert df >= 1
+  table = T_TABLE[confidence]
+  listed = sorted([x for x in table if x is not None])
+  if df > listed[-1]:
+    return table[None]
+  best = listed[0]
+  for x in listed:
+    if x <= df:
+      best = x
+  return table[best]
+
+
+def Mean(values):
+  """Arithmetic mean of a list (None for an empty list)."""
+  if not values:
+    return None
+  return float(sum(values)) / len(values)
+
+
+def StdDev(values):
+  """Sample standard deviation of a list (None for fewer than two values)."""
+  if len(values) < 2:
+    return None
+  mean = Mean(values)
+  return math.sqrt(sum([(x - mean) ** 2 for x in values]) / (len(values) - 1))
+
+
+def Percentile(values, percent):
+  """Linearly interpolated percentile of a list (None for an empty list).
+
+  Args:
+    values: list of numbers (need not be sorted).
+    percent: the percentile to find (0 to 100).
+
+  Returns:
+    the percentile as a float.
+
+  Raises:
+    No exceptions handled here.
+    No new exceptions generated here.
+  """
+  assert 0 <= percent <= 100
+  if not values:
+    return None
+  ordered = sorted(values)
+  pos = (len(ordered) - 1) * percent / 100.0
+  low = int(math.floor(pos))
+  high = min(low + 1, len(ordered) - 1)
+  return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def JainIndex(values):
+  """Jain's fairness index of a list of allocations.
+
+  The index is (sum x)^2 / (n * sum x^2) which is 1 when everybody gets the
+  same share and 1/n when one gets everything.
+
+  Args:
+    values: list of allocations (i.e. the throughput of competing flows).
+
+  Returns:
+    the index as a float (None for an empty or all zero list).
+
+  Raises:
+    No exceptions handled here.
+    No new exceptions generated here.
+  """
+  squares = sum([float(x) ** 2 for x in values])
+  if not values or not squares:
+    return None
+  return float(sum(values)) ** 2 / (len(values) * squares)
+
+
+class ConvergenceSummary(collections.namedtuple('ConvergenceSummary',
+                                                ['samples', 'mean', 'stdev',
+                                                 'ci_low', 'ci_high',
+                                                 'relative_width',
+                                                 'converged'])):
+  """Class to simplify working with convergence statistics.
+
+  This works like a struct in C/C++.  See named tuple for more information.
+  http://docs.python.org/library/collections.html#collections.namedtuple
+
+  Attributes:
+    samples: number of samples seen (int)
+    mean: mean of the samples (float)
+    stdev: sample standard deviation (float)
+    ci_low: lower bound of the confidence interval of the mean (float)
+    ci_high: upper bound of the confidence interval of the mean (float)
+    relative_width: (ci_high - ci_low) / mean (float)
+    converged: was the target width reached (bool)
+  """
+  pass
+#END CLASS ConvergenceSummary
+
+
+class Convergence(object):
+  """Running mean with a confidence interval and a stopping rule.
+
+  Samples are added one at a time and the mean and variance are kept up to date
+  with Welford's method so nothing needs to be stored.  The run is considered
+  converged once at least min_samples have been seen and the full width of the
+  confidence interval of the mean divided by the mean is no more than width.
+
+  Attributes:
+    width: target relative width of the confidence interval.
+    confidence: confidence level for the interval (see T_TABLE).
+    min_samples: never declare convergence with fewer samples than this.
+    samples: number of samples seen so far.
+    mean: running mean of the samples.
+    converged: has the stopping rule been met.
+  """
+
+  def __init__(self, width=0.05, confidence=0.95, min_samples=5):
+    """Inits Convergence with a stopping rule.
+
+    Args:
+      width: target relative width of the confidence interval.
+      confidence: confidence level for the interval (see T_TABLE).
+      min_samples: never declare convergence with fewer samples than this.
+
+    Returns:
+      Convergence: an instance of the Convergence class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    assert width > 0
+    assert confidence in T_TABLE
+    self.width = width
+    self.confidence = confidence
+    self.min_samples = max(2, min_samples)
+    self.samples = 0
+    self.mean = 0.0
+    self.__m2 = 0.0
+    self.converged = False
+
+  def Add(self, value):
+    """Adds a sample and checks the stopping rule.
+
+    Args:
+      value: the new sample.
+
+    Returns:
+      True if the stopping rule has been met and False otherwise.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    self.samples += 1
+    delta = value - self.mean
+    self.mean += delta / self.samples
+    self.__m2 += delta * (value - self.mean)
+    if self.samples >= self.min_samples:
+      relative_width = self.RelativeWidth()
+      self.converged = (relative_width is not None and
+                        relative_width <= self.width)
+    return self.converged
+
+  def StdDev(self):
+    """Sample standard deviation so far (None for fewer than two samples)."""
+    if self.samples < 2:
+      return None
+    return math.sqrt(self.__m2 / (self.samples - 1))
+
+  def HalfWidth(self):
+    """Half width of the confidence interval of the mean (or None)."""
+    if self.samples < 2:
+      return None
+    t = TValue(self.samples - 1, self.confidence)
+    return t * self.StdDev() / math.sqrt(self.samples)
+
+  def RelativeWidth(self):
+    """Full width of the confidence interval over the mean (or None)."""
+    half_width = self.HalfWidth()
+    if half_width is None or self.mean <= 0:
+      return None
+    return 2.0 * half_width / self.mean
+
+  def Summary(self):
+    """Returns the current state as a ConvergenceSummary."""
+    half_width = self.HalfWidth()
+    if half_width is None:
+      ci_low = ci_high = None
+    else:
+      ci_low = self.mean - half_width
+      ci_high = self.mean + half_width
+    return ConvergenceSummary(samples=self.samples,
+                              mean=self.mean if self.samples else None,
+                              stdev=self.StdDev(),
+                              ci_low=ci_low,
+                              ci_high=ci_high,
+                              relative_width=self.RelativeWidth(),
+                              converged=self.converged)
+#END CLASS Convergence
@@ -0,0 +1,99 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for netlib.data.stats."""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import unittest
+
+from netlib.data import stats
+
+
+class TValueTest(unittest.TestCase):
+  """Test for TValue."""
+
+  def testTable(self):
+    """Listed values come straight from the table."""
+    self.assertAlmostEqual(stats.TValue(1), 12.706)
+    self.assertAlmostEqual(stats.TValue(10, 0.99), 3.169)
+
+  def testRounding(self):
+    """Missing degrees of freedom round down and large ones are normal."""
+    self.assertAlmostEqual(stats.TValue(11), stats.TValue(10))
+    self.assertAlmostEqual(stats.TValue(1000), 1.960)
+#END CLASS TValueTest
+
+
+class SummaryTest(unittest.TestCase):
+  """Test for Percentile and JainIndex."""
+
+  def testPercentile(self):
+    """Percentiles interpolate between the closest values."""
+    values = [5, 1, 4, 2, 3]
+    self.assertEqual(stats.Percentile(values, 0), 1)
+    self.assertEqual(stats.Percentile(values, 50), 3)
+    self.assertEqual(stats.Percentile(values, 100), 5)
+    self.assertAlmostEqual(stats.Percentile(values, 90), 4.6)
+    self.assertIsNone(stats.Percentile([], 50))
+
+  def testJainIndex(self):
+    """Equal shares are fair and one winner is as unfair as it gets."""
+    self.assertAlmostEqual(stats.JainIndex([10, 10, 10, 10]), 1.0)
+    self.assertAlmostEqual(stats.JainIndex([40, 0, 0, 0]), 0.25)
+    self.assertAlmostEqual(stats.JainIndex([1, 3]), 16.0 / 20.0)
+    self.assertIsNone(stats.JainIndex([]))
+#END CLASS SummaryTest
+
+
+class ConvergenceTest(unittest.TestCase):
+  """Test for Convergence."""
+
+  def testSteady(self):
+    """A steady stream converges as soon as min_samples is reached."""
+    conv = stats.Convergence(width=0.05, min_samples=5)
+    results = [conv.Add(x) for x in [100.0, 100.5, 99.5, 100.0, 100.2]]
+    self.assertEqual(results, [False, False, False, False, True])
+    summary = conv.Summary()
+    self.assertTrue(summary.converged)
+    self.assertEqual(summary.samples, 5)
+    self.assertAlmostEqual(summary.mean, stats.Mean([100.0, 100.5, 99.5,
+                                                     100.0, 100.2]))
+    self.assertLess(summary.ci_low, summary.mean)
+    self.assertGreater(summary.ci_high, summary.mean)
+    self.assertLessEqual(summary.relative_width, 0.05)
+
+  def testNoisy(self):
+    """A noisy stream does not converge."""
+    conv = stats.Convergence(width=0.05, min_samples=2)
+    for x in [10.0, 90.0, 20.0, 80.0, 30.0, 70.0]:
+      self.assertFalse(conv.Add(x))
+    self.assertAlmostEqual(conv.StdDev(),
+                           stats.StdDev([10.0, 90.0, 20.0, 80.0, 30.0, 70.0]))
+    self.assertGreater(conv.Summary().relative_width, 0.05)
+
+  def testEmpty(self):
+    """Nothing to report before any samples."""
+    summary = stats.Convergence().Summary()
+    self.assertEqual(summary.samples, 0)
+    self.assertIsNone(summary.mean)
+    self.assertIsNone(summary.relative_width)
+    self.assertFalse(summary.converged)
+#END CLASS ConvergenceTest
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,230 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Builds tcpdump (BPF) capture filters.
+
+Capturing only the packets (and the parts of them) that will be looked at
+keeps the capture, the copy back and the parsing small.  BPFFilter builds the
+filter expression from protocols, hosts, ports and TCP flags, checking each
+value as it goes, and picks the snap length that covers the headers.
+
+  BPFFilter: Class to build a filter expression and its snap length.
+
+Simple usage (just the headers of the iperf flow):
+  bpf = BPFFilter(hosts=['10.0.0.1', '10.0.0.2'], ports=5001)
+  tcp_d = TCPDump('a.remote_host.com')
+  tcp_d.Start(interface='eth0', count=None, bpf=bpf)
+
+Only the connection setup and teardown, or 64 Bytes of every UDP payload:
+  bpf = BPFFilter(dst_ports=80, tcp_flags=('syn', 'fin', 'rst'))
+  bpf = BPFFilter(protocols=('udp',), src='10.0.0.0/24', payload=64)
+  print bpf.Expression(), bpf.SnapLen()
+  program = bpf.Compile(host, 'eth0')  # what tcpdump -d makes of it
+"""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import re
+
+
+class BPFFilter(object):
+  """Class to build a filter expression and its snap length.
+
+  Every argument narrows the capture (they are joined with and), a list of
+  values for one argument matches any of them (they are joined with or).
+
+  Attributes:
+    BIN: the tcpdump used by Compile.
+    PROTOCOLS: the protocols that can be captured.
+    TCP_FLAGS: the bit for each TCP flag in the flags byte (tcp[13]).
+    LINK_HEADER: the longest link header (Ethernet with a VLAN tag).
+    NETWORK_HEADER: the longest IP header (IPv4 with options).
+    TRANSPORT_HEADERS: the longest header of each protocol.
+    MAX_SNAPLEN: the snap length for whole packets.
+  """
+
+  BIN = 'sudo tcpdump'
+  PROTOCOLS = ('tcp', 'udp', 'icmp', 'icmp6', 'sctp', 'ip', 'ip6', 'arp')
+  TCP_FLAGS = {'fin': 0x01, 'syn': 0x02, 'rst': 0x04, 'psh': 0x08,
+               'ack': 0x10, 'urg': 0x20, 'ece': 0x40, 'cwr': 0x80}
+  LINK_HEADER = 18  # units=Bytes
+  NETWORK_HEADER = 60  # units=Bytes
+  TRANSPORT_HEADERS = {'tcp': 60, 'udp': 8, 'icmp': 8, 'icmp6': 8,
+                       'sctp': 12}  # units=Bytes
+  MAX_SNAPLEN = 65535  # units=Bytes
+  __HOST = re.compile(r'^[A-Za-z0-9_.:-]+(/[0-9]{1,3})?$')
+
+  def __init__(self, protocols=('tcp',), hosts=None, src=None, dst=None,
+               ports=None, src_ports=None, dst_ports=None, tcp_flags=None,
+               payload=0):
+    """Inits BPFFilter and checks every value.
+
+    Args:
+      protocols: capture any of these protocols (see PROTOCOLS).
+      hosts: addresses, names or networks (i.e. '10.0.0.0/8') either end of
+        the packet can be.
+      src: addresses, names or networks the packets can come from.
+      dst: addresses, names or networks the packets can go to.
+      ports: ports (or (low, high) ranges) either end of the packet can use.
+      src_ports: ports (or ranges) the packets can come from.
+      dst_ports: ports (or ranges) the packets can go to.
+      tcp_flags: only TCP packets with any of these flags set (see TCP_FLAGS).
+      payload: Bytes of payload to keep after the headers (None for whole
+        packets).
+
+    Returns:
+      BPFFilter: an instance of the BPFFilter class.
+
+    Raises:
+      ValueError: if a value is not one tcpdump would take.
+    """
+    self.protocols = self.__List(protocols)
+    for protocol in self.protocols:
+      if protocol not in BPFFilter.PROTOCOLS:
+        raise ValueError('unknown protocol %r' % (protocol,))
+    self.hosts = self.__Hosts(hosts)
+    self.src = self.__Hosts(src)
+    self.dst = self.__Hosts(dst)
+    self.ports = self.__Ports(ports)
+    self.src_ports = self.__Ports(src_ports)
+    self.dst_ports = self.__Ports(dst_ports)
+    self.tcp_flags = self.__List(tcp_flags)
+    for flag in self.tcp_flags:
+      if flag not in BPFFilter.TCP_FLAGS:
+        raise ValueError('unknown TCP flag %r' % (flag,))
+    if self.tcp_flags and self.protocols not in ([], ['tcp']):
+      raise ValueError('TCP flags only make sense for tcp')
+    if payload is not None and payload < 0:
+      raise ValueError('payload can not be negative')
+    self.payload = payload
+
+  @staticmethod
+  def __List(values):
+    """Returns values as a list (a single value becomes a list of one)."""
+    if values is None:
+      return list()
+    if isinstance(values, (basestring, int, long)):
+      return [values]
+    return list(values)
+
+  def __Hosts(self, hosts):
+    """Checks a list of addresses, names or networks."""
+    hosts = self.__List(hosts)
+    for host in hosts:
+      if not isinstance(host, basestring) or not BPFFilter.__HOST.match(host):
+        raise ValueError('not an address, name or network %r' % (host,))
+    return hosts
+
+  def __Ports(self, ports):
+    """Checks a list of ports or (low, high) port ranges."""
+    ports = self.__List(ports)
+    for port in ports:
+      if isinstance(port, tuple):
+        valid = (len(port) == 2 and
+                 all(isinstance(x, (int, long)) for x in port) and
+                 0 <= port[0] <= port[1] <= 65535)
+      else:
+        valid = isinstance(port, (int, long)) and 0 <= port <= 65535
+      if not valid:
+        raise ValueError('not a port or port range %r' % (port,))
+    return ports
+
+  @staticmethod
+  def __Any(terms):
+    """Joins terms with or (in parentheses if there is more than one)."""
+    if len(terms) == 1:
+      return terms[0]
+    return '(%s)' % ' or '.join(terms)
+
+  def Expression(self):
+    """Returns the filter expression ('' to capture everything).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    clauses = list()
+    if self.protocols:
+      clauses.append(self.__Any(self.protocols))
+    for direction, hosts in (('', self.hosts), ('src ', self.src),
+                             ('dst ', self.dst)):
+      if hosts:
+        clauses.append(self.__Any(
+            ['%s%s %s' % (direction, '/' in x and 'net' or 'host', x)
+             for x in hosts]))
+    for direction, ports in (('', self.ports), ('src ', self.src_ports),
+                             ('dst ', self.dst_ports)):
+      if ports:
+        terms = list()
+        for port in ports:
+          if isinstance(port, tuple):
+            terms.append('%sportrange %d-%d' % (direction, port[0], port[1]))
+          else:
+            terms.append('%sport %d' % (direction, port))
+        clauses.append(self.__Any(terms))
+    if self.tcp_flags:
+      mask = 0
+      for flag in self.tcp_flags:
+        mask |= BPFFilter.TCP_FLAGS[flag]
+      if not self.protocols:
+        clauses.append('tcp')
+      # tcp[13] rather than tcp[tcpflags] so older tcpdumps take it too.
+      clauses.append('tcp[13] & 0x%02x != 0' % mask)
+    return ' and '.join(clauses)
+
+  def SnapLen(self):
+    """Returns how many Bytes of each packet to capture.
+
+    Enough for the longest headers of the protocols asked for plus payload
+    Bytes of payload.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if self.payload is None:
+      return BPFFilter.MAX_SNAPLEN
+    longest = BPFFilter.TRANSPORT_HEADERS['tcp']
+    transport = [BPFFilter.TRANSPORT_HEADERS.get(x, longest)
+                 for x in self.protocols]
+    if not self.protocols:
+      transport.append(longest)
+    return min(BPFFilter.LINK_HEADER + BPFFilter.NETWORK_HEADER +
+               max(transport) + self.payload, BPFFilter.MAX_SNAPLEN)
+
+  def Compile(self, host, interface):
+    """Has tcpdump on host compile the filter (without capturing anything).
+
+    Args:
+      host: the netlib.shell.bash.Host the capture will run on.
+      interface: the interface the capture will listen on.
+
+    Returns:
+      list of the lines of the BPF program tcpdump -d prints.
+
+    Raises:
+      ValueError: if tcpdump can not compile the filter.
+    """
+    expression = self.Expression()
+    cmd = '%s -d -i %s' % (BPFFilter.BIN, interface)
+    if expression:
+      cmd += " '%s'" % expression
+    program = [x for x in (host.Run(cmd) or '').splitlines()
+               if x.startswith('(')]
+    if not program:
+      raise ValueError('tcpdump could not compile %r' % expression)
+    return program
+#END CLASS BPFFilter
@@ -0,0 +1,91 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for netlib.net.bpf."""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import unittest
+
+from netlib.net import bpf
+from netlib.shell import mock
+
+
+PROGRAM = """(000) ldh      [12]
+(001) jeq      #0x800           jt 2    jf 5
+(002) ldb      [23]
+(003) jeq      #0x6             jt 4    jf 5
+(004) ret      #138
+(005) ret      #0"""
+
+
+class BPFFilterTest(unittest.TestCase):
+  """Test for BPFFilter."""
+
+  def testExpression(self):
+    """Each argument is a clause and each list is a choice."""
+    self.assertEqual(bpf.BPFFilter().Expression(), 'tcp')
+    self.assertEqual(bpf.BPFFilter(protocols=None).Expression(), '')
+    self.assertEqual(
+        bpf.BPFFilter(hosts=['10.0.0.1', '10.0.0.2'], ports=5001).Expression(),
+        'tcp and (host 10.0.0.1 or host 10.0.0.2) and port 5001')
+    self.assertEqual(
+        bpf.BPFFilter(protocols=('tcp', 'udp'), src='10.0.0.0/24',
+                      dst='a.dst', dst_ports=[80, (8000, 8080)]).Expression(),
+        '(tcp or udp) and src net 10.0.0.0/24 and dst host a.dst and '
+        '(dst port 80 or dst portrange 8000-8080)')
+
+  def testFlags(self):
+    """TCP flags become a mask on the flags byte."""
+    self.assertEqual(bpf.BPFFilter(tcp_flags=('syn', 'fin')).Expression(),
+                     'tcp and tcp[13] & 0x03 != 0')
+    self.assertEqual(bpf.BPFFilter(protocols=None,
+                                   tcp_flags='rst').Expression(),
+                     'tcp and tcp[13] & 0x04 != 0')
+    self.assertRaises(ValueError, bpf.BPFFilter, protocols='udp',
+                      tcp_flags='syn')
+
+  def testBadValues(self):
+    """Anything tcpdump would not take (or a shell would) is refused."""
+    for kwargs in ({'protocols': 'tcpp'}, {'hosts': 'a b'},
+                   {'src': "a'; rm -rf /"}, {'dst': 5}, {'ports': 70000},
+                   {'src_ports': [(10, 5)]}, {'dst_ports': '80'},
+                   {'tcp_flags': 'nope'}, {'payload': -1}):
+      self.assertRaises(ValueError, bpf.BPFFilter, **kwargs)
+
+  def testSnapLen(self):
+    """The longest headers of the protocols plus the payload."""
+    self.assertEqual(bpf.BPFFilter().SnapLen(), 18 + 60 + 60)
+    self.assertEqual(bpf.BPFFilter(protocols='udp', payload=64).SnapLen(),
+                     18 + 60 + 8 + 64)
+    self.assertEqual(bpf.BPFFilter(protocols=('udp', 'tcp')).SnapLen(), 138)
+    self.assertEqual(bpf.BPFFilter(protocols='ip').SnapLen(), 138)
+    self.assertEqual(bpf.BPFFilter(payload=None).SnapLen(), 65535)
+    self.assertEqual(bpf.BPFFilter(payload=100000).SnapLen(), 65535)
+
+  def testCompile(self):
+    """tcpdump -d on the host checks the filter."""
+    host = mock.MockHost('a.src')
+    good = bpf.BPFFilter()
+    mock.MockHost.results["sudo tcpdump -d -i eth0 'tcp'"] = PROGRAM
+    self.assertEqual(good.Compile(host, 'eth0'), PROGRAM.splitlines())
+    self.assertRaises(ValueError, bpf.BPFFilter(ports=1).Compile, host,
+                      'eth0')
+#END CLASS BPFFilterTest
+
+
+if __name__ == '__main__':
+  unittest.main()
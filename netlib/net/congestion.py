@@ -0,0 +1,319 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares TCP congestion control algorithms on a set of host pairs.
+
+Every trial switches net.ipv4.tcp_congestion_control on all of the senders,
+measures all of the pairs at once so their flows compete with each other and
+throws away the interval reports from a short warm-up at the start.  The
+algorithms are interleaved (the order is rotated every repetition) so slow
+drifts in the network do not favour whichever algorithm happens to go first.
+The senders are always put back the way they were with SysctlReset, even if a
+trial blows up.
+
+  CongestionTrial: Named tuple with the flows measured in a single trial.
+  CongestionSummary: Named tuple with the statistics for one algorithm.
+  CongestionComparison: Class that runs and summarizes the trials.
+
+Simple usage:
+  cc = CongestionComparison(['a.remote_host.com', 'b.remote_host.com'],
+                            ['c.remote_host.com', 'd.remote_host.com'],
+                            ['c.remote_host.com', 'd.remote_host.com'],
+                            ['cubic', 'reno'])
+  cc.Start(length=30, repeats=5)
+  for summary in cc.Summaries():
+    print summary.algorithm, summary.median, summary.fairness
+"""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import collections
+import logging
+
+from netlib.data import stats
+from netlib.net import iperf
+from netlib.shell import bash
+
+
+KEY = 'net.ipv4.tcp_congestion_control'
+AVAILABLE_KEY = 'net.ipv4.tcp_available_congestion_control'
+
+
+class CongestionTrial(collections.namedtuple('CongestionTrial',
+                                             ['algorithm', 'repeat', 'flows',
+                                              'throughput', 'fairness'])):
+  """Class to simplify working with the results of a single trial.
+
+  This works like a struct in C/C++.  See named tuple for more information.
+  http://docs.python.org/library/collections.html#collections.namedtuple
+
+  Attributes:
+    algorithm: congestion control algorithm on the senders (string)
+    repeat: which repetition this trial belongs to (int)
+    flows: throughput of every competing flow in Mbps (list of floats)
+    throughput: sum of the flows in Mbps (float)
+    fairness: Jain's fairness index of the flows (float or None)
+  """
+  pass
+#END CLASS CongestionTrial
+
+
+class CongestionSummary(collections.namedtuple('CongestionSummary',
+                                               ['algorithm', 'trials',
+                                                'throughput', 'flows',
+                                                'mean', 'stdev', 'p10',
+                                                'median', 'p90',
+                                                'fairness'])):
+  """Class to simplify working with the results for one algorithm.
+
+  This works like a struct in C/C++.  See named tuple for more information.
+  http://docs.python.org/library/collections.html#collections.namedtuple
+
+  Attributes:
+    algorithm: congestion control algorithm on the senders (string)
+    trials: number of trials that were measured (int)
+    throughput: aggregate throughput of every trial in Mbps (list of floats)
+    flows: throughput of every flow in every trial in Mbps (list of floats)
+    mean: mean aggregate throughput in Mbps (float)
+    stdev: sample standard deviation of the aggregate in Mbps (float or None)
+    p10: 10th percentile of the aggregate in Mbps (float)
+    median: median of the aggregate in Mbps (float)
+    p90: 90th percentile of the aggregate in Mbps (float)
+    fairness: mean Jain's fairness index over the trials (float or None)
+  """
+  pass
+#END CLASS CongestionSummary
+
+
+class CongestionComparison(object):
+  """Class that runs interleaved congestion control trials.
+
+  The sources, target destinations and destinations are the same as for an
+  IperfSet.  A source that shows up more than once shares a single Host object
+  so the sysctl is only switched (and reset) once per machine.
+
+  Attributes:
+    algorithms: list of algorithm names to compare.
+    senders: list of unique bash.Host objects whose sysctl is switched.
+    trials: list of CongestionTrials in the order they were run.
+  """
+
+  def __init__(self, target_src, target_dst, dst, algorithms,
+               backend='iperf'):
+    """Inits CongestionComparison with a set of host pairs.
+
+    Args:
+      target_src: list of hostnames or bash.Host objects that send.
+      target_dst: list of hostnames or bash.Host objects that receive (1:1
+        with target_src).
+      dst: list of addresses to connect to (1:1 with target_dst).
+      algorithms: list of algorithm names (i.e. ['cubic', 'reno']).
+      backend: which traffic generator to run (see iperf.BACKENDS).
+
+    Returns:
+      CongestionComparison: an instance of the CongestionComparison class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    assert len(target_src) == len(target_dst) == len(dst)
+    assert algorithms
+    self.algorithms = list(algorithms)
+    self.backend = backend
+    self.dst = list(dst)
+    hosts = dict()
+    self.senders = list()
+    self.sources = list()
+    for src in target_src:
+      if not isinstance(src, bash.Host):
+        if src not in hosts:
+          hosts[src] = bash.Host(src)
+        src = hosts[src]
+      if src not in self.senders:
+        self.senders.append(src)
+      self.sources.append(src)
+    self.servers = list(target_dst)
+    self.trials = list()
+
+  def Available(self):
+    """Returns the algorithms every sender lists as available.
+
+    This comes from the sysctl snapshot taken when the Host was created.  An
+    algorithm that is built as a module may not be listed until it is loaded
+    so this is only used for a warning.
+
+    Returns:
+      set of algorithm names or None if a sender did not report the list.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    available = None
+    for host in self.senders:
+      listed = host.sysctl_start.get(AVAILABLE_KEY)
+      if listed is None:
+        return None
+      if available is None:
+        available = set(listed.split())
+      else:
+        available &= set(listed.split())
+    return available
+
+  def Select(self, algorithm):
+    """Switches every sender to an algorithm.
+
+    Args:
+      algorithm: the algorithm name.
+
+    Returns:
+      True if every sender took the new setting and False otherwise.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    available = self.Available()
+    if available is not None and algorithm not in available:
+      logging.warn('%s is not listed as available on every sender', algorithm)
+    status = True
+    for host in self.senders:
+      host.Sysctl(KEY, algorithm)
+      if host.sysctl_mod.get(KEY) != algorithm:
+        logging.error('%s -- could not set %s=%s', host.host, KEY, algorithm)
+        status = False
+    return status
+
+  def Reset(self):
+    """Puts the sysctl state of every sender back the way it was.
+
+    This uses SysctlReset so anything else that was changed through Sysctl on
+    the senders is put back as well.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    for host in self.senders:
+      host.SysctlReset()
+
+  def Start(self, length, repeats=3, warmup=2, window=None, parallel=None):
+    """Runs repeats interleaved trials of every algorithm.
+
+    Args:
+      length: measure for this many seconds in every trial.
+      repeats: how many trials to run for every algorithm.
+      warmup: If set every trial runs this many seconds longer and the interval
+        reports from the first warmup seconds are thrown away, so the flows
+        that are measured are the ones that were warmed up.
+      window: If set use TCP with a window size in Bytes.
+      parallel: If set every client runs this many parallel streams.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    try:
+      for repeat in range(repeats):
+        offset = repeat % len(self.algorithms)
+        order = self.algorithms[offset:] + self.algorithms[:offset]
+        for algorithm in order:
+          if not self.Select(algorithm):
+            continue
+          ips = iperf.IperfSet(self.sources, self.servers, self.dst,
+                               self.backend)
+          if warmup:
+            interval = (iperf.IperfClient.interval or
+                        iperf.IperfClient.ADAPTIVE_INTERVAL)
+            ips.Start(warmup + length, None, window, parallel=parallel,
+                      interval=interval)
+          else:
+            ips.Start(length, None, window, parallel=parallel)
+          flows = Flows(ips.ParsedResults(), warmup)
+          self.trials.append(CongestionTrial(algorithm=algorithm,
+                                             repeat=repeat, flows=flows,
+                                             throughput=sum(flows),
+                                             fairness=stats.JainIndex(flows)))
+    finally:
+      self.Reset()
+
+  def Summary(self, algorithm):
+    """Returns the CongestionSummary for an algorithm (None if not measured)."""
+    trials = [x for x in self.trials if x.algorithm == algorithm]
+    if not trials:
+      return None
+    throughput = [x.throughput for x in trials]
+    flows = list()
+    for trial in trials:
+      flows.extend(trial.flows)
+    fairness = [x.fairness for x in trials if x.fairness is not None]
+    return CongestionSummary(algorithm=algorithm, trials=len(trials),
+                             throughput=throughput, flows=flows,
+                             mean=stats.Mean(throughput),
+                             stdev=stats.StdDev(throughput),
+                             p10=stats.Percentile(throughput, 10),
+                             median=stats.Percentile(throughput, 50),
+                             p90=stats.Percentile(throughput, 90),
+                             fairness=stats.Mean(fairness))
+
+  def Summaries(self):
+    """Returns a list of CongestionSummary objects (1:1 with algorithms)."""
+    return [self.Summary(x) for x in self.algorithms]
+#END CLASS CongestionComparison
+
+
+def Flows(results_list, warmup=None):
+  """Returns the throughput of every competing flow.
+
+  Every stream a client sends is a flow of its own (so parallel streams count
+  as separate flows).  Clients that did not report anything are left out.
+
+  With warmup the throughput is the time weighted mean of the interval reports
+  that start at or after warmup seconds instead of the summary for the run.
+
+  Args:
+    results_list: list of IperfResults (i.e. IperfSet.ParsedResults()).
+    warmup: If set ignore the first this many seconds of every stream.
+
+  Returns:
+    list of throughputs in Mbps.
+
+  Raises:
+    No exceptions handled here.
+    No new exceptions generated here.
+  """
+  flows = list()
+  for results in results_list:
+    if results is None:
+      continue
+    for stream in results.Streams('send'):
+      if warmup:
+        throughput = None
+        intervals = [x for x in results.Intervals(stream)
+                     if x.start >= warmup and x.end > x.start]
+        duration = sum([x.end - x.start for x in intervals])
+        if duration:
+          throughput = sum([x.bandwidth * (x.end - x.start)
+                            for x in intervals]) / duration
+        else:
+          logging.warn('stream %s -- no interval reports after the warm-up',
+                       stream)
+      else:
+        throughput = results.Throughput(stream=stream)
+      if throughput is not None:
+        flows.append(throughput)
+  return flows
@@ -0,0 +1,156 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for netlib.net.congestion."""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import re
+import StringIO
+import unittest
+
+from netlib.net import congestion
+from netlib.shell import mock
+
+
+client_result = """[  3] local 10.0.0.1 port 41063 connected with 10.0.0.2 port 5001
+[  3]  0.0-10.0 sec  53.3 MBytes  %s Mbits/sec"""
+
+interval_result = '[  3] %4.1f-%4.1f sec  1.00 MBytes  %s Mbits/sec'
+
+# Mbps every sender gets with each algorithm.
+RATES = {'cubic': [60, 40], 'reno': [50, 50], 'initial': [0, 0]}
+
+# Mbps every sender gets during slow start (the first two seconds).
+SLOW_START = 1
+
+
+def ClientOutput(cmd, rate):
+  """Makes up the client output, with one second intervals if asked for."""
+  if ' -i 1' not in cmd:
+    return client_result % rate
+  length = int(re.search(r'-t (\d+)', cmd).group(1))
+  lines = [client_result.splitlines()[0]]
+  for i in range(length):
+    lines.append(interval_result % (i, i + 1,
+                                    rate if i >= 2 else SLOW_START))
+  lines.append(interval_result % (0, length, rate))
+  return '\n'.join(lines)
+
+
+class SenderHost(mock.MockHost):
+  """MockHost whose iperf client output depends on the sysctl setting."""
+
+  def __init__(self, hostname, index):
+    mock.MockHost.__init__(self, hostname)
+    self.index = index
+    self.algorithm = 'initial'
+    self.sysctl_start[congestion.KEY] = 'initial'
+    self.sysctl_start[congestion.AVAILABLE_KEY] = 'cubic reno initial'
+    self.log = list()
+    self.clients = list()
+
+  def Run(self, cmd, echo_error=True, fork=False):
+    prefix = 'sudo sysctl -w %s=\\\"' % congestion.KEY
+    if cmd.startswith(prefix):
+      self.algorithm = cmd[len(prefix):-2]
+      self.log.append(self.algorithm)
+      return self.algorithm
+    if cmd.startswith('iperf -c'):
+      if self.algorithm == 'boom':
+        raise RuntimeError('trial failed')
+      self.clients.append(cmd)
+      sub_p = mock.MockSubProcess(self.host, self.GetPid(), cmd, echo_error,
+                                  fork)
+      rate = RATES[self.algorithm][self.index]
+      sub_p.stdout = StringIO.StringIO(ClientOutput(cmd, rate))
+      self.process_dict[sub_p.pid] = sub_p
+      if fork:
+        return sub_p.pid
+      return self.Communicate(sub_p.pid, echo_error)
+    return mock.MockHost.Run(self, cmd, echo_error, fork)
+#END CLASS SenderHost
+
+
+class CongestionComparisonTest(unittest.TestCase):
+  """Test for CongestionComparison."""
+
+  def setUp(self):
+    """Create mock Host objects."""
+    self.senders = [SenderHost('a.src', 0), SenderHost('b.src', 1)]
+    self.receivers = [mock.MockHost('c.dst'), mock.MockHost('d.dst')]
+    self.cc = congestion.CongestionComparison(self.senders, self.receivers,
+                                              ['c.dst', 'd.dst'],
+                                              ['cubic', 'reno'])
+
+  def testInterleaved(self):
+    """The order rotates every repeat and the senders are reset."""
+    self.cc.Start(length=10, repeats=3, warmup=None)
+    self.assertEqual([x.algorithm for x in self.cc.trials],
+                     ['cubic', 'reno', 'reno', 'cubic', 'cubic', 'reno'])
+    for host in self.senders:
+      self.assertEqual(host.log, ['cubic', 'reno', 'reno', 'cubic', 'cubic',
+                                  'reno', 'initial'])
+      self.assertEqual(host.algorithm, 'initial')
+      self.assertFalse(host.sysctl_mod)
+
+  def testWarmup(self):
+    """One longer run per trial with the warm-up intervals thrown away."""
+    self.cc.Start(length=10, repeats=1)
+    self.assertEqual(self.senders[0].clients,
+                     ['iperf -c c.dst -t 12 -i 1', 'iperf -c c.dst -t 12 -i 1'])
+    self.assertEqual(self.senders[1].clients,
+                     ['iperf -c d.dst -t 12 -i 1', 'iperf -c d.dst -t 12 -i 1'])
+    self.assertEqual(self.cc.trials[0].flows, [60.0, 40.0])
+    self.assertEqual(self.cc.trials[1].flows, [50.0, 50.0])
+
+  def testSummary(self):
+    """Throughput and fairness come from the competing flows."""
+    self.cc.Start(length=10, repeats=2, warmup=None)
+    cubic = self.cc.Summary('cubic')
+    self.assertEqual(cubic.trials, 2)
+    self.assertEqual(cubic.throughput, [100.0, 100.0])
+    self.assertEqual(sorted(cubic.flows), [40.0, 40.0, 60.0, 60.0])
+    self.assertAlmostEqual(cubic.fairness, 10000.0 / (2 * 5200.0))
+    reno = self.cc.Summary('reno')
+    self.assertAlmostEqual(reno.fairness, 1.0)
+    self.assertEqual(reno.median, 100.0)
+    self.assertEqual([x.algorithm for x in self.cc.Summaries()],
+                     ['cubic', 'reno'])
+
+  def testResetOnFailure(self):
+    """The original setting comes back even when a trial fails."""
+    cc = congestion.CongestionComparison(self.senders, self.receivers,
+                                         ['c.dst', 'd.dst'], ['boom'])
+    self.assertRaises(RuntimeError, cc.Start, 10, 1, None)
+    for host in self.senders:
+      self.assertEqual(host.algorithm, 'initial')
+      self.assertFalse(host.sysctl_mod)
+
+  def testSharedSender(self):
+    """A sender used by several pairs is only switched once."""
+    cc = congestion.CongestionComparison([self.senders[0], self.senders[0]],
+                                         self.receivers, ['c.dst', 'd.dst'],
+                                         ['reno'])
+    self.assertEqual(len(cc.senders), 1)
+    cc.Start(length=10, repeats=1, warmup=None)
+    self.assertEqual(self.senders[0].log, ['reno', 'initial'])
+    self.assertEqual(cc.trials[0].flows, [50.0, 50.0])
+#END CLASS CongestionComparisonTest
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -23,9 +23,14 @@ lots of traffic.
 
   IperfServer: Class to simplify starting a remote iperf server.
   IperfClient: Class to simplify starting a remote iperf client.
+  IperfRecord: Named tuple to make sure our records stay together.
+  IperfResults: Class to parse iperf output.
   IperfSet: Class to start a set of iperf clients and a server.
   IperfTCP: IperfSet configured for TCP.
   IperfUDP: IperfSet configured for UDP.
+  IperfRatePoint: Named tuple for one step of a UDP rate search.
+  IperfUDPRate: Loss and jitter for a single UDP rate.
+  IperfUDPMaxRate: Highest UDP rate a path sustains below a loss threshold.
 
 Keep in mind that with iperf traffic flows from the client to the server.  So
 your traffic sources (clients) are going to be sending packets to your
@@ -37,6 +42,12 @@ Simple UDP usage:
 Simple TCP usage:
   IperfTCP(target_src, target_dst, dst, 1, window=256)
 
+Highest UDP rate with at most 0.5% loss (within 5%):
+  rate, curve = IperfUDPMaxRate(target_src, target_dst, dst, loss=0.5)
+
+Without iperf on the end systems (see netlib.net.trafgen):
+  IperfTCP(target_src, target_dst, dst, 1, backend='python')
+
 Simple Set usage:
   target_src_list = ['a.remote_host.com', 'b.remote_host.com']
   target_dst_list = ['c.remote_host.com', 'd.remote_host.com']
@@ -44,15 +55,40 @@ Simple Set usage:
   ips = IperfSet(target_src_list, target_dst_list, dst_list)
   ips.Start(length=5)
   ips.Results()
+
+Adaptive usage (stop once the 95% confidence interval is within 5% of the mean):
+  ips = IperfSet(target_src_list, target_dst_list, dst_list)
+  ips.StartAdaptive(max_length=60, width=0.05)
+  for result in ips.ParsedResults():
+    print result.Throughput(), result.convergence
+
+Sampling the hosts every half second during a run:
+  ips = IperfSet(target_src_list, target_dst_list, dst_list)
+  ips.Start(length=10, sample_interval=0.5)
+  for record, usage in ips.SampledResults()[0]:
+    print record.bandwidth, usage[target_src_list[0]].cpu['cpu']
 """
 
 __author__ = 'gavaletz@google.com (Eric Gavaletz)'
 
+import collections
 import logging
+import re
 import time
 
 from netlib import config
+from netlib.data import stats
+from netlib.net import trafgen
 from netlib.shell import bash
+from netlib.shell import sampler
+
+
+# The traffic generators that can be used, mapped to the command used to start
+# them and the shell command for killing them.  The python backend is
+# netlib.net.trafgen which takes the same arguments and prints the same reports.
+BACKENDS = {'iperf': ('iperf', 'killall -q -r \".*iperf*\"'),
+            'python': ('python -m netlib.net.trafgen',
+                       'pkill -f netlib.net.trafgen')}
 
 
 class IperfServer(object):
@@ -73,7 +109,7 @@ class IperfServer(object):
   pkt = None
   interval = None
 
-  def __init__(self, target):
+  def __init__(self, target, backend='iperf'):
     """Inits IperfServer with a target Host.
 
     After determining if we are being passed a string to turn into a Host
@@ -83,6 +119,7 @@ class IperfServer(object):
 
     Args:
       target: The host machine where the iperf server will run.
+      backend: which traffic generator to run (see BACKENDS).
 
     Returns:
       IperfServer: an instance of the IperfServer class.
@@ -95,6 +132,7 @@ class IperfServer(object):
       self.host = target
     else:
       self.host = bash.Host(target)
+    self.bin, self.kill_string = BACKENDS[backend]
     self.args = ['-s']
     self.data = None
     self.child_pid = None
@@ -110,7 +148,7 @@ class IperfServer(object):
       No new exceptions generated here.
     """
     if self.child_pid:
-      self.host.Kill(self.child_pid, IperfServer.KILL_STRING)
+      self.host.Kill(self.child_pid, self.kill_string)
 
   def Start(self, udp=False):
     """Start a iperf server.
@@ -136,7 +174,7 @@ class IperfServer(object):
     if IperfServer.interval:
       self.args.append('-i %s' % IperfServer.interval)
 
-    cmd = 'iperf %s' % (' '.join(self.args))
+    cmd = '%s %s' % (self.bin, ' '.join(self.args))
 
     if not self.child_pid:
       self.child_pid = self.host.Run(cmd, echo_error=True, fork=True)
@@ -155,7 +193,7 @@ class IperfServer(object):
     if self.child_pid:
       self.data = self.host.Communicate(self.child_pid, echo_error=True,
                                         kill=True,
-                                        kill_string=IperfServer.KILL_STRING)
+                                        kill_string=self.kill_string)
       self.child_pid = None
 
   def Restart(self, udp=False):
@@ -196,15 +234,17 @@ class IperfClient(object):
 
   Attributes:
     KILL_STRING: shell command for killing iperf processes.
+    ADAPTIVE_INTERVAL: report interval used by StartAdaptive in seconds.
     pkt: size of packets to use in Bytes.
     interval: how long to wait between bandwidth reports in seconds.
   """
 
   KILL_STRING = 'killall -q -r \".*iperf*\"'
+  ADAPTIVE_INTERVAL = 1
   pkt = None
   interval = None
 
-  def __init__(self, target, dst):
+  def __init__(self, target, dst, backend='iperf'):
     """Inits IperfClient with a target Host.
 
     After determining if we are being passed a string to turn into a Host
@@ -215,6 +255,7 @@ class IperfClient(object):
     Args:
       target: The host machine where the iperf client will run.
       dst: The host machine address where the client should connect.
+      backend: which traffic generator to run (see BACKENDS).
 
     Returns:
       IperfClient: an instance of the IperfClient class.
@@ -227,10 +268,17 @@ class IperfClient(object):
       self.host = target
     else:
       self.host = bash.Host(target)
+    self.bin, self.kill_string = BACKENDS[backend]
+    self.dst = dst
     self.args = ['-c %s' % dst]
     self.data = None
     self.length = None
     self.child_pid = None
+    self.start_time = None
+    self.parallel = None
+    self.convergence = None
+    self.watched = list()
+    self.__watch_seen = set()
 
   def __del__(self):
     """Tries to make sure that we clean up after ourselves.
@@ -243,9 +291,10 @@ class IperfClient(object):
       No new exceptions generated here.
     """
     if self.child_pid:
-      self.host.Kill(self.child_pid, IperfClient.KILL_STRING)
+      self.host.Kill(self.child_pid, self.kill_string)
 
-  def Start(self, length=None, rate=None, window=None, blocking_call=False):
+  def Start(self, length=None, rate=None, window=None, blocking_call=False,
+            parallel=None, dual=False, tradeoff=False, interval=None):
     """Start a iperf client.
 
     Assembles the command to be used for starting an iperf client on the system
@@ -258,11 +307,24 @@ class IperfClient(object):
     call will fork a new process and then you will need to call Stop() to end
     it.
 
+    With dual the server sends back to the client at the same time (iperf -d)
+    and with tradeoff it does so once the client is done (iperf -r).  In both
+    cases the client output also holds the streams it received, see
+    IperfResults.Streams(direction).
+
+    The arguments are built from scratch every time so a Restart does not
+    repeat the flags of the last run.
+
     Args:
       length: If set only generte traffic for this many seconds.
       rate: If set use UDP with a rate i.e. 10M 100K 1G.
       window: If set use TCP with a window size in Bytes.
       blocking_call: should we wait for the iperf client to finish?
+      parallel: If set run this many parallel streams.
+      dual: should the server send back at the same time?
+      tradeoff: should the server send back after the client is done?
+      interval: If set report every this many seconds (instead of the class
+        interval).
 
     Raises:
       No exceptions handled here.
@@ -271,26 +333,37 @@ class IperfClient(object):
     if not self.data is None:
       logging.warn('%s -- overwriting data', self.host.host)
 
+    assert not (dual and tradeoff)
+    interval = interval or IperfClient.interval
+    self.args = ['-c %s' % self.dst]
     self.length = length
+    self.parallel = parallel
     if length:
       self.args.append('-t %d' % length)
+    if parallel:
+      self.args.append('-P %d' % parallel)
+    if dual:
+      self.args.append('-d')
+    if tradeoff:
+      self.args.append('-r')
     if IperfClient.pkt:
       self.args.append('-M %s' % IperfClient.pkt)
-    if IperfClient.interval:
-      self.args.append('-i %s' % IperfClient.interval)
+    if interval:
+      self.args.append('-i %s' % interval)
 
     if rate and not window:
       self.args.append('-b %s' % rate)
-      cmd = 'iperf -u %s' % (' '.join(self.args))
+      cmd = '%s -u %s' % (self.bin, ' '.join(self.args))
     elif window and not rate:
       self.args.append('-w %s' % window)
-      cmd = 'iperf %s' % (' '.join(self.args))
+      cmd = '%s %s' % (self.bin, ' '.join(self.args))
     else:
       assert not window
       assert not rate
-      cmd = 'iperf %s' % (' '.join(self.args))
+      cmd = '%s %s' % (self.bin, ' '.join(self.args))
 
     if not self.child_pid:
+      self.start_time = time.time()
       if length and blocking_call:
         self.data = self.host.Run(cmd, echo_error=True, fork=False)
         self.child_pid = None
@@ -308,12 +381,92 @@ class IperfClient(object):
       No new exceptions generated here.
     """
     if self.child_pid:
-      self.data = self.host.Communicate(self.child_pid, echo_error=True,
-                                        kill=(not self.length),
-                                        kill_string=IperfClient.KILL_STRING)
+      converged = self.convergence and self.convergence.converged
+      data = self.host.Communicate(self.child_pid, echo_error=True,
+                                   kill=(not self.length or converged),
+                                   kill_string=self.kill_string)
+      if self.watched:
+        self.watched.append(data or '')
+        data = '\n'.join(self.watched).strip()
+        self.watched = list()
+      self.data = data
       self.child_pid = None
 
-  def Restart(self, length=None, rate=None, window=None, blocking_call=False):
+  def StartAdaptive(self, max_length, width=0.05, confidence=0.95,
+                    min_samples=5, rate=None, window=None, blocking_call=True,
+                    parallel=None):
+    """Start a iperf client that stops once its throughput has converged.
+
+    The client is started with a report interval (the class interval or
+    ADAPTIVE_INTERVAL) and max_length as its length.  Each interval report is
+    fed to a stats.Convergence and the client is stopped as soon as the
+    confidence interval of the mean throughput is no wider than width times the
+    mean, or when iperf reaches max_length on its own.  With parallel streams
+    only the aggregate (SUM) reports are used.
+
+    If blocking_call is False the client is only started and it is up to the
+    caller to call Watch() until it returns False and then Stop().
+
+    Args:
+      max_length: never generate traffic for longer than this many seconds.
+      width: target relative width of the confidence interval.
+      confidence: confidence level for the interval (see stats.T_TABLE).
+      min_samples: never stop with fewer interval reports than this.
+      rate: If set use UDP with a rate i.e. 10M 100K 1G.
+      window: If set use TCP with a window size in Bytes.
+      blocking_call: should we wait for the iperf client to finish?
+      parallel: If set run this many parallel streams.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    assert max_length
+    self.convergence = stats.Convergence(width, confidence, min_samples)
+    self.watched = list()
+    self.__watch_seen = set()
+    self.Start(max_length, rate, window, blocking_call=False,
+               parallel=parallel,
+               interval=IperfClient.interval or IperfClient.ADAPTIVE_INTERVAL)
+    if blocking_call:
+      while self.Watch():
+        pass
+      self.Stop()
+
+  def Watch(self):
+    """Reads the next line from an adaptive client and checks for convergence.
+
+    Lines that are read are kept so that they still end up in self.data once
+    the client is stopped.  Only interval reports count towards convergence,
+    the final report that iperf prints for the whole run is skipped.
+
+    Returns:
+      True while the client is still running and has not converged, False once
+      it has converged or has finished on its own.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    assert self.convergence
+    if not self.child_pid or self.convergence.converged:
+      return False
+    line = self.host.ReadLine(self.child_pid)
+    if line is None:
+      return False
+    self.watched.append(line)
+    record = IperfResults.ParseLine(line)
+    if record is None:
+      return True
+    if bool(self.parallel and self.parallel > 1) != (record.stream == 'SUM'):
+      return True
+    if record.start == 0.0 and record.stream in self.__watch_seen:
+      return True
+    self.__watch_seen.add(record.stream)
+    return not self.convergence.Add(record.bandwidth)
+
+  def Restart(self, length=None, rate=None, window=None, blocking_call=False,
+              parallel=None, dual=False, tradeoff=False):
     """Convenience method for stopping and starting an IperfClient instance.
 
     Args:
@@ -321,13 +474,16 @@ class IperfClient(object):
       rate: If set use UDP with a rate in Mbps.
       window: If set use TCP with a window size in Bytes.
       blocking_call: should we wait for the iperf client to finish?
+      parallel: If set run this many parallel streams.
+      dual: should the server send back at the same time?
+      tradeoff: should the server send back after the client is done?
 
     Raises:
       No exceptions handled here.
       No new exceptions generated here.
     """
     self.Stop()
-    self.Start(length, rate, window, blocking_call)
+    self.Start(length, rate, window, blocking_call, parallel, dual, tradeoff)
 
   def Results(self):
     """Returns the IperfClient output.
@@ -343,10 +499,303 @@ class IperfClient(object):
       No new exceptions generated here.
     """
     return self.data
+
+  def ParsedResults(self):
+    """Returns the IperfClient output parsed into an IperfResults.
+
+    If the client was started with StartAdaptive the convergence statistics
+    are attached to the results.
+
+    Returns:
+      IperfResults: the parsed output or None if there is no output yet.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if self.data is None:
+      return None
+    summary = None
+    if self.convergence:
+      summary = self.convergence.Summary()
+    return IperfResults(self.data, convergence=summary)
 #END CLASS IperfClient
 
 
-# TODO(gavaletz): class IperfResults(object):
+class IperfRecord(collections.namedtuple('IperfRecord', ['stream', 'start',
+                                                         'end', 'size',
+                                                         'bandwidth', 'jitter',
+                                                         'lost', 'total'])):
+  """Class to simplify working with iperf reports.
+
+  This works like a struct in C/C++.  See named tuple for more information.
+  http://docs.python.org/library/collections.html#collections.namedtuple
+
+  Attributes:
+    stream: iperf stream id (int) or 'SUM' for aggregate reports
+    start: start of the reporting interval in seconds (float)
+    end: end of the reporting interval in seconds (float)
+    size: data transferred in Bytes (int)
+    bandwidth: throughput in Mbps (float)
+    jitter: UDP jitter in ms (float or None)
+    lost: UDP datagrams lost (int or None)
+    total: UDP datagrams sent (int or None)
+  """
+  pass
+#END CLASS IperfRecord
+
+
+class IperfResults(object):
+  """Class to simplify working with iperf output.
+
+  Takes the text that iperf prints and turns the bandwidth reports into
+  IperfRecords.  For every stream iperf prints the interval reports (if an
+  interval was requested) followed by a report covering the whole run, which
+  is kept separately as the summary for that stream.  A UDP client also prints
+  the report it got back from the server, and as that one carries the jitter
+  and loss it becomes the summary.
+
+  Streams whose local port is the iperf listening port carry data towards this
+  end (a server, or a client in dual or tradeoff mode) and all others carry
+  data away from it.  The aggregate (SUM) reports that iperf prints for
+  parallel streams are kept under the 'SUM' stream.
+
+  Attributes:
+    PORT: the default iperf listening port.
+    BYTE_UNITS: multipliers for the iperf Byte units.
+    BIT_UNITS: multipliers (to Mbps) for the iperf bits/sec units.
+  """
+
+  PORT = 5001
+
+  BYTE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+  BIT_UNITS = {'': 1e-6, 'K': 1e-3, 'M': 1.0, 'G': 1e3}
+  __REPORT = re.compile(r'^\[\s*(\d+|SUM)\]\s+([\d.]+)\s*-\s*([\d.]+)\s+sec\s+'
+                        r'([\d.]+)\s+([KMG]?)Bytes\s+([\d.]+)\s+([KMG]?)bits/sec'
+                        r'(?:\s+([\d.]+)\s+ms\s+(\d+)/\s*(\d+))?')
+  __CONNECT = re.compile(r'^\[\s*(\d+)\]\s+local\s+(\S+)\s+port\s+(\d+)\s+'
+                         r'connected\s+with\s+(\S+)\s+port\s+(\d+)')
+
+  def __init__(self, data, convergence=None, port=PORT):
+    """Inits IperfResults with some iperf output.
+
+    Args:
+      data: a string with the output from running iperf.
+      convergence: a stats.ConvergenceSummary if the run was adaptive.
+      port: the iperf listening port.
+
+    Returns:
+      IperfResults: an instance of the IperfResults class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    self.data = data
+    self.convergence = convergence
+    self.port = port
+    self.records = list()
+    self.connections = dict()
+    self.summaries = dict()
+    self.__Parse()
+
+  @staticmethod
+  def ParseLine(line):
+    """Parses a single bandwidth report.
+
+    Args:
+      line: one line of iperf output.
+
+    Returns:
+      IperfRecord: or None if the line is not a bandwidth report.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    m = IperfResults.__REPORT.match(line.strip())
+    if not m:
+      return None
+    if m.group(1) == 'SUM':
+      stream = 'SUM'
+    else:
+      stream = int(m.group(1))
+    if m.group(8) is None:
+      jitter = lost = total = None
+    else:
+      jitter = float(m.group(8))
+      lost = int(m.group(9))
+      total = int(m.group(10))
+    return IperfRecord(stream=stream,
+                       start=float(m.group(2)),
+                       end=float(m.group(3)),
+                       size=int(float(m.group(4)) *
+                                IperfResults.BYTE_UNITS[m.group(5)]),
+                       bandwidth=(float(m.group(6)) *
+                                  IperfResults.BIT_UNITS[m.group(7)]),
+                       jitter=jitter, lost=lost, total=total)
+
+  def __Parse(self):
+    """Parse lines of iperf output into records and summaries.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if not self.data:
+      return
+    by_stream = dict()
+    for line in self.data.splitlines():
+      m = IperfResults.__CONNECT.match(line.strip())
+      if m:
+        self.connections[int(m.group(1))] = (m.group(2), int(m.group(3)),
+                                             m.group(4), int(m.group(5)))
+        continue
+      record = IperfResults.ParseLine(line)
+      if record is None:
+        continue
+      by_stream.setdefault(record.stream, list()).append(record)
+    for stream in by_stream:
+      records = by_stream[stream]
+      # Reports for the whole run start over at zero, the UDP server report
+      # that a client prints comes after its own and is the one we keep.
+      split = len(records)
+      for i in range(1, len(records)):
+        if records[i].start == 0.0:
+          split = i
+          break
+      if len(records) == 1:
+        split = 0
+      self.records.extend(records[:split])
+      if records[split:]:
+        self.summaries[stream] = records[-1]
+
+  def Streams(self, direction=None):
+    """Returns the sorted list of stream ids (without SUM).
+
+    Args:
+      direction: None for every stream, 'send' for streams carrying data away
+        from this end or 'recv' for streams carrying data towards it.
+
+    Returns:
+      list of stream ids.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    assert direction in (None, 'send', 'recv')
+    streams = set([x.stream for x in self.records])
+    streams.update(self.summaries)
+    streams.update(self.connections)
+    streams.discard('SUM')
+    if direction is not None:
+      streams = [x for x in streams if self.Direction(x) == direction]
+    return sorted(streams)
+
+  def Direction(self, stream):
+    """Returns 'recv' if stream carries data towards this end else 'send'."""
+    if stream in self.connections and self.connections[stream][1] == self.port:
+      return 'recv'
+    return 'send'
+
+  def Pairs(self, other):
+    """Matches our streams with the other end of each connection.
+
+    Args:
+      other: IperfResults from the other end (i.e. the server for a client).
+
+    Returns:
+      dict mapping our stream ids to the stream ids in other.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    theirs = dict()
+    for stream, conn in other.connections.items():
+      theirs[conn] = stream
+    pairs = dict()
+    for stream, conn in self.connections.items():
+      mirror = (conn[2], conn[3], conn[0], conn[1])
+      if mirror in theirs:
+        pairs[stream] = theirs[mirror]
+    return pairs
+
+  def Subset(self, streams):
+    """Returns a new IperfResults with only the given streams.
+
+    Args:
+      streams: the stream ids to keep (SUM reports are dropped).
+
+    Returns:
+      IperfResults: sharing the records of this one.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    streams = set(streams)
+    subset = IperfResults(None, self.convergence, self.port)
+    subset.data = self.data
+    subset.records = [x for x in self.records if x.stream in streams]
+    for stream in streams:
+      if stream in self.connections:
+        subset.connections[stream] = self.connections[stream]
+      if stream in self.summaries:
+        subset.summaries[stream] = self.summaries[stream]
+    return subset
+
+  def Intervals(self, stream=None):
+    """Returns the interval reports for a stream.
+
+    Args:
+      stream: a stream id, 'SUM', or None for the aggregate (the SUM reports if
+        iperf printed any, otherwise every stream).
+
+    Returns:
+      list of IperfRecords in the order iperf reported them.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if stream is None:
+      if 'SUM' in self.summaries:
+        stream = 'SUM'
+      else:
+        return [x for x in self.records if x.stream != 'SUM']
+    return [x for x in self.records if x.stream == stream]
+
+  def Throughput(self, direction=None, stream=None):
+    """Returns the throughput over the whole run in Mbps.
+
+    Args:
+      direction: None, 'send' or 'recv' (see Streams).
+      stream: If set only report this stream.
+
+    Returns:
+      bandwidth: for a single stream its summary.  Otherwise the SUM report if
+        iperf printed one (and all of the streams go the same way), or else
+        the sum of the per stream summaries.  None if there are no summaries.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if stream is not None:
+      if stream in self.summaries:
+        return self.summaries[stream].bandwidth
+      return None
+    directions = set([self.Direction(x) for x in self.Streams()])
+    if direction is None and 'SUM' in self.summaries and len(directions) < 2:
+      return self.summaries['SUM'].bandwidth
+    summaries = [self.summaries[x] for x in self.Streams(direction)
+                 if x in self.summaries]
+    if not summaries:
+      return None
+    return sum([x.bandwidth for x in summaries])
+#END CLASS IperfResults
 
 
 class IperfSet(object):
@@ -360,13 +809,16 @@ class IperfSet(object):
   - a list of sources and list of target destinations and destinations
   - a list of sources and list of target destinations and a single destination
 
+  Every client and server in the set uses the same traffic generator, which is
+  iperf unless another backend (see BACKENDS) is asked for.
+
   There is some complexity in starting a large set of clients and servers and
   stopping them.  This is especially complex when they may need to start as
   forked processes and then you need to wait on them all to finish before
   proceeding.
   """
 
-  def __init__(self, target_src, target_dst, dst):
+  def __init__(self, target_src, target_dst, dst, backend='iperf'):
     """Inits an IperfSet.
 
     If you use a list for dst then you must use a list of equal length for
@@ -376,6 +828,7 @@ class IperfSet(object):
       target_src: A single host or list of hosts.
       target_dst: A single host or list of hosts (1:1 with target_src).
       dst: A single address/hostname or a list (1:1 with target_dst)
+      backend: which traffic generator to run (see BACKENDS).
 
     Returns:
       IperfSet: an instance of the IperfSet class.
@@ -390,23 +843,25 @@ class IperfSet(object):
       if isinstance(dst, list):
         assert len(target_src) == len(dst)
         for i in range(0, len(dst)):
-          self.client_list.append(IperfClient(target_src[i], dst[i]))
+          self.client_list.append(IperfClient(target_src[i], dst[i],
+                                              backend))
       else:
         for src in target_src:
-          self.client_list.append(IperfClient(src, dst))
+          self.client_list.append(IperfClient(src, dst, backend))
       if isinstance(target_dst, list):
         assert isinstance(dst, list)
         assert len(target_src) == len(target_dst)
         assert len(target_src) == len(dst)
         for dst in target_dst:
-          self.server_list.append(IperfServer(dst))
+          self.server_list.append(IperfServer(dst, backend))
       else:
-        self.server_list.append(IperfServer(target_dst))
+        self.server_list.append(IperfServer(target_dst, backend))
     else:
       assert not isinstance(target_dst, list)
       assert not isinstance(dst, list)
-      self.client_list.append(IperfClient(target_src, dst))
-      self.server_list.append(IperfServer(target_dst))
+      self.client_list.append(IperfClient(target_src, dst, backend))
+      self.server_list.append(IperfServer(target_dst, backend))
+    self.samplers = dict()
 
   def __del__(self):
     """Tries to make sure that we clean up after ourselves.
@@ -423,7 +878,9 @@ class IperfSet(object):
     for server in self.server_list:
       del server
 
-  def Start(self, length=None, rate=None, window=None, blocking_call=True):
+  def Start(self, length=None, rate=None, window=None, blocking_call=True,
+            parallel=None, dual=False, tradeoff=False, sample_interval=None,
+            interval=None):
     """Starts the set of iperf client(s) and server(s).
 
     See IperfClient.Start() for more details.  The blocking_call argument is
@@ -431,11 +888,20 @@ class IperfSet(object):
     IperfClient objects (that would limit us to starting only one) but they are
     all started and then this call will block until they are all finished.
 
+    With sample_interval every host in the set is sampled (see
+    netlib.shell.sampler) from just before the servers start until Stop, and
+    SampledResults() lines the samples up with the interval reports.
+
     Args:
       length: If set only generte traffic for this many seconds.
       rate: If set use UDP with a rate in Mbps.
       window: If set use TCP with a window size in Bytes.
       blocking_call: should we wait for all the iperf clients to finish?
+      parallel: If set every client runs this many parallel streams.
+      dual: should the servers send back at the same time?
+      tradeoff: should the servers send back after the clients are done?
+      sample_interval: If set sample the hosts this often in seconds.
+      interval: If set the clients report every this many seconds.
 
     Raises:
       No exceptions handled here.
@@ -448,10 +914,14 @@ class IperfSet(object):
     else:
       udp = False
 
+    if sample_interval:
+      self.StartSamplers(sample_interval)
     for server in self.server_list:
       server.Start(udp)
     for client in self.client_list:
-      client.Start(length, rate, window, blocking_call=False)
+      client.Start(length, rate, window, blocking_call=False,
+                   parallel=parallel, dual=dual, tradeoff=tradeoff,
+                   interval=interval)
 
     if length and blocking_call:
       self.Stop(wait_for_client=True)
@@ -480,6 +950,69 @@ class IperfSet(object):
       client.Stop()
     for server in self.server_list:
       server.Stop()
+    for resource_sampler in self.samplers.values():
+      resource_sampler.Stop()
+
+  def StartAdaptive(self, max_length, width=0.05, confidence=0.95,
+                    min_samples=5, rate=None, window=None, parallel=None,
+                    sample_interval=None):
+    """Starts the set and stops it once every client has converged.
+
+    See IperfClient.StartAdaptive() for more details.  All of the clients are
+    started together and watched in turn.  Clients that converge early keep
+    running (so the competing load stays the same) until every client has
+    either converged or reached max_length, then the whole set is stopped.
+
+    Args:
+      max_length: never generate traffic for longer than this many seconds.
+      width: target relative width of the confidence interval.
+      confidence: confidence level for the interval (see stats.T_TABLE).
+      min_samples: never stop with fewer interval reports than this.
+      rate: If set use UDP with a rate in Mbps.
+      window: If set use TCP with a window size in Bytes.
+      parallel: If set every client runs this many parallel streams.
+      sample_interval: If set sample the hosts this often in seconds.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    udp = bool(rate and not window)
+    if sample_interval:
+      self.StartSamplers(sample_interval)
+    for server in self.server_list:
+      server.Start(udp)
+    for client in self.client_list:
+      client.StartAdaptive(max_length, width, confidence, min_samples, rate,
+                           window, blocking_call=False, parallel=parallel)
+    active = list(self.client_list)
+    while active:
+      for client in list(active):
+        if not client.Watch():
+          active.remove(client)
+    self.Stop()
+
+  def StartSamplers(self, interval):
+    """Starts a ResourceSampler on every client and server host.
+
+    Hosts are keyed by hostname so a host that runs several clients and
+    servers is only sampled once.  Any samples from an earlier run are
+    thrown away.
+
+    Args:
+      interval: seconds between samples.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    self.samplers = dict()
+    for obj in self.client_list + self.server_list:
+      if obj.host.host not in self.samplers:
+        self.samplers[obj.host.host] = sampler.ResourceSampler(obj.host,
+                                                               interval)
+    for resource_sampler in self.samplers.values():
+      resource_sampler.Start()
 
   def Restart(self, length=None, rate=None, window=None):
     """Convenience method for stopping and starting an IperfSet instance.
@@ -518,10 +1051,90 @@ class IperfSet(object):
     for server in self.server_list:
       server_data_list.append(server.data)
     return (server_data_list, client_data_list)
+
+  def ParsedResults(self):
+    """Returns the IperfClient output parsed into IperfResults.
+
+    See IperfClient.ParsedResults() for more details.
+
+    Returns:
+      list of IperfResults (1:1 with the clients).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    return [client.ParsedResults() for client in self.client_list]
+
+  def ServerResults(self):
+    """Returns the server side of every client's streams.
+
+    A server sees the streams of every client that connected to it (and with
+    parallel streams, more than one per client) along with the streams it
+    sends back in dual or tradeoff mode.  Each connection is matched with the
+    client end of it so the server output can be split up by client.
+
+    Returns:
+      list of IperfResults (1:1 with the clients), None where no server saw
+      any of the client's connections.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    server_results = [IperfResults(x.data) for x in self.server_list if x.data]
+    results = list()
+    for client_results in self.ParsedResults():
+      match = None
+      if client_results:
+        for server_results_obj in server_results:
+          pairs = client_results.Pairs(server_results_obj)
+          if pairs:
+            match = server_results_obj.Subset(pairs.values())
+            break
+      results.append(match)
+    return results
+
+  def SampledResults(self):
+    """Returns the interval reports lined up with the host samples.
+
+    Every interval report of a client is matched with the resource usage of
+    the client host and its server host over the same period.  The periods
+    are taken from the time each client was started so the clocks of the
+    controller and the hosts need to be in sync.
+
+    Returns:
+      list (1:1 with the clients) of lists of (IperfRecord, usage) tuples where
+      usage maps a hostname to a sampler.ResourceUsage (or None).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    results = list()
+    for i, client in enumerate(self.client_list):
+      server = self.server_list[min(i, len(self.server_list) - 1)]
+      parsed = client.ParsedResults()
+      records = list()
+      if parsed is not None and client.start_time is not None:
+        records = parsed.Intervals()
+      aligned = dict()
+      for host in (client.host.host, server.host.host):
+        if host in self.samplers:
+          aligned[host] = self.samplers[host].Align(records, client.start_time)
+      pairs = list()
+      for j, record in enumerate(records):
+        usage = dict()
+        for host in aligned:
+          usage[host] = aligned[host][j]
+        pairs.append((record, usage))
+      results.append(pairs)
+    return results
 #END CLASS IperfSet
 
 
-def IperfTCP(target_src, target_dst, dst, length, window=None):
+def IperfTCP(target_src, target_dst, dst, length, window=None,
+             backend='iperf'):
   """Convenience method for starting a TCP IperfSet.
 
   See IperfSet for more details.
@@ -532,6 +1145,7 @@ def IperfTCP(target_src, target_dst, dst, length, window=None):
     dst: A single address/hostname or a list (1:1 with target_dst).
     length: Only generte traffic for this many seconds.
     window: If set use TCP with a window size in Bytes.
+    backend: which traffic generator to run (see BACKENDS).
 
   Returns:
     tuple:
@@ -542,12 +1156,13 @@ def IperfTCP(target_src, target_dst, dst, length, window=None):
     No exceptions handled here.
     No new exceptions generated here.
   """
-  iperf = IperfSet(target_src, target_dst, dst)
+  iperf = IperfSet(target_src, target_dst, dst, backend)
   iperf.Start(length, None, window)
   return iperf.Results()
 
 
-def IperfUDP(target_src, target_dst, dst, length, rate='100M'):
+def IperfUDP(target_src, target_dst, dst, length, rate='100M',
+             backend='iperf'):
   """Convenience method for starting a UDP IperfSet.
 
   See IperfSet for more details.
@@ -558,6 +1173,7 @@ def IperfUDP(target_src, target_dst, dst, length, rate='100M'):
     dst: A single address/hostname or a list (1:1 with target_dst).
     length: Only generte traffic for this many seconds.
     rate: If set use UDP with a rate in Mbps.
+    backend: which traffic generator to run (see BACKENDS).
 
   Returns:
     tuple:
@@ -568,6 +1184,144 @@ def IperfUDP(target_src, target_dst, dst, length, rate='100M'):
     No exceptions handled here.
     No new exceptions generated here.
   """
-  iperf = IperfSet(target_src, target_dst, dst)
+  iperf = IperfSet(target_src, target_dst, dst, backend)
   iperf.Start(length, rate, None)
   return iperf.Results()
+
+
+class IperfRatePoint(collections.namedtuple('IperfRatePoint', ['rate',
+                                                               'throughput',
+                                                               'loss',
+                                                               'jitter'])):
+  """Class to simplify working with the results of a UDP rate search.
+
+  This works like a struct in C/C++.  See named tuple for more information.
+  http://docs.python.org/library/collections.html#collections.namedtuple
+
+  Attributes:
+    rate: offered load in bits/sec (int)
+    throughput: throughput seen by the server in Mbps (float)
+    loss: datagrams lost in percent (float)
+    jitter: jitter in ms (float)
+  """
+  pass
+#END CLASS IperfRatePoint
+
+
+def IperfUDPRate(target_src, target_dst, dst, length, rate, backend='iperf'):
+  """Measures loss and jitter for a single UDP rate.
+
+  Args:
+    target_src: A single host.
+    target_dst: A single host.
+    dst: A single address/hostname.
+    length: Only generte traffic for this many seconds.
+    rate: UDP rate in bits/sec.
+    backend: which traffic generator to run (see BACKENDS).
+
+  Returns:
+    IperfRatePoint: or None if no server report came back.
+
+  Raises:
+    No exceptions handled here.
+    No new exceptions generated here.
+  """
+  iperf = IperfSet(target_src, target_dst, dst, backend)
+  iperf.Start(length, '%d' % rate, None)
+  results = iperf.ParsedResults()[0]
+  summary = None
+  if results:
+    for stream in results.Streams('send'):
+      if stream in results.summaries and results.summaries[stream].total:
+        summary = results.summaries[stream]
+  if summary is None:
+    server_results = iperf.ServerResults()[0]
+    if server_results:
+      for stream in server_results.Streams('recv'):
+        if server_results.summaries.get(stream):
+          summary = server_results.summaries[stream]
+  if summary is None or not summary.total:
+    logging.warn('%s -- no UDP report at %d bits/sec', dst, rate)
+    return None
+  return IperfRatePoint(rate=rate, throughput=summary.bandwidth,
+                        loss=100.0 * summary.lost / summary.total,
+                        jitter=summary.jitter)
+
+
+def IperfUDPMaxRate(target_src, target_dst, dst, loss=1.0, length=5,
+                    start='1M', max_rate='10G', precision=0.05, repeats=1,
+                    backend='iperf'):
+  """Finds the highest UDP rate a path sustains below a loss threshold.
+
+  Starting at start the rate is doubled until the loss goes over the threshold
+  (or halved until it does not), and then the highest passing and lowest
+  failing rates are narrowed down with a binary search until they are within
+  precision of each other.  Every rate is tried repeats times and passes if
+  the mean loss is at most loss percent.
+
+  Args:
+    target_src: A single host.
+    target_dst: A single host.
+    dst: A single address/hostname.
+    loss: the highest acceptable loss in percent.
+    length: generate traffic for this many seconds at every step.
+    start: the first rate to try (bits/sec or i.e. 10M 100K 1G).
+    max_rate: never try a rate higher than this.
+    precision: stop once (fail - pass) / fail is no more than this.
+    repeats: how many times to try each rate.
+    backend: which traffic generator to run (see BACKENDS).
+
+  Returns:
+    tuple:
+      rate: the highest passing rate in bits/sec (0 if none passed).
+      curve: list of IperfRatePoints for every run in the order they ran.
+
+  Raises:
+    No exceptions handled here.
+    No new exceptions generated here.
+  """
+  rate = trafgen.ParseSize(start, 1000)
+  max_rate = trafgen.ParseSize(max_rate, 1000)
+  min_rate = 1000
+  curve = list()
+
+  def Passes(rate):
+    points = list()
+    for _ in range(repeats):
+      point = IperfUDPRate(target_src, target_dst, dst, length, rate, backend)
+      if point:
+        points.append(point)
+    curve.extend(points)
+    if not points:
+      return False
+    return stats.Mean([x.loss for x in points]) <= loss
+
+  good = bad = None
+  if Passes(rate):
+    good = rate
+    while good < max_rate:
+      rate = min(good * 2, max_rate)
+      if not Passes(rate):
+        bad = rate
+        break
+      good = rate
+    if bad is None:
+      return (good, curve)
+  else:
+    bad = rate
+    while bad > min_rate:
+      rate = max(bad // 2, min_rate)
+      if Passes(rate):
+        good = rate
+        break
+      bad = rate
+    if good is None:
+      return (0, curve)
+
+  while float(bad - good) / bad > precision:
+    rate = (good + bad) // 2
+    if Passes(rate):
+      good = rate
+    else:
+      bad = rate
+  return (good, curve)
@@ -22,10 +22,13 @@ keep the objects under test happy.
 
 __author__ = 'gavaletz@google.com (Eric Gavaletz)'
 
+import re
 import unittest
 
 from netlib.net import iperf
 from netlib.shell import mock
+from netlib.shell import sampler
+from netlib.shell import sampler_test
 
 
 server_result = """------------------------------------------------------------
@@ -44,7 +47,75 @@ TCP window size: 16.0 KByte (default)
 [  3] local 192.168.31.59 port 41063 connected with 192.168.31.61 port 5001
 [  3] 0.0-10.0 sec  53.3 MBytes  44.7 Mbits/sec"""
 
+interval_result = """------------------------------------------------------------
+Client connecting to a.dst, TCP port 5001
+TCP window size: 16.0 KByte (default)
+------------------------------------------------------------
+[  3] local 192.168.31.59 port 41063 connected with 192.168.31.61 port 5001
+[  3]  0.0- 1.0 sec  5.62 MBytes  47.2 Mbits/sec
+[  3]  1.0- 2.0 sec  5.50 MBytes  46.1 Mbits/sec
+[  3]  2.0- 3.0 sec  5.62 MBytes  47.2 Mbits/sec
+[  3]  3.0- 4.0 sec  5.62 MBytes  47.2 Mbits/sec
+[  3]  4.0- 5.0 sec  5.50 MBytes  46.1 Mbits/sec
+[  3]  5.0- 6.0 sec  5.62 MBytes  47.2 Mbits/sec
+[  3]  0.0- 6.0 sec  33.5 MBytes  46.8 Mbits/sec"""
+
+noisy_result = """------------------------------------------------------------
+Client connecting to b.dst, TCP port 5001
+TCP window size: 16.0 KByte (default)
+------------------------------------------------------------
+[  3] local 192.168.31.60 port 33910 connected with 192.168.31.61 port 5001
+[  3]  0.0- 1.0 sec  1.00 MBytes  8.39 Mbits/sec
+[  3]  1.0- 2.0 sec  9.00 MBytes  75.5 Mbits/sec
+[  3]  2.0- 3.0 sec  2.00 MBytes  16.8 Mbits/sec
+[  3]  0.0- 3.0 sec  12.0 MBytes  33.6 Mbits/sec"""
+
+udp_server_result = """------------------------------------------------------------
+Server listening on UDP port 5001
+Receiving 1470 byte datagrams
+UDP buffer size:   108 KByte (default)
+------------------------------------------------------------
+[  3] local 192.168.31.61 port 5001 connected with 192.168.31.59 port 39211
+[  3]  0.0-10.0 sec  11.9 MBytes  10.0 Mbits/sec   0.036 ms    2/ 8505 (0.024%)"""
+
+dual_client_result = """------------------------------------------------------------
+Server listening on TCP port 5001
+TCP window size: 85.3 KByte (default)
+------------------------------------------------------------
+------------------------------------------------------------
+Client connecting to a.dst, TCP port 5001
+TCP window size: 16.0 KByte (default)
+------------------------------------------------------------
+[  4] local 192.168.31.59 port 41063 connected with 192.168.31.61 port 5001
+[  3] local 192.168.31.59 port 41064 connected with 192.168.31.61 port 5001
+[  5] local 192.168.31.59 port 5001 connected with 192.168.31.61 port 51000
+[  6] local 192.168.31.59 port 5001 connected with 192.168.31.61 port 51001
+[  4]  0.0-10.0 sec  26.6 MBytes  22.3 Mbits/sec
+[  3]  0.0-10.0 sec  26.8 MBytes  22.5 Mbits/sec
+[SUM]  0.0-10.0 sec  53.4 MBytes  44.8 Mbits/sec
+[  5]  0.0-10.0 sec  30.0 MBytes  25.2 Mbits/sec
+[  6]  0.0-10.0 sec  29.0 MBytes  24.3 Mbits/sec
+[SUM]  0.0-10.0 sec  59.0 MBytes  49.5 Mbits/sec"""
+
+dual_server_result = """------------------------------------------------------------
+Server listening on TCP port 5001
+TCP window size: 85.3 KByte (default)
+------------------------------------------------------------
+[  4] local 192.168.31.61 port 5001 connected with 192.168.31.59 port 41063
+[  5] local 192.168.31.61 port 5001 connected with 192.168.31.59 port 41064
+[  6] local 192.168.31.61 port 51000 connected with 192.168.31.59 port 5001
+[  7] local 192.168.31.61 port 51001 connected with 192.168.31.59 port 5001
+[  8] local 192.168.31.61 port 5001 connected with 192.168.31.60 port 33910
+[  4]  0.0-10.0 sec  26.5 MBytes  22.2 Mbits/sec
+[  5]  0.0-10.0 sec  26.7 MBytes  22.4 Mbits/sec
+[  6]  0.0-10.0 sec  30.0 MBytes  25.2 Mbits/sec
+[  7]  0.0-10.0 sec  29.0 MBytes  24.3 Mbits/sec
+[  8]  0.0-10.0 sec  53.3 MBytes  44.7 Mbits/sec"""
+
 mock.MockHost.results['iperf -s'] = server_result
+mock.MockHost.results['iperf -c a.dst -t 10 -P 2 -d'] = dual_client_result
+mock.MockHost.results['iperf -c a.dst -t 30 -i 1'] = interval_result
+mock.MockHost.results['iperf -c b.dst -t 30 -i 1'] = noisy_result
 mock.MockHost.results['iperf -c a.dst -t 10'] = client_result
 mock.MockHost.results['iperf -c b.dst -t 10'] = client_result
 mock.MockHost.results['iperf -c c.dst -t 10'] = client_result
@@ -181,6 +252,19 @@ class IperfClientTest(unittest.TestCase):
     self.assertNotIn(' -i', cmd)
     self.assertGreater(self.ipc_obj.child_pid, 0)
 
+  def testStartParallel(self):
+    """Make sure we are setting the parallel and bidirectional flags."""
+    self.ipc_obj.Start(length=10, parallel=4, dual=True)
+    cmd = self.fake_host.process_dict[1].cmd
+    self.assertIn(' -P %d' % 4, cmd)
+    self.assertIn(' -d', cmd)
+    self.assertNotIn(' -r', cmd)
+    self.ipc_obj.Restart(length=10, tradeoff=True)
+    cmd = self.fake_host.process_dict[2].cmd
+    self.assertIn(' -r', cmd)
+    self.assertRaises(AssertionError, self.ipc_obj.Start, dual=True,
+                      tradeoff=True)
+
   def testStartPktInterval(self):
     """Make sure we are setting the interval flag."""
     self.assertIsNone(self.ipc_obj.child_pid)
@@ -205,9 +289,113 @@ class IperfClientTest(unittest.TestCase):
     self.ipc_obj.Start(length=10, blocking_call=True)
     self.ipc_obj.Results()
     self.assertIsNotNone(self.ipc_obj.data)
+
+  def testStartAdaptive(self):
+    """A steady client should be stopped once it converges."""
+    self.ipc_obj.StartAdaptive(30, width=0.05, min_samples=5)
+    cmd = self.fake_host.process_dict[1].cmd
+    self.assertIn(' -i %d' % iperf.IperfClient.ADAPTIVE_INTERVAL, cmd)
+    self.assertIn(' -t %d' % 30, cmd)
+    self.assertIsNone(self.ipc_obj.child_pid)
+    self.assertIn('4.0- 5.0 sec', self.ipc_obj.data)
+    self.assertIn('5.0- 6.0 sec', self.ipc_obj.data)
+    results = self.ipc_obj.ParsedResults()
+    self.assertTrue(results.convergence.converged)
+    self.assertEqual(results.convergence.samples, 5)
+    self.assertAlmostEqual(results.convergence.mean, 46.76, places=2)
+
+  def testStartAdaptiveTimeout(self):
+    """A noisy client runs until iperf gives up on its own."""
+    self.ipc_obj = iperf.IperfClient(self.fake_host, 'b.dst')
+    self.ipc_obj.StartAdaptive(30, width=0.05, min_samples=2)
+    results = self.ipc_obj.ParsedResults()
+    self.assertFalse(results.convergence.converged)
+    self.assertEqual(results.convergence.samples, 3)
+    self.assertAlmostEqual(results.Throughput(), 33.6)
+
+  def testStartAgain(self):
+    """Starting the same client again does not repeat any flags."""
+    self.ipc_obj.StartAdaptive(30, width=0.05, min_samples=5)
+    self.ipc_obj.StartAdaptive(30, width=0.05, min_samples=5)
+    self.ipc_obj.Restart(10, parallel=2, dual=True, blocking_call=True)
+    cmds = [x.cmd for x in self.fake_host.process_dict.values()]
+    self.assertEqual(cmds, ['iperf -c a.dst -t 30 -i 1',
+                            'iperf -c a.dst -t 30 -i 1',
+                            'iperf -c a.dst -t 10 -P 2 -d'])
 #END CLASS IperfClientTest
 
 
+class IperfResultsTest(unittest.TestCase):
+  """Test for IperfResults."""
+
+  def testParseLine(self):
+    """Make sure the units are handled."""
+    record = iperf.IperfResults.ParseLine(
+        '[  3]  0.0-10.0 sec  53.3 MBytes  44.7 Mbits/sec')
+    self.assertEqual(record.stream, 3)
+    self.assertEqual(record.start, 0.0)
+    self.assertEqual(record.end, 10.0)
+    self.assertEqual(record.size, int(53.3 * 1024 * 1024))
+    self.assertAlmostEqual(record.bandwidth, 44.7)
+    self.assertIsNone(record.jitter)
+    record = iperf.IperfResults.ParseLine(
+        '[SUM]  0.0- 1.0 sec   118 KBytes   967 Kbits/sec')
+    self.assertEqual(record.stream, 'SUM')
+    self.assertAlmostEqual(record.bandwidth, 0.967)
+    self.assertIsNone(iperf.IperfResults.ParseLine('TCP window size: 16.0'))
+
+  def testIntervals(self):
+    """Interval reports are split from the report for the whole run."""
+    results = iperf.IperfResults(interval_result)
+    self.assertEqual(results.Streams(), [3])
+    self.assertEqual(len(results.Intervals()), 6)
+    self.assertEqual(len(results.Intervals(3)), 6)
+    self.assertAlmostEqual(results.Throughput(), 46.8)
+    self.assertEqual(results.connections[3],
+                     ('192.168.31.59', 41063, '192.168.31.61', 5001))
+
+  def testServer(self):
+    """A server sees one stream per client."""
+    results = iperf.IperfResults(server_result)
+    self.assertEqual(results.Streams(), [4, 5])
+    self.assertEqual(len(results.Intervals()), 0)
+    self.assertAlmostEqual(results.Throughput(), 49.9 + 44.7)
+
+  def testDual(self):
+    """Sent and received streams are accounted for separately."""
+    results = iperf.IperfResults(dual_client_result)
+    self.assertEqual(results.Streams(), [3, 4, 5, 6])
+    self.assertEqual(results.Streams('send'), [3, 4])
+    self.assertEqual(results.Streams('recv'), [5, 6])
+    self.assertAlmostEqual(results.Throughput('send'), 22.3 + 22.5)
+    self.assertAlmostEqual(results.Throughput('recv'), 25.2 + 24.3)
+    self.assertAlmostEqual(results.Throughput(), 22.3 + 22.5 + 25.2 + 24.3)
+    self.assertAlmostEqual(results.Throughput(stream=4), 22.3)
+
+  def testSum(self):
+    """Parallel streams in one direction report the SUM line."""
+    results = iperf.IperfResults(dual_client_result).Subset([3, 4])
+    results.summaries['SUM'] = iperf.IperfResults.ParseLine(
+        '[SUM]  0.0-10.0 sec  53.4 MBytes  44.8 Mbits/sec')
+    self.assertAlmostEqual(results.Throughput(), 44.8)
+
+  def testPairs(self):
+    """Both ends of every connection are matched."""
+    client = iperf.IperfResults(dual_client_result)
+    server = iperf.IperfResults(dual_server_result)
+    self.assertEqual(client.Pairs(server), {4: 4, 3: 5, 5: 6, 6: 7})
+    self.assertEqual(server.Streams('recv'), [4, 5, 8])
+
+  def testUDP(self):
+    """UDP reports carry jitter and loss."""
+    results = iperf.IperfResults(udp_server_result)
+    summary = results.summaries[3]
+    self.assertAlmostEqual(summary.jitter, 0.036)
+    self.assertEqual(summary.lost, 2)
+    self.assertEqual(summary.total, 8505)
+#END CLASS IperfResultsTest
+
+
 class IperfSetTest(unittest.TestCase):
   """Test for IperfClient."""
   target_src = ['f.remote_host.com', 'e.remote_host.com', 'f.remote_host.com']
@@ -341,8 +529,157 @@ class IperfSetTest(unittest.TestCase):
       self.assertIn('Server listening', results[0][i])
     for i in range(0, len(self.fake_host_src)):
       self.assertIn('Client connecting', results[1][i])
+
+  def testBackend(self):
+    """The python backend runs netlib.net.trafgen everywhere."""
+    self.ips_obj = iperf.IperfSet(self.fake_host_src,
+                                  self.fake_host_dst,
+                                  IperfSetTest.dst,
+                                  backend='python')
+    self.ips_obj.Start(rate='10M', blocking_call=False)
+    for server in self.ips_obj.server_list:
+      cmd = server.host.process_dict[server.child_pid].cmd
+      self.assertEqual(cmd, 'python -m netlib.net.trafgen -s -u')
+    for client in self.ips_obj.client_list:
+      cmd = client.host.process_dict[client.child_pid].cmd
+      self.assertIn('python -m netlib.net.trafgen -u -c ', cmd)
+      self.assertEqual(client.kill_string, iperf.BACKENDS['python'][1])
+
+  def testServerResults(self):
+    """Server side streams are split up by the client they belong to."""
+    mock.MockHost.results['iperf -s'] = dual_server_result
+    try:
+      self.ips_obj = iperf.IperfSet(self.fake_host_src[:2],
+                                    self.fake_host_dst[0],
+                                    IperfSetTest.dst[0])
+      self.ips_obj.Start(length=10, parallel=2, dual=True)
+      results = self.ips_obj.ServerResults()
+    finally:
+      mock.MockHost.results['iperf -s'] = server_result
+    self.assertEqual(len(results), 2)
+    self.assertEqual(results[0].Streams('recv'), [4, 5])
+    self.assertEqual(results[0].Streams('send'), [6, 7])
+    self.assertAlmostEqual(results[0].Throughput('recv'), 22.2 + 22.4)
+    self.assertAlmostEqual(results[0].Throughput('send'), 25.2 + 24.3)
+
+  def testStartAdaptive(self):
+    """Every client is watched until it converges or gives up."""
+    self.ips_obj = iperf.IperfSet(self.fake_host_src[:2],
+                                  self.fake_host_dst[:2],
+                                  IperfSetTest.dst[:2])
+    self.ips_obj.StartAdaptive(30, width=0.05, min_samples=5)
+    for server in self.ips_obj.server_list:
+      self.assertIsNone(server.child_pid)
+    results = self.ips_obj.ParsedResults()
+    self.assertEqual(len(results), 2)
+    self.assertTrue(results[0].convergence.converged)
+    self.assertFalse(results[1].convergence.converged)
+    self.assertEqual(results[1].convergence.samples, 3)
+
+  def testSampledResults(self):
+    """Host samples are lined up with the interval reports."""
+    self.ips_obj = iperf.IperfSet(self.fake_host_src[0],
+                                  self.fake_host_dst[0],
+                                  IperfSetTest.dst[0])
+    command = sampler.ResourceSampler(self.fake_host_src[0], 0.5).Command()
+    mock.MockHost.results[command] = sampler_test.sample_result
+    self.ips_obj.StartAdaptive(30, width=0.05, min_samples=5,
+                               sample_interval=0.5)
+    self.assertEqual(sorted(self.ips_obj.samplers),
+                     ['a.remote_host.com', 'f.remote_host.com'])
+    for resource_sampler in self.ips_obj.samplers.values():
+      self.assertIsNone(resource_sampler.child_pid)
+      self.assertEqual(len(resource_sampler.samples), 3)
+    self.ips_obj.client_list[0].start_time = 1000.0
+    results = self.ips_obj.SampledResults()
+    self.assertEqual(len(results), 1)
+    self.assertEqual(len(results[0]), 6)
+    record, usage = results[0][1]
+    self.assertEqual((record.start, record.end), (1.0, 2.0))
+    self.assertAlmostEqual(usage['f.remote_host.com'].cpu['cpu'], 1.0)
+    self.assertAlmostEqual(usage['a.remote_host.com'].net['eth0'][0], 10.0)
+    record, usage = results[0][2]
+    self.assertIsNone(usage['f.remote_host.com'])
 #END CLASS IperfSetTest
 
 
+class FixedPathHost(mock.MockHost):
+  """MockHost whose UDP clients see a path with a fixed capacity.
+
+  Attributes:
+    CAPACITY: the capacity of the path in bits/sec.
+  """
+
+  CAPACITY = 37000000
+  UDP_CLIENT = re.compile(r'-u -c (\S+) -t (\d+) -b (\d+)')
+
+  def Run(self, cmd, echo_error=True, fork=False):
+    """Makes up a client report with the loss the offered rate would see."""
+    m = FixedPathHost.UDP_CLIENT.search(cmd)
+    if m:
+      rate = int(m.group(3))
+      total = rate * int(m.group(2)) // (1470 * 8)
+      lost = int(total * max(0.0, 1.0 - float(FixedPathHost.CAPACITY) / rate))
+      mock.MockHost.results[cmd] = '\n'.join([
+          '[  3] local 10.0.0.1 port 40000 connected with 10.0.0.2 port 5001',
+          '[  3] Server Report:',
+          '[  3]  0.0- 5.0 sec  1.00 MBytes  %.1f Mbits/sec  0.050 ms %4d/%5d'
+          % (min(rate, FixedPathHost.CAPACITY) / 1e6, lost, total)])
+    return mock.MockHost.Run(self, cmd, echo_error, fork)
+#END CLASS FixedPathHost
+
+
+class IperfUDPMaxRateTest(unittest.TestCase):
+  """Test for IperfUDPMaxRate."""
+
+  def setUp(self):
+    """Create mock Host objects."""
+    self.src = FixedPathHost('a.remote_host.com')
+    self.dst = FixedPathHost('b.remote_host.com')
+
+  def testRateDependentLoss(self):
+    """The fake path drops everything over its capacity."""
+    point = iperf.IperfUDPRate(self.src, self.dst, 'b.dst', 5, 74000000)
+    self.assertEqual(point.rate, 74000000)
+    self.assertAlmostEqual(point.loss, 50.0, delta=0.1)
+    self.assertAlmostEqual(point.jitter, 0.05)
+    point = iperf.IperfUDPRate(self.src, self.dst, 'b.dst', 5, 10000000)
+    self.assertEqual(point.loss, 0.0)
+
+  def testExactRate(self):
+    """The rate is offered in bits/sec exactly as it is recorded."""
+    point = iperf.IperfUDPRate(self.src, self.dst, 'b.dst', 5, 12345678)
+    self.assertEqual(point.rate, 12345678)
+    cmds = [x.cmd for x in self.src.process_dict.values()]
+    self.assertTrue([x for x in cmds if '-b 12345678 ' in x + ' '])
+
+  def testRampUp(self):
+    """Ramp up from below the capacity and then narrow it down."""
+    rate, curve = iperf.IperfUDPMaxRate(self.src, self.dst, 'b.dst', loss=1.0,
+                                        start='1M', precision=0.01)
+    self.assertLessEqual(rate, FixedPathHost.CAPACITY / 0.99)
+    self.assertGreaterEqual(rate, FixedPathHost.CAPACITY * 0.99)
+    self.assertEqual([x.rate for x in curve[:7]],
+                     [1000000 * 2 ** x for x in range(7)])
+    self.assertTrue(curve[6].loss > 1.0)
+
+  def testRampDown(self):
+    """Back off from above the capacity and repeat every step."""
+    rate, curve = iperf.IperfUDPMaxRate(self.src, self.dst, 'b.dst', loss=1.0,
+                                        start='100M', precision=0.05,
+                                        repeats=2)
+    self.assertGreaterEqual(rate, FixedPathHost.CAPACITY * 0.95)
+    self.assertLessEqual(rate, FixedPathHost.CAPACITY / 0.99)
+    self.assertEqual(curve[0].rate, curve[1].rate)
+    self.assertEqual(curve[2].rate, 50000000)
+
+  def testMaxRate(self):
+    """Never go past max_rate."""
+    rate, _ = iperf.IperfUDPMaxRate(self.src, self.dst, 'b.dst', loss=1.0,
+                                    start='1M', max_rate='3M')
+    self.assertEqual(rate, 3000000)
+#END CLASS IperfUDPMaxRateTest
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,249 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""All-pairs bandwidth measurement across a set of hosts.
+
+Measuring every (src, dst) pair of N hosts one at a time takes N*(N-1) runs.
+Instead the pairs are split up into rounds where no host sends more than once
+and no host receives more than once, and every round is run as one IperfSet.
+For a full mesh that takes N-1 rounds.
+
+  MeshCell: Named tuple with the statistics for one (src, dst) pair.
+  MeshRounds: Splits a list of (src, dst) pairs into conflict free rounds.
+  IperfMesh: Class that measures the bandwidth matrix of a set of hosts.
+
+Simple usage:
+  mesh = IperfMesh(['a.remote_host.com', 'b.remote_host.com',
+                    'c.remote_host.com'])
+  mesh.Start(length=10, repeats=3)
+  matrix = mesh.Matrix()
+  print matrix[0][1].mean  # a -> b in Mbps
+"""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import collections
+
+from netlib.data import stats
+from netlib.net import iperf
+from netlib.shell import bash
+
+
+class MeshCell(collections.namedtuple('MeshCell', ['samples', 'mean', 'stdev',
+                                                   'low', 'high'])):
+  """Class to simplify working with the results for one (src, dst) pair.
+
+  This works like a struct in C/C++.  See named tuple for more information.
+  http://docs.python.org/library/collections.html#collections.namedtuple
+
+  Attributes:
+    samples: list of throughput measurements in Mbps (list of floats)
+    mean: mean throughput in Mbps (float)
+    stdev: sample standard deviation in Mbps (float or None)
+    low: lowest throughput in Mbps (float)
+    high: highest throughput in Mbps (float)
+  """
+  pass
+#END CLASS MeshCell
+
+
+def __Matching(edges):
+  """Finds a maximum matching of sources to destinations.
+
+  Uses augmenting paths (Kuhn's algorithm) which is plenty fast for the size
+  of a testbed.
+
+  Args:
+    edges: list of (src, dst) pairs.
+
+  Returns:
+    list of (src, dst) pairs where no src or dst appears twice.
+  """
+  adjacent = dict()
+  for src, dst in edges:
+    adjacent.setdefault(src, list()).append(dst)
+  owner = dict()
+
+  def Augment(src, seen):
+    for dst in adjacent[src]:
+      if dst in seen:
+        continue
+      seen.add(dst)
+      if dst not in owner or Augment(owner[dst], seen):
+        owner[dst] = src
+        return True
+    return False
+
+  # Busiest sources first so that they are not left for later rounds.
+  for src in sorted(adjacent, key=lambda x: -len(adjacent[x])):
+    Augment(src, set())
+  return [(owner[dst], dst) for dst in owner]
+
+
+def MeshRounds(pairs):
+  """Splits a list of (src, dst) pairs into conflict free rounds.
+
+  In every round a host sends at most once and receives at most once (it may
+  do one of each).  A full mesh of N hosts uses the N-1 rotations i -> i+r
+  which is the fewest rounds possible.  Anything else is split up greedily
+  with a maximum matching per round.
+
+  Args:
+    pairs: list of (src, dst) pairs of hashable host ids, src != dst.
+
+  Returns:
+    list of rounds, each a list of (src, dst) pairs.
+
+  Raises:
+    No exceptions handled here.
+    No new exceptions generated here.
+  """
+  remaining = list()
+  for pair in pairs:
+    assert pair[0] != pair[1]
+    if pair not in remaining:
+      remaining.append(pair)
+  hosts = sorted(set([x[0] for x in remaining] + [x[1] for x in remaining]))
+  n = len(hosts)
+  if n > 1 and len(remaining) == n * (n - 1):
+    return [[(hosts[i], hosts[(i + r) % n]) for i in range(n)]
+            for r in range(1, n)]
+  rounds = list()
+  while remaining:
+    matching = __Matching(remaining)
+    rounds.append(sorted(matching))
+    remaining = [x for x in remaining if x not in matching]
+  return rounds
+
+
+class IperfMesh(object):
+  """Class that measures the bandwidth matrix of a set of hosts.
+
+  Every host runs an iperf server for the rounds where it receives and an
+  iperf client for the rounds where it sends.  Both directions of a pair are
+  measured on their own so the matrix need not be symmetric.
+
+  Attributes:
+    hosts: list of bash.Host objects.
+    addresses: list of addresses the clients connect to (1:1 with hosts).
+    samples: dict mapping (src, dst) index pairs to lists of Mbps.
+  """
+
+  def __init__(self, hosts, addresses=None, backend='iperf'):
+    """Inits IperfMesh with a list of hosts.
+
+    Args:
+      hosts: list of hostnames or bash.Host objects.
+      addresses: list of addresses to connect to (1:1 with hosts), by default
+        the hostnames themselves.
+      backend: which traffic generator to run (see iperf.BACKENDS).
+
+    Returns:
+      IperfMesh: an instance of the IperfMesh class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    self.hosts = list()
+    for host in hosts:
+      if isinstance(host, bash.Host):
+        self.hosts.append(host)
+      else:
+        self.hosts.append(bash.Host(host))
+    if addresses is None:
+      addresses = [x.host for x in self.hosts]
+    assert len(addresses) == len(self.hosts)
+    self.addresses = list(addresses)
+    self.backend = backend
+    self.samples = dict()
+
+  def Pairs(self, symmetric=False):
+    """Returns every (src, dst) index pair.
+
+    Args:
+      symmetric: If set only return src < dst (one direction per pair).
+
+    Returns:
+      list of (src, dst) index pairs.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    n = len(self.hosts)
+    return [(i, j) for i in range(n) for j in range(n)
+            if i != j and (not symmetric or i < j)]
+
+  def Start(self, length, repeats=1, pairs=None, window=None, parallel=None):
+    """Measures every pair in conflict free rounds.
+
+    The whole schedule is run repeats times (rather than repeating each round
+    back to back) so the repeats of a pair are spread out over time.
+
+    Args:
+      length: generate traffic for this many seconds in every round.
+      repeats: how many times to measure every pair.
+      pairs: list of (src, dst) index pairs, by default every ordered pair.
+      window: If set use TCP with a window size in Bytes.
+      parallel: If set every client runs this many parallel streams.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if pairs is None:
+      pairs = self.Pairs()
+    rounds = MeshRounds(pairs)
+    for _ in range(repeats):
+      for mesh_round in rounds:
+        self.__RunRound(mesh_round, length, window, parallel)
+
+  def __RunRound(self, mesh_round, length, window, parallel):
+    """Runs one round as a single IperfSet and stores the throughput."""
+    srcs = [self.hosts[x[0]] for x in mesh_round]
+    dsts = [self.hosts[x[1]] for x in mesh_round]
+    addresses = [self.addresses[x[1]] for x in mesh_round]
+    ips = iperf.IperfSet(srcs, dsts, addresses, self.backend)
+    ips.Start(length, None, window, parallel=parallel)
+    for pair, results in zip(mesh_round, ips.ParsedResults()):
+      if results is None or results.Throughput() is None:
+        continue
+      self.samples.setdefault(pair, list()).append(results.Throughput())
+
+  def Cell(self, src, dst):
+    """Returns the MeshCell for a pair (None if it was never measured)."""
+    samples = self.samples.get((src, dst))
+    if not samples:
+      return None
+    return MeshCell(samples=list(samples), mean=stats.Mean(samples),
+                    stdev=stats.StdDev(samples), low=min(samples),
+                    high=max(samples))
+
+  def Matrix(self):
+    """Returns the bandwidth matrix.
+
+    Returns:
+      list of lists of MeshCells indexed [src][dst] (1:1 with hosts), None on
+      the diagonal and for pairs that were not measured.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    n = len(self.hosts)
+    return [[self.Cell(i, j) for j in range(n)] for i in range(n)]
+#END CLASS IperfMesh
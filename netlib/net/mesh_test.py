@@ -0,0 +1,105 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for netlib.net.mesh."""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import unittest
+
+from netlib.net import mesh
+from netlib.shell import mock
+
+
+client_result = """[  3] local 10.0.0.1 port 41063 connected with 10.0.0.2 port 5001
+[  3]  0.0-10.0 sec  53.3 MBytes  %s Mbits/sec"""
+
+HOSTS = ['a.remote_host.com', 'b.remote_host.com', 'c.remote_host.com',
+         'd.remote_host.com']
+
+for i in range(len(HOSTS)):
+  mock.MockHost.results['iperf -c %s -t 10' % HOSTS[i]] = (client_result %
+                                                           (10 * (i + 1)))
+
+
+class MeshRoundsTest(unittest.TestCase):
+  """Test for MeshRounds."""
+
+  def CheckRounds(self, pairs, rounds):
+    """Every pair shows up once and nobody sends or receives twice."""
+    seen = list()
+    for mesh_round in rounds:
+      self.assertEqual(len(set([x[0] for x in mesh_round])), len(mesh_round))
+      self.assertEqual(len(set([x[1] for x in mesh_round])), len(mesh_round))
+      seen.extend(mesh_round)
+    self.assertEqual(sorted(seen), sorted(pairs))
+
+  def testFullMesh(self):
+    """A full mesh of N hosts takes N-1 rounds of N pairs."""
+    pairs = [(i, j) for i in range(5) for j in range(5) if i != j]
+    rounds = mesh.MeshRounds(pairs)
+    self.assertEqual(len(rounds), 4)
+    for mesh_round in rounds:
+      self.assertEqual(len(mesh_round), 5)
+    self.CheckRounds(pairs, rounds)
+
+  def testPartial(self):
+    """Anything else is still conflict free."""
+    pairs = [(0, 1), (0, 2), (0, 3), (1, 0), (2, 3), (3, 1)]
+    rounds = mesh.MeshRounds(pairs)
+    self.assertEqual(len(rounds), 3)
+    self.CheckRounds(pairs, rounds)
+
+  def testDuplicates(self):
+    """Asking for a pair twice does not measure it twice per repeat."""
+    rounds = mesh.MeshRounds([(0, 1), (0, 1)])
+    self.assertEqual(rounds, [[(0, 1)]])
+#END CLASS MeshRoundsTest
+
+
+class IperfMeshTest(unittest.TestCase):
+  """Test for IperfMesh."""
+
+  def setUp(self):
+    """Create mock Host objects."""
+    self.hosts = [mock.MockHost(x) for x in HOSTS]
+    self.mesh = mesh.IperfMesh(self.hosts)
+
+  def testStart(self):
+    """Every ordered pair ends up in the matrix."""
+    self.mesh.Start(10, repeats=2)
+    matrix = self.mesh.Matrix()
+    self.assertEqual(len(matrix), len(HOSTS))
+    for i in range(len(HOSTS)):
+      self.assertIsNone(matrix[i][i])
+      for j in range(len(HOSTS)):
+        if i != j:
+          self.assertEqual(len(matrix[i][j].samples), 2)
+          self.assertAlmostEqual(matrix[i][j].mean, 10 * (j + 1))
+          self.assertEqual(matrix[i][j].stdev, 0.0)
+
+  def testPairs(self):
+    """Only the pairs asked for are measured."""
+    self.mesh.Start(10, pairs=self.mesh.Pairs(symmetric=True))
+    matrix = self.mesh.Matrix()
+    self.assertIsNotNone(matrix[0][1])
+    self.assertIsNone(matrix[1][0])
+    self.assertEqual(matrix[2][3].samples, [40.0])
+#END CLASS IperfMeshTest
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,691 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reads pcap and pcapng capture files without running tcpdump.
+
+The headers are decoded straight from the capture with precompiled structs
+reading at offsets into the capture so nothing is copied except for the
+addresses.  The capture can be a string or an mmap of the file.
+
+The records have the same fields as the ones parsed from the verbose text
+output of tcpdump -tt -v -n -S so they can be dropped into a TCPDumpResults
+(see TCPDumpResults.FromPcap).
+
+  Packets: Walks the packets of a pcap or pcapng capture.
+  Chunks: Splits a capture into ranges of packets that can be walked alone.
+  IsCapture: Checks if data starts like a pcap or pcapng capture.
+  Decode: Decodes the packets of a capture into records.
+  ReadFile: Decodes a capture file into records.
+  PcapFile: Class for random access to a capture file through mmap.
+  PcapStream: Class to decode a pcap capture as it arrives.
+
+Supported link types are Ethernet (with VLAN tags), Linux cooked capture, raw
+IP and BSD loopback.  IPv4 and IPv6 (with the common extension headers) are
+decoded, carrying TCP and optionally UDP.
+
+Simple usage:
+  records = ReadFile('/tmp/trace.pcap', tcpdump.TCPDumpRecord)
+
+Decoding a capture as it is read from a pipe:
+  stream = PcapStream(tcpdump.TCPDumpRecord)
+  for data in iter(lambda: pipe.read(65536), ''):
+    records = stream.Feed(data)
+"""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import array
+import bisect
+import itertools
+import mmap
+import os
+import socket
+import struct
+
+
+PCAP_MAGIC = 0xa1b2c3d4
+PCAP_NSEC_MAGIC = 0xa1b23c4d
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_BYTE_ORDER = 0x1a2b3c4d
+PCAPNG_IDB = 1
+PCAPNG_OPB = 2
+PCAPNG_EPB = 6
+PCAPNG_TSRESOL = 9
+PCAPNG_TSOFFSET = 14
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_LINUX_SLL = 113
+# Raw IP is 101 in files but some writers use the DLT value (12 or 14).
+LINKTYPE_RAW = (12, 14, 101)
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+
+PROTO_TCP = 6
+PROTO_UDP = 17
+# IPv6 extension headers that are skipped to find the transport header.
+IPV6_EXTENSIONS = (0, 43, 60)
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+# Ethernet, a 20 Byte IPv4 header and the start of a TCP header in one go which
+# covers nearly every packet in a trace of a TCP transfer.
+__ETH_IPV4_TCP = struct.Struct('!12xHBxHHHxBxxLLHHLLBB')
+__U16 = struct.Struct('!H')
+__IPV4 = struct.Struct('!BxHHHxB')
+__IPV6 = struct.Struct('!HB')
+__TCP = struct.Struct('!HHLLBB')
+__UDP = struct.Struct('!HH')
+
+
+def Packets(data, start=None, stop=None):
+  """Walks the packets of a pcap or pcapng capture.
+
+  Args:
+    data: the capture (a string or an mmap).
+    start: where to start walking a classic pcap capture (see Chunks).
+    stop: where to stop walking a classic pcap capture (see Chunks).
+
+  Returns:
+    generator of (time_stamp, linktype, offset, caplen) tuples where the
+    captured bytes of the packet are data[offset:offset + caplen].
+
+  Raises:
+    ValueError: if data is not a pcap or pcapng capture.
+  """
+  if len(data) < 24:
+    return iter([])
+  magic = struct.unpack_from('<L', data, 0)[0]
+  if magic == PCAPNG_SHB:
+    return __PcapNG(data)
+  for order in '<>':
+    magic = struct.unpack_from(order + 'L', data, 0)[0]
+    if magic in (PCAP_MAGIC, PCAP_NSEC_MAGIC):
+      return __Pcap(data, order, magic == PCAP_NSEC_MAGIC, start, stop)
+  raise ValueError('not a pcap or pcapng capture')
+
+
+def Chunks(data, count):
+  """Splits a capture into about count byte ranges of whole packets.
+
+  Only the packet headers are read (to find where each packet starts).  Each
+  range can be walked on its own by Packets, i.e. in another process.  A
+  pcapng capture can not be walked from the middle so it is one range.
+
+  Args:
+    data: the capture (a string or an mmap).
+    count: how many ranges to aim for.
+
+  Returns:
+    list of (start, stop) for Packets.
+
+  Raises:
+    ValueError: if data is not a pcap or pcapng capture.
+  """
+  if len(data) < 24 or struct.unpack_from('<L', data, 0)[0] == PCAPNG_SHB:
+    return [(None, None)]
+  for order in '<>':
+    if struct.unpack_from(order + 'L', data, 0)[0] in (PCAP_MAGIC,
+                                                       PCAP_NSEC_MAGIC):
+      break
+  else:
+    raise ValueError('not a pcap or pcapng capture')
+  caplen = struct.Struct(order + '8xL').unpack_from
+  size = len(data)
+  target = max(1, (size - 24) // max(1, count))
+  chunks = list()
+  start = pos = 24
+  limit = start + target
+  while pos + 16 <= size:
+    if pos >= limit:
+      chunks.append((start, pos))
+      start = pos
+      limit = pos + target
+    pos += 16 + caplen(data, pos)[0]
+  chunks.append((start, size))
+  return chunks
+
+
+def IsCapture(data):
+  """Returns True if data starts like a pcap or pcapng capture."""
+  if len(data) < 4:
+    return False
+  for order in '<>':
+    magic = struct.unpack_from(order + 'L', data, 0)[0]
+    if magic in (PCAP_MAGIC, PCAP_NSEC_MAGIC, PCAPNG_SHB):
+      return True
+  return False
+
+
+def __Pcap(data, order, nsec, start=None, stop=None):
+  """Generator for the packets of a classic pcap capture."""
+  linktype = struct.unpack_from(order + 'L', data, 20)[0] & 0xffff
+  header = struct.Struct(order + 'LLL')
+  if nsec:
+    scale = 1000000000.0
+  else:
+    scale = 1000000.0
+  size = len(data)
+  if stop is not None:
+    size = min(size, stop)
+  pos = start or 24
+  while pos + 16 <= size:
+    sec, frac, caplen = header.unpack_from(data, pos)
+    pos += 16
+    if pos + caplen > size:
+      break
+    yield (sec + frac / scale, linktype, pos, caplen)
+    pos += caplen
+
+
+def __PcapNG(data):
+  """Generator for the packets of a pcapng capture."""
+  size = len(data)
+  pos = 0
+  order = '<'
+  interfaces = list()
+  while pos + 12 <= size:
+    block_type = struct.unpack_from(order + 'L', data, pos)[0]
+    if block_type == PCAPNG_SHB:
+      if struct.unpack_from('<L', data, pos + 8)[0] == PCAPNG_BYTE_ORDER:
+        order = '<'
+      else:
+        order = '>'
+      interfaces = list()
+    block_len = struct.unpack_from(order + 'L', data, pos + 4)[0]
+    if block_len < 12 or pos + block_len > size:
+      break
+    if block_type == PCAPNG_IDB:
+      interfaces.append(__Interface(data, order, pos, block_len))
+    elif block_type in (PCAPNG_EPB, PCAPNG_OPB):
+      if block_type == PCAPNG_EPB:
+        iface, high, low, caplen = struct.unpack_from(order + 'LLLL', data,
+                                                      pos + 8)
+      else:
+        iface, high, low, caplen = struct.unpack_from(order + 'HxxLLL', data,
+                                                      pos + 8)
+      if iface < len(interfaces):
+        linktype, units, offset = interfaces[iface]
+        sec, frac = divmod((high << 32) | low, units)
+        yield (offset + sec + frac / float(units), linktype, pos + 28,
+               min(caplen, block_len - 28))
+    pos += block_len
+
+
+def __Interface(data, order, pos, block_len):
+  """Returns (linktype, ticks per second, offset) from an IDB."""
+  linktype = struct.unpack_from(order + 'H', data, pos + 8)[0]
+  units = 1000000
+  offset = 0
+  opt = pos + 16
+  end = pos + block_len - 4
+  while opt + 4 <= end:
+    code, length = struct.unpack_from(order + 'HH', data, opt)
+    if code == 0:
+      break
+    if code == PCAPNG_TSRESOL and length >= 1:
+      resolution = struct.unpack_from('B', data, opt + 4)[0]
+      if resolution & 0x80:
+        units = 2 ** (resolution & 0x7f)
+      else:
+        units = 10 ** resolution
+    elif code == PCAPNG_TSOFFSET and length >= 8:
+      offset = struct.unpack_from(order + 'q', data, opt + 4)[0]
+    opt += 4 + (length + 3) // 4 * 4
+  return (linktype, units, offset)
+
+
+def Decode(data, record=None, udp=False, out=None, packets=None):
+  """Decodes the packets of a capture into records.
+
+  Every TCP packet (and every UDP packet with udp) becomes one record with the
+  fields (time_stamp, id_num, length, src, dst, start, ack, end) where src and
+  dst are 'address.port' like tcpdump prints them.  Just like tcpdump, start
+  and end (start plus the TCP payload length) are only set when the packet
+  carries data or a SYN, FIN or RST, and ack is only set when the ACK flag is.
+  IPv6 packets have no id_num (None) and their length is the payload length
+  plus the 40 Byte header.  Packets that are not IP, are later fragments or
+  were cut short before the transport header are skipped.
+
+  Args:
+    data: the capture (a string or an mmap).
+    record: tuple subclass for the records (i.e. TCPDumpRecord), by default
+      the records are plain tuples.
+    udp: should UDP packets be included (with start, ack and end of None)?
+    out: If set add the records to this (anything with an append method, i.e.
+      a TCPDumpColumns) instead of a new list.
+    packets: If set decode just these packets (tuples like the ones Packets
+      makes) instead of all of them.
+
+  Returns:
+    list of records (or out) in capture order.
+
+  Raises:
+    ValueError: if data is not a pcap or pcapng capture.
+  """
+  if record is None:
+    record = tuple
+  # Skips the Python level __new__ of a named tuple, the fields are in order.
+  new = tuple.__new__
+  if out is None:
+    out = list()
+  append = out.append
+  eth_ipv4_tcp = __ETH_IPV4_TCP.unpack_from
+  inet_ntoa = socket.inet_ntoa
+  pack_address = struct.Struct('!L').pack
+  u16 = __U16.unpack_from
+  ipv4 = __IPV4.unpack_from
+  ipv6 = __IPV6.unpack_from
+  tcp = __TCP.unpack_from
+  udp_ports = __UDP.unpack_from
+  names = dict()
+  flows = dict()
+  if packets is None:
+    packets = Packets(data)
+  for time_stamp, linktype, offset, caplen in packets:
+    if linktype == LINKTYPE_ETHERNET and caplen >= 48:
+      (ethertype, vihl, length, id_num, frag, proto, src, dst, sport, dport,
+       seq, ack, data_offset, flags) = eth_ipv4_tcp(data, offset)
+      if (ethertype == ETHERTYPE_IPV4 and vihl == 0x45 and
+          proto == PROTO_TCP and not frag & 0x1fff):
+        size = length - 20 - (data_offset >> 4) * 4
+        if size > 0 or flags & (TCP_SYN | TCP_FIN | TCP_RST):
+          start = seq
+          end = (seq + size) & 0xffffffff
+        else:
+          start = end = None
+        if not flags & TCP_ACK:
+          ack = None
+        flow = (src, sport, dst, dport)
+        names_tmp = flows.get(flow)
+        if names_tmp is None:
+          names_tmp = flows[flow] = (
+              '%s.%d' % (inet_ntoa(pack_address(src)), sport),
+              '%s.%d' % (inet_ntoa(pack_address(dst)), dport))
+        append(new(record, (time_stamp, id_num, length, names_tmp[0],
+                            names_tmp[1], start, ack, end)))
+        continue
+    limit = offset + caplen
+    if linktype == LINKTYPE_ETHERNET:
+      if caplen < 14:
+        continue
+      ethertype = u16(data, offset + 12)[0]
+      offset += 14
+      while ethertype in ETHERTYPE_VLAN and offset + 4 <= limit:
+        ethertype = u16(data, offset + 2)[0]
+        offset += 4
+    elif linktype == LINKTYPE_LINUX_SLL:
+      if caplen < 16:
+        continue
+      ethertype = u16(data, offset + 14)[0]
+      offset += 16
+    elif linktype in LINKTYPE_RAW or linktype == LINKTYPE_NULL:
+      if linktype == LINKTYPE_NULL:
+        offset += 4
+      if offset >= limit:
+        continue
+      version = struct.unpack_from('B', data, offset)[0] >> 4
+      if version == 4:
+        ethertype = ETHERTYPE_IPV4
+      elif version == 6:
+        ethertype = ETHERTYPE_IPV6
+      else:
+        continue
+    else:
+      continue
+
+    if ethertype == ETHERTYPE_IPV4:
+      if offset + 20 > limit:
+        continue
+      vihl, length, id_num, frag, proto = ipv4(data, offset)
+      if frag & 0x1fff:
+        continue
+      header = (vihl & 0x0f) * 4
+      raw_src = data[offset + 12:offset + 16]
+      raw_dst = data[offset + 16:offset + 20]
+      payload = length - header
+      offset += header
+    elif ethertype == ETHERTYPE_IPV6:
+      if offset + 40 > limit:
+        continue
+      payload, proto = ipv6(data, offset + 4)
+      id_num = None
+      length = payload + 40
+      raw_src = data[offset + 8:offset + 24]
+      raw_dst = data[offset + 24:offset + 40]
+      offset += 40
+      while proto in IPV6_EXTENSIONS and offset + 2 <= limit:
+        proto, ext_len = struct.unpack_from('BB', data, offset)
+        ext_len = (ext_len + 1) * 8
+        payload -= ext_len
+        offset += ext_len
+    else:
+      continue
+
+    if proto == PROTO_TCP:
+      if offset + 14 > limit:
+        continue
+      sport, dport, seq, ack, data_offset, flags = tcp(data, offset)
+      size = payload - (data_offset >> 4) * 4
+      if size > 0 or flags & (TCP_SYN | TCP_FIN | TCP_RST):
+        start = seq
+        end = (seq + size) & 0xffffffff
+      else:
+        start = end = None
+      if not flags & TCP_ACK:
+        ack = None
+    elif proto == PROTO_UDP and udp:
+      if offset + 4 > limit:
+        continue
+      sport, dport = udp_ports(data, offset)
+      start = ack = end = None
+    else:
+      continue
+
+    src = names.get((raw_src, sport))
+    if src is None:
+      src = names[(raw_src, sport)] = '%s.%d' % (__Address(raw_src), sport)
+    dst = names.get((raw_dst, dport))
+    if dst is None:
+      dst = names[(raw_dst, dport)] = '%s.%d' % (__Address(raw_dst), dport)
+    append(new(record, (time_stamp, id_num, length, src, dst, start, ack,
+                        end)))
+  return out
+
+
+def __Address(raw):
+  """Formats a raw IPv4 or IPv6 address like tcpdump -n does."""
+  if len(raw) == 4:
+    return socket.inet_ntoa(raw)
+  return socket.inet_ntop(socket.AF_INET6, raw)
+
+
+def ReadFile(path, record=None, udp=False):
+  """Decodes a capture file into records (see Decode and PcapFile)."""
+  capture = PcapFile(path, record, udp)
+  try:
+    return capture.Records()
+  finally:
+    capture.Close()
+
+
+class PcapFile(object):
+  """Class for random access to the packets of a capture file.
+
+  The file is mapped (mmap) rather than read so the only copies of it are the
+  pages the operating system caches, and the headers are decoded in place.
+  The first time a packet is asked for by index or time the headers of every
+  packet are walked once to build an index of where each one is (about 26
+  Bytes a packet in arrays, not Python objects).  After that any packet or
+  range of packets is decoded without touching the rest of the file.
+
+  The time ranges assume the packets are in time order, which is how tcpdump
+  writes them.
+
+  Simple usage:
+    capture = PcapFile('/tmp/trace.pcap', tcpdump.TCPDumpRecord)
+    print len(capture), capture.Record(1000000)
+    records = capture.Window(1328812345.0, 1328812346.0)
+    capture.Close()
+
+  Attributes:
+    path: the capture file.
+    record: tuple subclass for the records (see Decode).
+    udp: should UDP packets be included?
+    data: the mmap of the file ('' for an empty file).
+    time_stamps: array of the time stamp of every packet (after Index).
+    offsets: array of where the bytes of every packet start (after Index).
+    caplens: array of how many bytes of every packet were captured.
+    linktypes: array of the link type of every packet.
+  """
+
+  def __init__(self, path, record=None, udp=False):
+    """Inits PcapFile by mapping a capture file.
+
+    Args:
+      path: the capture file.
+      record: tuple subclass for the records (see Decode).
+      udp: should UDP packets be included?
+
+    Returns:
+      PcapFile: an instance of the PcapFile class.
+
+    Raises:
+      IOError: if the file can not be opened.
+    """
+    self.path = path
+    self.record = record
+    self.udp = udp
+    self.time_stamps = None
+    self.offsets = None
+    self.caplens = None
+    self.linktypes = None
+    capture = open(path, 'rb')
+    try:
+      if os.fstat(capture.fileno()).st_size:
+        self.data = mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ)
+      else:
+        # An empty file can not be mapped.
+        self.data = ''
+    finally:
+      capture.close()
+
+  def __del__(self):
+    """Unmaps the file."""
+    self.Close()
+
+  def Close(self):
+    """Unmaps the file (the records already decoded are still good)."""
+    if getattr(self, 'data', None):
+      self.data.close()
+    self.data = ''
+
+  def Index(self):
+    """Walks the headers of every packet once to find where they are.
+
+    Raises:
+      ValueError: if the file is not a pcap or pcapng capture.
+    """
+    if self.offsets is not None:
+      return
+    time_stamps = array.array('d')
+    offsets = array.array('L')
+    caplens = array.array('L')
+    linktypes = array.array('H')
+    for time_stamp, linktype, offset, caplen in Packets(self.data):
+      time_stamps.append(time_stamp)
+      offsets.append(offset)
+      caplens.append(caplen)
+      linktypes.append(linktype)
+    self.time_stamps = time_stamps
+    self.offsets = offsets
+    self.caplens = caplens
+    self.linktypes = linktypes
+
+  def __len__(self):
+    """The number of packets (of any kind) in the file."""
+    self.Index()
+    return len(self.offsets)
+
+  def Record(self, index):
+    """Returns the record for one packet.
+
+    Args:
+      index: the packet (counting every packet in the file).
+
+    Returns:
+      a record or None if the packet is not one that Decode keeps.
+
+    Raises:
+      IndexError: if there is no such packet.
+    """
+    self.Index()
+    records = Decode(self.data, self.record, self.udp, packets=[(
+        self.time_stamps[index], self.linktypes[index], self.offsets[index],
+        self.caplens[index])])
+    if records:
+      return records[0]
+
+  def Records(self, lo=0, hi=None, out=None):
+    """Returns the records for the packets from lo up to hi.
+
+    Decoding the whole file does not need the index.
+
+    Args:
+      lo: the first packet (see Record).
+      hi: the packet to stop before (None for the end of the file).
+      out: If set add the records to this (see Decode).
+
+    Returns:
+      list of records (or out) in capture order.
+
+    Raises:
+      ValueError: if the file is not a pcap or pcapng capture.
+    """
+    if lo == 0 and hi is None and self.offsets is None:
+      return Decode(self.data, self.record, self.udp, out)
+    self.Index()
+    if hi is None:
+      hi = len(self.offsets)
+    packets = itertools.izip(itertools.islice(self.time_stamps, lo, hi),
+                             itertools.islice(self.linktypes, lo, hi),
+                             itertools.islice(self.offsets, lo, hi),
+                             itertools.islice(self.caplens, lo, hi))
+    return Decode(self.data, self.record, self.udp, out, packets)
+
+  def Range(self, start=None, end=None):
+    """Finds the packets captured from start up to end.
+
+    Args:
+      start: the first time stamp to include (None for the first packet).
+      end: the time stamp to stop before (None for after the last packet).
+
+    Returns:
+      (lo, hi) for Records.
+
+    Raises:
+      ValueError: if the file is not a pcap or pcapng capture.
+    """
+    self.Index()
+    if start is None:
+      lo = 0
+    else:
+      lo = bisect.bisect_left(self.time_stamps, start)
+    if end is None:
+      hi = len(self.time_stamps)
+    else:
+      hi = bisect.bisect_left(self.time_stamps, end, lo)
+    return (lo, hi)
+
+  def Window(self, start=None, end=None, out=None):
+    """Returns the records for the packets captured from start up to end.
+
+    Args:
+      start: the first time stamp to include (None for the first packet).
+      end: the time stamp to stop before (None for after the last packet).
+      out: If set add the records to this (see Decode).
+
+    Returns:
+      list of records (or out) in capture order.
+
+    Raises:
+      ValueError: if the file is not a pcap or pcapng capture.
+    """
+    lo, hi = self.Range(start, end)
+    return self.Records(lo, hi, out)
+#END CLASS PcapFile
+
+
+class PcapStream(object):
+  """Class to decode a pcap capture as it arrives a piece at a time.
+
+  This is for tcpdump -w - piped back from a host.  Only the classic pcap
+  format is supported (that is what tcpdump writes).  Whatever is left after
+  the last whole packet is held until the rest of it is fed in.
+
+  Attributes:
+    header: the 24 Byte file header (None until it has arrived).
+    record: tuple subclass for the records (see Decode).
+    udp: should UDP packets be included?
+  """
+
+  def __init__(self, record=None, udp=False):
+    """Inits PcapStream.
+
+    Args:
+      record: tuple subclass for the records (see Decode).
+      udp: should UDP packets be included?
+
+    Returns:
+      PcapStream: an instance of the PcapStream class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    self.record = record
+    self.udp = udp
+    self.header = None
+    self.packet_header = None
+    self.pending = ''
+
+  def Feed(self, data, out=None):
+    """Decodes the packets that are complete once data is added.
+
+    Args:
+      data: the next piece of the capture (str).
+      out: If set add the records to this (see Decode).
+
+    Returns:
+      list of records (or out) for the packets completed by data.
+
+    Raises:
+      ValueError: if the stream is not a pcap capture.
+    """
+    if out is None:
+      out = list()
+    pending = self.pending + data
+    if self.header is None:
+      if len(pending) < 24:
+        self.pending = pending
+        return out
+      for order in '<>':
+        magic = struct.unpack_from(order + 'L', pending, 0)[0]
+        if magic in (PCAP_MAGIC, PCAP_NSEC_MAGIC):
+          self.packet_header = struct.Struct(order + '8xL')
+          break
+      else:
+        raise ValueError('not a pcap capture')
+      self.header = pending[:24]
+      pending = pending[24:]
+    unpack = self.packet_header.unpack_from
+    size = len(pending)
+    pos = 0
+    while pos + 16 <= size:
+      caplen = unpack(pending, pos)[0]
+      if pos + 16 + caplen > size:
+        break
+      pos += 16 + caplen
+    self.pending = pending[pos:]
+    if pos:
+      Decode(self.header + pending[:pos], self.record, self.udp, out)
+    return out
+#END CLASS PcapStream
@@ -0,0 +1,329 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for netlib.net.pcap.
+
+The captures are built here from scratch along with the text tcpdump -tt -v -n
+-S would print for them, so the two ways of reading a trace can be compared.
+"""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import socket
+import struct
+import tempfile
+import unittest
+
+from netlib.net import pcap
+from netlib.net import tcpdump
+
+
+TEXT_TCP = ('%.6f IP (tos 0x0, ttl 64, id %d, offset 0, flags [DF], proto TCP '
+            '(6), length %d) %s > %s: . cksum 0x1234 (correct), %sack %d win '
+            '46 <nop,nop,TS val 1 ecr 2>')
+
+
+def Segment(src, dst, sport, dport, seq, ack, flags=pcap.TCP_ACK, payload=0,
+            id_num=0, v6=False):
+  """Returns the bytes of an IP packet carrying a TCP segment."""
+  tcp = struct.pack('!HHLLBBHHH', sport, dport, seq, ack, 5 << 4, flags, 46,
+                    0, 0) + '\0' * payload
+  if v6:
+    return (struct.pack('!LHBB', 6 << 28, len(tcp), pcap.PROTO_TCP, 64) +
+            socket.inet_pton(socket.AF_INET6, src) +
+            socket.inet_pton(socket.AF_INET6, dst) + tcp)
+  return (struct.pack('!BBHHHBBH', 0x45, 0, 20 + len(tcp), id_num, 0x4000, 64,
+                      pcap.PROTO_TCP, 0) +
+          socket.inet_aton(src) + socket.inet_aton(dst) + tcp)
+
+
+def Datagram(src, dst, sport, dport, payload=0, id_num=0):
+  """Returns the bytes of an IPv4 packet carrying a UDP datagram."""
+  udp = struct.pack('!HHHH', sport, dport, 8 + payload, 0) + '\0' * payload
+  return (struct.pack('!BBHHHBBH', 0x45, 0, 20 + len(udp), id_num, 0, 64,
+                      pcap.PROTO_UDP, 0) +
+          socket.inet_aton(src) + socket.inet_aton(dst) + udp)
+
+
+def Ethernet(packet, vlan=None):
+  """Wraps an IP packet in an Ethernet frame."""
+  if ord(packet[0]) >> 4 == 6:
+    ethertype = pcap.ETHERTYPE_IPV6
+  else:
+    ethertype = pcap.ETHERTYPE_IPV4
+  header = '\x02' * 12
+  if vlan is not None:
+    header += struct.pack('!HH', 0x8100, vlan)
+  return header + struct.pack('!H', ethertype) + packet
+
+
+def Pcap(packets, linktype=pcap.LINKTYPE_ETHERNET, nsec=False, order='<',
+         snaplen=65535):
+  """Returns a pcap capture of a list of (time_stamp, frame) tuples."""
+  if nsec:
+    magic, scale = pcap.PCAP_NSEC_MAGIC, 1000000000
+  else:
+    magic, scale = pcap.PCAP_MAGIC, 1000000
+  out = [struct.pack(order + 'LHHlLLL', magic, 2, 4, 0, 0, snaplen, linktype)]
+  for time_stamp, frame in packets:
+    ticks = int(round(time_stamp * scale))
+    caplen = min(len(frame), snaplen)
+    out.append(struct.pack(order + 'LLLL', ticks // scale, ticks % scale,
+                           caplen, len(frame)))
+    out.append(frame[:caplen])
+  return ''.join(out)
+
+
+def PcapNG(packets, linktype=pcap.LINKTYPE_ETHERNET, tsresol=None):
+  """Returns a pcapng capture of a list of (time_stamp, frame) tuples."""
+  out = [struct.pack('<LLLHHqL', pcap.PCAPNG_SHB, 28, pcap.PCAPNG_BYTE_ORDER, 1,
+                     0, -1, 28)]
+  if tsresol is None:
+    options = ''
+    units = 1000000
+  else:
+    options = struct.pack('<HHB3x', pcap.PCAPNG_TSRESOL, 1, tsresol)
+    units = 10 ** tsresol
+  options += struct.pack('<HH', 0, 0)
+  length = 20 + len(options)
+  out.append(struct.pack('<LLHHL', pcap.PCAPNG_IDB, length, linktype, 0, 0) +
+             options + struct.pack('<L', length))
+  for time_stamp, frame in packets:
+    ticks = int(round(time_stamp * units))
+    padded = frame + '\0' * (-len(frame) % 4)
+    length = 32 + len(padded)
+    out.append(struct.pack('<LLLLLLL', pcap.PCAPNG_EPB, length, 0, ticks >> 32,
+                           ticks & 0xffffffff, len(frame), len(frame)) +
+               padded + struct.pack('<L', length))
+  return ''.join(out)
+
+
+def Transfer(count, t=1328812345.0):
+  """Returns (packets, text) for a bulk transfer with an ack every third.
+
+  The packets are (time_stamp, frame) tuples and the text is what tcpdump -tt
+  -v -n -S prints for them.
+  """
+  packets = list()
+  lines = list()
+  seq = 1
+  for i in range(count):
+    t += 0.0005 + (i * 7919 % 1500) / 1000000.0
+    if i % 3 == 2:
+      id_num = (2000 + i) & 0xffff
+      frame = Ethernet(Segment('10.0.0.2', '10.0.0.1', 5001, 41063, 1, seq,
+                               id_num=id_num))
+      lines.append(TEXT_TCP % (t, id_num, 40, '10.0.0.2.5001',
+                               '10.0.0.1.41063', '', seq))
+    else:
+      id_num = (1000 + i) & 0xffff
+      frame = Ethernet(Segment('10.0.0.1', '10.0.0.2', 41063, 5001, seq, 1,
+                               payload=1448, id_num=id_num))
+      lines.append(TEXT_TCP % (t, id_num, 1488, '10.0.0.1.41063',
+                               '10.0.0.2.5001',
+                               '%d:%d(1448) ' % (seq, seq + 1448), 1))
+      seq = (seq + 1448) & 0xffffffff
+    packets.append((float('%.6f' % t), frame))
+  return (packets, '\n'.join(lines))
+
+
+class DecodeTest(unittest.TestCase):
+  """Test for Decode."""
+
+  def assertSameRecords(self, native, text):
+    """The records match field for field (time stamps to the microsecond)."""
+    self.assertEqual(len(native), len(text))
+    for a, b in zip(native, text):
+      self.assertAlmostEqual(a.time_stamp, b.time_stamp, places=6)
+      self.assertEqual(a[1:], b[1:])
+
+  def testSameAsText(self):
+    """A pcap gives the same records as the tcpdump text."""
+    packets, text = Transfer(300)
+    native = tcpdump.TCPDumpResults.FromPcap(Pcap(packets))
+    parsed = tcpdump.TCPDumpResults(text)
+    self.assertEqual(len(native.records), 300)
+    self.assertSameRecords(native.records, parsed.records)
+    self.assertEqual(native.Throughput(step=0.1),
+                     parsed.Throughput(step=0.1))
+
+  def testFormats(self):
+    """Byte order, nanosecond and pcapng captures all agree."""
+    packets, _ = Transfer(30)
+    expected = pcap.Decode(Pcap(packets), tcpdump.TCPDumpRecord)
+    for data in (Pcap(packets, order='>'), Pcap(packets, nsec=True),
+                 PcapNG(packets), PcapNG(packets, tsresol=9)):
+      self.assertSameRecords(pcap.Decode(data, tcpdump.TCPDumpRecord),
+                             expected)
+
+  def testLinkTypes(self):
+    """VLAN tags, cooked capture and raw IP are unwrapped."""
+    packet = Segment('10.0.0.1', '10.0.0.2', 1, 2, 100, 7, payload=10)
+    sll = '\0' * 14 + struct.pack('!H', pcap.ETHERTYPE_IPV4)
+    for linktype, frame in ((pcap.LINKTYPE_ETHERNET, Ethernet(packet, 5)),
+                            (pcap.LINKTYPE_LINUX_SLL, sll + packet),
+                            (101, packet),
+                            (pcap.LINKTYPE_NULL, '\x02\0\0\0' + packet)):
+      records = pcap.Decode(Pcap([(1.0, frame)], linktype))
+      self.assertEqual(records, [(1.0, 0, 50, '10.0.0.1.1', '10.0.0.2.2', 100,
+                                  7, 110)])
+
+  def testFlags(self):
+    """start and ack are only set when tcpdump would print them."""
+    packets = [(1.0, Ethernet(Segment('10.0.0.1', '10.0.0.2', 1, 2, 100, 0,
+                                      flags=pcap.TCP_SYN))),
+               (2.0, Ethernet(Segment('10.0.0.1', '10.0.0.2', 1, 2, 101, 5))),
+               (3.0, Ethernet(Segment('10.0.0.1', '10.0.0.2', 1, 2, 101, 5,
+                                      flags=pcap.TCP_FIN | pcap.TCP_ACK)))]
+    records = pcap.Decode(Pcap(packets), tcpdump.TCPDumpRecord)
+    self.assertEqual([(x.start, x.ack, x.end) for x in records],
+                     [(100, None, 100), (None, 5, None), (101, 5, 101)])
+
+  def testIPv6(self):
+    """IPv6 addresses are printed like tcpdump -n does."""
+    packet = Segment('2001:db8::1', '2001:db8::2', 80, 5000, 1, 2, payload=100,
+                     v6=True)
+    records = pcap.Decode(Pcap([(1.0, Ethernet(packet))]),
+                          tcpdump.TCPDumpRecord)
+    self.assertEqual(records[0].src, '2001:db8::1.80')
+    self.assertEqual(records[0].dst, '2001:db8::2.5000')
+    self.assertEqual(records[0].length, 160)
+    self.assertEqual(records[0].id_num, None)
+
+  def testUDPAndTruncation(self):
+    """UDP is optional and short captures are skipped."""
+    packets = [(1.0, Ethernet(Datagram('10.0.0.1', '10.0.0.2', 7, 9, 20, 3))),
+               (2.0, Ethernet(Segment('10.0.0.1', '10.0.0.2', 1, 2, 1, 1)))]
+    data = Pcap(packets, snaplen=40)
+    self.assertEqual(pcap.Decode(data), [])
+    data = Pcap(packets)
+    self.assertEqual(len(pcap.Decode(data)), 1)
+    records = pcap.Decode(data, tcpdump.TCPDumpRecord, udp=True)
+    self.assertEqual(records[0].src, '10.0.0.1.7')
+    self.assertEqual((records[0].start, records[0].ack), (None, None))
+
+  def testChunks(self):
+    """Chunks cover every packet once and can be decoded on their own."""
+    packets, _ = Transfer(50)
+    for data in (Pcap(packets), Pcap(packets, nsec=True)):
+      expected = pcap.Decode(data, tcpdump.TCPDumpRecord)
+      chunks = pcap.Chunks(data, 4)
+      self.assertEqual(len(chunks), 4)
+      self.assertEqual(chunks[0][0], 24)
+      self.assertEqual(chunks[-1][1], len(data))
+      records = list()
+      for start, stop in chunks:
+        pcap.Decode(data, tcpdump.TCPDumpRecord, out=records,
+                    packets=pcap.Packets(data, start, stop))
+      self.assertEqual(records, expected)
+    self.assertEqual(len(pcap.Chunks(Pcap(packets[:2]), 8)), 2)
+    self.assertEqual(pcap.Chunks(PcapNG(packets), 4), [(None, None)])
+
+  def testNotPcap(self):
+    """Anything else is an error."""
+    self.assertRaises(ValueError, pcap.Decode, 'x' * 100)
+    self.assertEqual(pcap.Decode(''), [])
+#END CLASS DecodeTest
+
+
+class PcapStreamTest(unittest.TestCase):
+  """Test for PcapStream."""
+
+  def testPieces(self):
+    """A capture fed in odd sized pieces decodes like the whole thing."""
+    packets, _ = Transfer(30)
+    data = Pcap(packets, order='>')
+    stream = pcap.PcapStream(tcpdump.TCPDumpRecord)
+    records = list()
+    for i in xrange(0, len(data), 37):
+      stream.Feed(data[i:i + 37], records)
+    self.assertEqual(records, pcap.Decode(data, tcpdump.TCPDumpRecord))
+    self.assertEqual(stream.pending, '')
+
+  def testNotPcap(self):
+    """pcapng (or anything else) is an error."""
+    stream = pcap.PcapStream()
+    self.assertEqual(stream.Feed('\0' * 10), [])
+    self.assertRaises(ValueError, stream.Feed, '\0' * 20)
+    self.assertRaises(ValueError, pcap.PcapStream().Feed, PcapNG([]))
+#END CLASS PcapStreamTest
+
+
+class PcapFileTest(unittest.TestCase):
+  """Test for PcapFile and ReadFile."""
+
+  def setUp(self):
+    """A capture file with a UDP datagram in the middle."""
+    packets, _ = Transfer(30)
+    packets.insert(10, (packets[9][0], Ethernet(Datagram('10.0.0.1',
+                                                         '10.0.0.2', 7, 9))))
+    self.packets = packets
+    self.file = tempfile.NamedTemporaryFile()
+    self.file.write(Pcap(packets))
+    self.file.flush()
+    self.capture = pcap.PcapFile(self.file.name, tcpdump.TCPDumpRecord)
+    self.records = pcap.Decode(Pcap(packets), tcpdump.TCPDumpRecord)
+
+  def tearDown(self):
+    """Unmap and remove the file."""
+    self.capture.Close()
+    self.file.close()
+
+  def testRecords(self):
+    """The whole file decodes like the capture does (without an index)."""
+    self.assertEqual(self.capture.Records(), self.records)
+    self.assertEqual(self.capture.offsets, None)
+    self.assertEqual(pcap.ReadFile(self.file.name, tcpdump.TCPDumpRecord),
+                     self.records)
+
+  def testIndex(self):
+    """Every packet can be decoded on its own."""
+    self.assertEqual(len(self.capture), 31)
+    self.assertEqual(self.capture.Record(0), self.records[0])
+    self.assertEqual(self.capture.Record(10), None)
+    self.assertEqual(self.capture.Record(-1), self.records[-1])
+    self.assertEqual(self.capture.Records(9, 12), self.records[9:11])
+    self.assertRaises(IndexError, self.capture.Record, 31)
+    udp = pcap.PcapFile(self.file.name, udp=True)
+    self.assertEqual(udp.Record(10)[3], '10.0.0.1.7')
+    udp.Close()
+
+  def testWindow(self):
+    """Time ranges are found with the index."""
+    start = self.packets[5][0]
+    end = self.packets[20][0]
+    self.assertEqual(self.capture.Range(start, end), (5, 20))
+    self.assertEqual(self.capture.Window(start, end),
+                     [x for x in self.records if start <= x.time_stamp < end])
+    self.assertEqual(self.capture.Window(end=start), self.records[:5])
+    self.assertEqual(self.capture.Window(start=end + 100), [])
+
+  def testEmpty(self):
+    """An empty file has no packets and anything else is an error."""
+    empty = tempfile.NamedTemporaryFile()
+    capture = pcap.PcapFile(empty.name)
+    self.assertEqual(len(capture), 0)
+    self.assertEqual(capture.Records(), [])
+    capture.Close()
+    empty.write('x' * 100)
+    empty.flush()
+    self.assertRaises(ValueError, len, pcap.PcapFile(empty.name))
+    empty.close()
+#END CLASS PcapFileTest
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -22,7 +22,15 @@ that process and retrieve the results.
 
   TCPDump: Class to simplify getting remote tcpdump results.
   TCPDumpRecord: Named tuple to make sure our records stay together.
+  TCPDumpFlow: Named tuple with the totals for one flow.
+  TCPDumpRTT: Named tuple with the round trip time distribution of one flow.
+  TCPDumpGoodput: Named tuple with the throughput and goodput of one flow.
+  TCPDumpColumns: Column per field storage for lots of TCPDumpRecords.
+  TCPDumpView: Read only range of a list of records that shares the list.
+  SequenceRanges: Class to keep track of the sequence space a flow has sent.
   TCPDumpResults: Class to parse tcpdump output and perform basic analysis.
+  TCPDumpStream: Class to parse tcpdump output a line at a time.
+  TCPDumpSummary: Class for a compact summary made on the capture host.
 
 Simple object usage:
   tcp_d = TCPDump('a.remote_host.com')
@@ -31,18 +39,126 @@ Simple object usage:
   tcp_d.Stop()
   results = tcp_d.Results()
   thr_x, thr_y = results.Throughput(step=0.25)
+
+Capturing just the headers of the iperf flow (see netlib.net.bpf):
+  tcp_d.Start(interface='eth0', count=None,
+              bpf=bpf.BPFFilter(hosts='10.0.0.2', ports=5001))
+
+Reading the capture file directly (see netlib.net.pcap) rather than parsing
+the text that tcpdump -r prints:
+  tcp_d = TCPDump('a.remote_host.com', native=True)
+  ...
+  results = tcp_d.Results()
+  results = TCPDumpResults.FromFile('trace.pcap')  # mapped, not read
+  results = TCPDumpResults.FromFile('trace.pcap', start=t, end=t + 1.0)
+
+Streaming the capture back and watching it while it runs:
+  tcp_d = TCPDump('a.remote_host.com', live=True, step=0.5, tee='trace.pcap')
+  tcp_d.Start(interface='eth0', count=None)
+  stream = tcp_d.Update()
+  print stream.packets, stream.flows, stream.Throughput()
+  tcp_d.Stop()
+  results = tcp_d.Results()
+
+Capturing for days into rotating files of 100 MB (at most 10 of them on
+disk), each of which is decoded and removed as soon as tcpdump moves on to the
+next one (keep=False keeps just the totals):
+  tcp_d = TCPDump('a.remote_host.com', rotate_size=100, rotate_files=10,
+                  keep=False)
+  tcp_d.Start(interface='eth0', count=None)
+  stream = tcp_d.Update()
+  print tcp_d.segments, stream.packets, stream.Throughput()
+  tcp_d.Stop()
+
+Capturing on several hosts and merging the records onto our clock (the records
+are not copied):
+  tcp_set = TCPDumpSet(['a.src_host.com', 'a.dst_host.com'])
+  offsets = tcp_set.ClockOffsets()
+  tcp_set.Start(interface='eth0', count=None)
+  ...
+  tcp_set.Stop()
+  for time_stamp, i, record in tcp_set.Merge():
+    print time_stamp, tcp_set.td_list[i].host.host, record.id_num
+  delays, lost = tcp_set.OneWayDelays(sender=0, receiver=1)
+  owd_x, owd_y = delays[('10.0.0.1.41063', '10.0.0.2.5001')]
+
+Summarizing the capture on the host and only copying back flow totals, the
+throughput bins and every 100th record:
+  tcp_d = TCPDump('a.remote_host.com', summary=True, step=0.1, sample=100)
+  ...
+  summary = tcp_d.Results()
+  thr_x, thr_y = summary.Throughput()
+  flows = summary.Flows()
+
+Keeping the records of a large capture in columns (about 50 Bytes a packet):
+  results = TCPDumpResults.FromPcap(data, columnar=True)
+  first_second = results.records[:1000]  # shares the columns
+  time_stamps = first_second.Column('time_stamp')
+
+Reading a trace a line at a time (only the records are kept, or with keep=False
+just the totals):
+  results = TCPDumpResults.FromStream(open('trace.txt'))
+  stream = TCPDumpStream(keep=False, step=0.1)
+  stream.Feed(open('trace.txt'))
+  print stream.packets, stream.bytes, stream.Throughput()
+
+Zooming in on a few seconds (the records are shared, not copied):
+  zoomed = results.Slice(1328812345.0, 1328812348.0)
+  zoomed = results.Window(10.0, 3.0)  # seconds 10 to 13 of the trace
+  thr_x, thr_y = zoomed.Throughput(step=0.01)
+  rtt_x, rtt_y = zoomed.RTTs()[('10.0.0.1.41063', '10.0.0.2.5001')]
+
+Looking at one flow (the records of each flow are indexed once):
+  flow = results.Flow('10.0.0.1.41063', '10.0.0.2.5001')
+  print flow.packets, flow.bytes, flow.throughput, flow.completion
+  thr_x, thr_y = results.FlowThroughput('10.0.0.1.41063', '10.0.0.2.5001')
+
+Round trip times from matching data to the ACKs that cover it:
+  rtt_x, rtt_y = results.RTTs()[('10.0.0.1.41063', '10.0.0.2.5001')]
+  print results.RTTSummaries()[('10.0.0.1.41063', '10.0.0.2.5001')].median
+
+Retransmissions, duplicate ACKs and reordering (counted in Throughput's bins):
+  events = results.Events()[('10.0.0.1.41063', '10.0.0.2.5001')]
+  print len(events['retransmission']), len(events['spurious'])
+  counts = results.EventCounts(step=0.25)[('10.0.0.1.41063', '10.0.0.2.5001')]
+  retx_x, retx_y = counts['retransmission']
+
+Goodput (new payload Bytes only) next to throughput:
+  x, thr_y, good_y, ratio = results.Goodput(step=0.25)[
+      ('10.0.0.1.41063', '10.0.0.2.5001')]
+  print results.GoodputSummaries()[('10.0.0.1.41063', '10.0.0.2.5001')].ratio
 """
 
 __author__ = 'gavaletz@google.com (Eric Gavaletz)'
 
 
+import array
+import base64
+import bisect
 import collections
+import cStringIO
+import heapq
+import itertools
 import logging
+import math
+import multiprocessing
+import operator
+import optparse
+import struct
+import sys
+import zlib
 
 
 from netlib import config
+from netlib.data import stats
+from netlib.net import pcap
 from netlib.shell import bash
 
+try:
+  import numpy  # pylint: disable-msg=C6204
+except ImportError:
+  numpy = None
+
 
 class TCPDump(object):
   """Class to simplify getting remote tcpdump results.
@@ -56,16 +172,22 @@ class TCPDump(object):
     BIN: the binary to run on the system(s).
     KILL_STRING: shell command for killing tcpdump processes.
     SNAPLEN: the number of bytes to sample from each packet.
+    READ_SIZE: the most Bytes of a live capture to read at a time.
+    SUMMARY_BIN: the command that summarizes a capture on the host (Main).
   """
 
   WAIT_TIME = config.WAIT_TIME
   BIN = 'sudo tcpdump'
   KILL_STRING = 'sudo killall -q -r \".*tcpdump*\"'
   SNAPLEN = 96  # default=96, units=Bytes
+  READ_SIZE = 65536
+  SUMMARY_BIN = 'python -m netlib.net.tcpdump'
   # The following is useful but only in tcpdump v 4.0.0 or higher
   #BUFFER_SIZE = 100000 # default=1000, units=KiloBytes
 
-  def __init__(self, target):
+  def __init__(self, target, native=False, live=False, step=0.1, keep=True,
+               tee=None, summary=False, sample=0, rotate_size=None,
+               rotate_seconds=None, rotate_files=None):
     """Inits TCPDump with a target Host.
 
     After determining if we are being passed a string to turn into a Host
@@ -73,8 +195,41 @@ class TCPDump(object):
     simply store that for later and create the instance variables for storing
     stuff later.
 
+    With native the capture file itself is copied back (base64 encoded so it
+    survives the trip through the shell) and decoded by netlib.net.pcap
+    instead of having tcpdump print every packet as text.
+
+    With live there is no capture file at all.  tcpdump writes the capture to
+    stdout, it comes back over the same pipe as any other output and it is
+    decoded and counted (see TCPDumpStream) as it arrives, so totals and
+    throughput are available with Update while the capture is running.
+
+    With summary the capture file is summarized where it was captured (see
+    TCPDumpSummary and Main, which need netlib on the host) and only the
+    summary is copied back.
+
+    With rotate_size or rotate_seconds tcpdump starts a new capture file
+    (segment) every rotate_size million Bytes or rotate_seconds seconds and
+    prints the name of each one it finishes (-z echo).  Update then copies
+    each finished segment back, decodes and counts it (see TCPDumpStream)
+    and removes it from the host, so the analysis is only ever one segment
+    behind the capture and only the segment being written stays on disk.
+    With rotate_files as well tcpdump keeps at most that many segments (with
+    rotate_size it overwrites the oldest one, with rotate_seconds it stops).
+
     Args:
       target: The host machine where tcpdump will collect traffic.
+      native: should the capture file be decoded directly?
+      live: should the capture be streamed back and decoded as it runs?
+      step: bin size (seconds) for the running throughput of a live capture
+        or the throughput of a summary.
+      keep: should a live capture keep the records (or just the totals)?
+      tee: path of a local file to also write a live capture to.
+      summary: should the capture be summarized on the host?
+      sample: keep every sample-th record in a summary (0 for none).
+      rotate_size: start a new segment every this many million Bytes.
+      rotate_seconds: start a new segment every this many seconds.
+      rotate_files: the most segments tcpdump should write.
 
     Returns:
       TCPDump: an instance of the TCPDump class.
@@ -92,8 +247,28 @@ class TCPDump(object):
     self.data = None
     self.count = None
     self.child_pid = None
-    self.tmp_file = self.host.Run('sudo mktemp -t tcpdump.dat.XXXXXXXXXX',
-                                  echo_error=True, fork=False).strip()
+    self.native = native
+    self.live = live
+    self.summary = summary
+    self.sample = sample
+    self.step = step
+    self.keep = keep
+    self.tee = tee
+    self.tee_file = None
+    self.stream = None
+    self.pcap_stream = None
+    self.rotate_size = rotate_size
+    self.rotate_seconds = rotate_seconds
+    self.rotate_files = rotate_files
+    self.rotate = bool(rotate_size or rotate_seconds)
+    self.segments = 0
+    self.pending = ''
+    assert not (self.rotate and (live or tee))
+    if live:
+      self.tmp_file = None
+    else:
+      self.tmp_file = self.host.Run('sudo mktemp -t tcpdump.dat.XXXXXXXXXX',
+                                    echo_error=True, fork=False).strip()
 
   def __del__(self):
     """Tries to make sure that we clean up after ourselves.
@@ -108,32 +283,64 @@ class TCPDump(object):
     """
     if self.child_pid:
       self.host.Kill(self.child_pid, TCPDump.KILL_STRING)
-    self.host.Run('sudo rm %s' % self.tmp_file, echo_error=True, fork=False)
+    if self.tmp_file:
+      self.host.Run('sudo rm %s' % self.tmp_file, echo_error=True, fork=False)
+      if self.rotate:
+        self.host.Run('sudo sh -c \'rm -f %s.*\'' % self.tmp_file,
+                      echo_error=True, fork=False)
+    if self.tee_file:
+      self.tee_file.close()
 
   def Start(self, src=None, dst=None, interface=config.DEFAULT_INTERFACE,
-            count=config.TCPDUMP_COUNT):
+            count=config.TCPDUMP_COUNT, bpf=None):
     """Starts collecting traces using tcpdump.
 
     Assembles the command to be used for starting tcpdump on the system and
-    forks off a process to begin that call.
+    forks off a process to begin that call.  A bpf filter is compiled by
+    tcpdump on the host first so a bad one fails here rather than in the
+    forked capture, and its snap length is used instead of SNAPLEN.
 
     Args:
       src: fliter by this ip/hostname as the source address.
       dst: fliter by this ip/hostname as the destination address.
       interface: listen on this interface.
       count: record this many packets (None -> Inf.).
+      bpf: netlib.net.bpf.BPFFilter to capture with (instead of src and dst).
 
     Raises:
-      No exceptions handled here.
-      No new exceptions generated here.
+      ValueError: if tcpdump can not compile bpf.
     """
 
     assert interface
-    assert self.tmp_file
+    assert self.tmp_file or self.live
     assert TCPDump.SNAPLEN
+    assert not (bpf and (src or dst))
+    snaplen = TCPDump.SNAPLEN
+    if bpf:
+      bpf.Compile(self.host, interface)
+      snaplen = bpf.SnapLen()
+    self.capture_args = list()
+    self.read_args = list()
     self.capture_args.append('-i %s' % interface)
-    self.capture_args.append('-w %s' % self.tmp_file)
-    self.capture_args.append('-s %d' % TCPDump.SNAPLEN)
+    if self.live:
+      # -U writes out each packet as it is captured rather than a buffer full.
+      self.capture_args.append('-w - -U')
+    elif self.rotate:
+      # The segments are named after tmp_file so they are easy to find (and
+      # clean up) later.  With -C tcpdump adds a count to each name.
+      if self.rotate_seconds:
+        self.capture_args.append('-w %s.%%s.' % self.tmp_file)
+        self.capture_args.append('-G %d' % self.rotate_seconds)
+      else:
+        self.capture_args.append('-w %s.' % self.tmp_file)
+      if self.rotate_size:
+        self.capture_args.append('-C %d' % self.rotate_size)
+      if self.rotate_files:
+        self.capture_args.append('-W %d' % self.rotate_files)
+      self.capture_args.append('-z echo')
+    else:
+      self.capture_args.append('-w %s' % self.tmp_file)
+    self.capture_args.append('-s %d' % snaplen)
     # The following is useful but only in tcpdump v 4.0.0 or higher
     #self.capture_args.append('-B %d' % TCPDump.BUFFER_SIZE)
     if count:
@@ -145,17 +352,96 @@ class TCPDump(object):
         self.capture_args.append('and dst %s' % dst)
     elif dst:
       self.capture_args.append('ip dst %s' % dst)
-
-    self.read_args.append('-tt')
-    self.read_args.append('-v')
-    self.read_args.append('-n')
-    self.read_args.append('-S')
-    self.read_args.append('-r %s' % self.tmp_file)
+    elif bpf and bpf.Expression():
+      # Quoted for the shell ssh runs it in.
+      self.capture_args.append("'%s'" % bpf.Expression())
+
+    if self.live or self.rotate:
+      pass
+    elif self.summary:
+      self.read_args.append('-s %s' % self.step)
+      self.read_args.append('-n %d' % self.sample)
+    elif self.native:
+      self.read_args.append(self.tmp_file)
+    else:
+      self.read_args.append('-tt')
+      self.read_args.append('-v')
+      self.read_args.append('-n')
+      self.read_args.append('-S')
+      self.read_args.append('-r %s' % self.tmp_file)
 
     cmd = '%s %s' % (TCPDump.BIN, ' '.join(self.capture_args))
     if not self.child_pid:
+      if self.live or self.rotate:
+        self.stream = TCPDumpStream(reorder=0, keep=self.keep, step=self.step)
+        self.pcap_stream = pcap.PcapStream(TCPDumpRecord)
+        self.pending = ''
+        if self.tee:
+          self.tee_file = open(self.tee, 'wb')
       self.child_pid = self.host.Run(cmd, echo_error=True, fork=True)
 
+  def Update(self, timeout=0.0):
+    """Decodes and counts whatever a live capture has sent back so far.
+
+    For a rotating capture that is every segment tcpdump has finished (and
+    once it has exited the rest of them too).
+
+    Args:
+      timeout: seconds to wait for more of the capture (None waits for the
+        capture to finish).
+
+    Returns:
+      TCPDumpStream: the running totals (packets, bytes, flows, Throughput).
+
+    Raises:
+      ValueError: if the output of tcpdump is not a pcap capture.
+    """
+    assert self.live or self.rotate
+    while self.child_pid:
+      data = self.host.Read(self.child_pid, TCPDump.READ_SIZE, timeout)
+      if data is None:
+        self.host.Communicate(self.child_pid, echo_error=True)
+        self.child_pid = None
+        if self.rotate:
+          # Whatever is left was being written when tcpdump stopped.
+          left = self.host.Run('sudo sh -c \'ls -tr %s.*\'' % self.tmp_file,
+                               echo_error=False, fork=False)
+          for path in (left or '').split():
+            self.__Segment(path)
+        self.stream.Flush()
+        if self.tee_file:
+          self.tee_file.close()
+          self.tee_file = None
+        break
+      if not data:
+        break
+      if self.rotate:
+        lines = (self.pending + data).split('\n')
+        self.pending = lines.pop()
+        for path in lines:
+          if path.strip():
+            self.__Segment(path.strip())
+        continue
+      if self.tee_file:
+        self.tee_file.write(data)
+      self.stream.Feed(self.pcap_stream.Feed(data))
+    return self.stream
+
+  def __Segment(self, path):
+    """Copies back, decodes, counts and removes one finished segment.
+
+    Args:
+      path: the segment on the host.
+
+    Raises:
+      ValueError: if the segment is not a pcap capture.
+    """
+    data = self.host.Run('sudo base64 %s' % path, echo_error=True, fork=False)
+    self.host.Run('sudo rm %s' % path, echo_error=True, fork=False)
+    if data:
+      self.stream.Feed(pcap.Decode(base64.b64decode(data), TCPDumpRecord))
+    self.segments += 1
+
   def Stop(self):
     """Stops collecting traces and returns results.
 
@@ -165,60 +451,109 @@ class TCPDump(object):
     processing of packets to be done off-line.  This of course can be subverted
     by making calls to Stop at bad times.
 
+    A live (or rotating) capture is stopped and then read to the end.
+
     Raises:
       No exceptions handled here.
       No new exceptions generated here.
     """
+    if self.live or self.rotate:
+      if self.child_pid:
+        if not self.count:
+          self.host.Kill(self.child_pid, TCPDump.KILL_STRING)
+        self.Update(timeout=None)
+      return
     if self.child_pid:
       self.data = self.host.Communicate(self.child_pid, echo_error=True,
                                         kill=(not self.count),
                                         kill_string=TCPDump.KILL_STRING)
-      cmd = '%s %s' % (TCPDump.BIN, ' '.join(self.read_args))
+      if self.summary:
+        cmd = 'sh -c \'sudo cat %s | %s %s\'' % (self.tmp_file,
+                                                 TCPDump.SUMMARY_BIN,
+                                                 ' '.join(self.read_args))
+      elif self.native:
+        cmd = 'sudo base64 %s' % ' '.join(self.read_args)
+      else:
+        cmd = '%s %s' % (TCPDump.BIN, ' '.join(self.read_args))
       self.child_pid = self.host.Run(cmd, fork=True)
 
   def Restart(self, src=None, dst=None, interface=config.DEFAULT_INTERFACE,
-              count=config.TCPDUMP_COUNT):
+              count=config.TCPDUMP_COUNT, bpf=None):
     """Convenience method for stopping and then starting a TCPDump instance.
 
+    The trace that was stopped is read back first, so it is still in data
+    until the new one is stopped.
+
     Args:
       src: fliter by this ip/hostname as the source address.
       dst: fliter by this ip/hostname as the destination address.
       interface: listen on this interface.
       count: record this many packets (None -> Inf.).
+      bpf: netlib.net.bpf.BPFFilter to capture with (instead of src and dst).
 
     Raises:
-      No exceptions handled here.
-      No new exceptions generated here.
+      ValueError: if tcpdump can not compile bpf.
     """
     self.Stop()
-    self.Start(src, dst, interface, count)
+    if not (self.live or self.rotate):
+      self.Data()
+    self.Start(src, dst, interface, count, bpf)
 
   def Results(self):
     """Returns the processed tcpdump output.
 
     This returns the results in a more convenient format.  If you want access to
     the raw output from tcpdump (string) then simply access that at <TCPDump
-    instance>.data.
+    instance>.data.  For a native TCPDump that is the capture file itself.  A
+    live (or rotating) TCPDump has no data (see tee) and returns the records it
+    kept.  With summary data is the packed summary and a TCPDumpSummary is
+    returned.
+
+    Returns:
+      TCPDumpResults: the tcpdump output parsed and organized into lists, or
+      TCPDumpSummary: the unpacked summary for a summary TCPDump.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if self.live or self.rotate:
+      self.Update(timeout=None)
+      return self.stream.Results()
+    self.Data()
+    if self.summary:
+      return TCPDumpSummary.Unpack(self.data)
+    if self.native:
+      return TCPDumpResults.FromPcap(self.data)
+    return TCPDumpResults(self.data)
+
+  def Data(self):
+    """Returns the raw tcpdump output (see Results) once it has been read.
 
     Returns:
-      TCPDumpResults: the tcpdump output parsed and organized into lists.
+      The text tcpdump printed, the capture file (native) or the packed
+      summary (summary).
 
     Raises:
       No exceptions handled here.
       No new exceptions generated here.
     """
+    assert not (self.live or self.rotate)
     if not self.child_pid is None:
       self.data = self.host.Communicate(self.child_pid, echo_error=True,
                                         kill=False)
       self.child_pid = None
+      if (self.native or self.summary) and self.data:
+        self.data = base64.b64decode(self.data)
     assert not self.data is None
-    return TCPDumpResults(self.data)
+    return self.data
 #END CLASS TCPDump
 
 
 class TCPDumpRecord(collections.namedtuple('TCPRecord', ['time_stamp', 'id_num',
                                                          'length', 'src', 'dst',
-                                                         'start', 'ack'])):
+                                                         'start', 'ack',
+                                                         'end'])):
   """Class to simplify working with tcpdump records.
 
   This works like a struct in C/C++.  See named tuple for more information.
@@ -232,25 +567,536 @@ class TCPDumpRecord(collections.namedtuple('TCPRecord', ['time_stamp', 'id_num',
     dst: destination IP address (str)
     start: first Byte in packet (int)
     ack: first Byte in packet this packet is acking (int)
+    end: Byte after the last one in packet, start + payload length (int)
   """
-  pass
+
+  def __new__(cls, time_stamp, id_num, length, src, dst, start, ack,
+              end=None):
+    """Lets records be made without an end, like before it was added."""
+    return tuple.__new__(cls, (time_stamp, id_num, length, src, dst, start,
+                               ack, end))
 #END CLASS TCPDumpRecord
 
 
+class TCPDumpFlow(collections.namedtuple('TCPDumpFlow',
+                                         ['src', 'dst', 'packets', 'bytes',
+                                          'first', 'last', 'duration',
+                                          'throughput', 'completion'])):
+  """Class to simplify working with the totals for one flow.
+
+  This works like a struct in C/C++.  See named tuple for more information.
+  http://docs.python.org/library/collections.html#collections.namedtuple
+
+  A flow is one direction of a connection.  The records have no protocol field
+  (they are all TCP unless UDP was asked for) so a flow is keyed by its source
+  and destination 'address.port' strings, which hold the rest of the 5-tuple.
+
+  Attributes:
+    src: source IP address and port (str)
+    dst: destination IP address and port (str)
+    packets: number of packets (int)
+    bytes: Bytes in those packets (int)
+    first: time stamp of the first packet in seconds (float)
+    last: time stamp of the last packet in seconds (float)
+    duration: last - first in seconds (float)
+    throughput: average throughput over the duration in Mbps (float)
+    completion: seconds from the first packet to the last in either direction
+      (float)
+  """
+  pass
+#END CLASS TCPDumpFlow
+
+
+class TCPDumpRTT(collections.namedtuple('TCPDumpRTT',
+                                        ['src', 'dst', 'samples', 'min', 'mean',
+                                         'median', 'p90', 'p99', 'max',
+                                         'stdev'])):
+  """Class to simplify working with the round trip times of one flow.
+
+  This works like a struct in C/C++.  See named tuple for more information.
+  http://docs.python.org/library/collections.html#collections.namedtuple
+
+  Attributes:
+    src: source IP address and port of the data (str)
+    dst: destination IP address and port of the data (str)
+    samples: number of RTT samples (int)
+    min: smallest RTT in seconds (float)
+    mean: mean RTT in seconds (float)
+    median: median RTT in seconds (float)
+    p90: 90th percentile RTT in seconds (float)
+    p99: 99th percentile RTT in seconds (float)
+    max: largest RTT in seconds (float)
+    stdev: sample standard deviation in seconds (float or None)
+  """
+  pass
+#END CLASS TCPDumpRTT
+
+
+class TCPDumpGoodput(collections.namedtuple('TCPDumpGoodput',
+                                            ['src', 'dst', 'bytes', 'new_bytes',
+                                             'duration', 'throughput',
+                                             'goodput', 'ratio'])):
+  """Class to simplify working with the throughput and goodput of one flow.
+
+  This works like a struct in C/C++.  See named tuple for more information.
+  http://docs.python.org/library/collections.html#collections.namedtuple
+
+  Attributes:
+    src: source IP address and port (str)
+    dst: destination IP address and port (str)
+    bytes: IP Bytes sent, headers and retransmissions included (int)
+    new_bytes: payload Bytes of sequence space not sent before (int)
+    duration: seconds from the first packet to the last (float)
+    throughput: bytes over the duration in Mbps (float)
+    goodput: new_bytes over the duration in Mbps (float)
+    ratio: new_bytes / bytes (float)
+  """
+  pass
+#END CLASS TCPDumpGoodput
+
+
+class TCPDumpColumns(object):
+  """Column per field storage for lots of TCPDumpRecords.
+
+  Every field is kept in its own typed array so a record costs about 50 Bytes
+  instead of a tuple and its objects.  Addresses are interned, the src and dst
+  columns hold indexes into self.addresses.  Missing values (None) are stored
+  as NONE.
+
+  This acts like a list of TCPDumpRecords: len, indexing and iterating give
+  TCPDumpRecords and slicing gives another TCPDumpColumns that shares the
+  columns of this one (nothing is copied).  Use Column to get at the values of
+  one field without making records.
+
+  Attributes:
+    SEQUENCE: the array typecode of the start, ack and end columns.
+    FIELDS: maps each field to the array typecode of its column.
+    NONE: the value stored for None.
+    MAGIC: the first Bytes of a file written by Save.
+    LAYOUT: the byte order, SEQUENCE and item sizes of the columns on this
+      machine.
+    addresses: list of interned 'address.port' strings.
+  """
+
+  # Absolute sequence numbers (tcpdump -S) go up to 2**32, which a C long
+  # only holds where it is 64 bits.  A double holds them exactly everywhere.
+  SEQUENCE = 'l' if array.array('l').itemsize >= 8 else 'd'
+  FIELDS = (('time_stamp', 'd'), ('id_num', 'i'), ('length', 'i'),
+            ('src', 'i'), ('dst', 'i'), ('start', SEQUENCE),
+            ('ack', SEQUENCE), ('end', SEQUENCE))
+  NONE = -1
+  MAGIC = 'NLC1'
+  LAYOUT = sys.byteorder[0] + SEQUENCE + ''.join(
+      str(array.array(typecode).itemsize) for _, typecode in FIELDS)
+
+  def __init__(self, records=None):
+    """Inits TCPDumpColumns with some records.
+
+    Args:
+      records: iterable of TCPDumpRecords (or tuples with the same fields).
+
+    Returns:
+      TCPDumpColumns: an instance of the TCPDumpColumns class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    self.columns = dict()
+    for name, typecode in TCPDumpColumns.FIELDS:
+      self.columns[name] = array.array(typecode)
+    self.addresses = list()
+    self.__address_index = dict()
+    self.lo = 0
+    self.hi = None
+    if records is not None:
+      self.extend(records)
+
+  def __Intern(self, address):
+    """Returns the index of an address, adding it if it is new."""
+    index = self.__address_index.get(address)
+    if index is None:
+      index = self.__address_index[address] = len(self.addresses)
+      self.addresses.append(address)
+    return index
+
+  # Named like the list method so this can stand in for a list of records.
+  def append(self, record):  # pylint: disable-msg=C6409
+    """Adds a record to the end of the columns (not for slices)."""
+    assert self.hi is None
+    none = TCPDumpColumns.NONE
+    columns = self.columns
+    columns['time_stamp'].append(record[0])
+    columns['id_num'].append(none if record[1] is None else record[1])
+    columns['length'].append(record[2])
+    columns['src'].append(self.__Intern(record[3]))
+    columns['dst'].append(self.__Intern(record[4]))
+    columns['start'].append(none if record[5] is None else record[5])
+    columns['ack'].append(none if record[6] is None else record[6])
+    if len(record) > 7 and record[7] is not None:
+      columns['end'].append(record[7])
+    else:
+      columns['end'].append(none)
+
+  # Named like the list method so this can stand in for a list of records.
+  def extend(self, records):  # pylint: disable-msg=C6409
+    """Adds records to the end of the columns (not for slices)."""
+    for record in records:
+      self.append(record)
+
+  def AppendColumns(self, other):
+    """Adds the records of another TCPDumpColumns to the end (not for slices).
+
+    Whole columns are copied at once.  Only src and dst are looked at one at
+    a time, and only if other interned its addresses in another order.
+
+    Args:
+      other: TCPDumpColumns (or a slice of one).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    assert self.hi is None
+    lo, hi = other.Bounds()
+    mapping = [self.__Intern(address) for address in other.addresses]
+    renumber = mapping != range(len(mapping))
+    for name, typecode in TCPDumpColumns.FIELDS:
+      column = other.columns[name]
+      if lo or hi != len(column):
+        column = column[lo:hi]
+      if renumber and name in ('src', 'dst'):
+        column = array.array(typecode, [mapping[i] for i in column])
+      self.columns[name].extend(column)
+
+  def Bounds(self):
+    """Returns (lo, hi) the part of the columns this object covers."""
+    if self.hi is None:
+      return (self.lo, len(self.columns['time_stamp']))
+    return (self.lo, self.hi)
+
+  def __len__(self):
+    lo, hi = self.Bounds()
+    return hi - lo
+
+  def Record(self, index):
+    """Returns the TCPDumpRecord at an absolute index into the columns."""
+    none = TCPDumpColumns.NONE
+    columns = self.columns
+    id_num = columns['id_num'][index]
+    start = columns['start'][index]
+    ack = columns['ack'][index]
+    end = columns['end'][index]
+    return tuple.__new__(TCPDumpRecord, (
+        columns['time_stamp'][index],
+        None if id_num == none else id_num,
+        columns['length'][index],
+        self.addresses[columns['src'][index]],
+        self.addresses[columns['dst'][index]],
+        None if start == none else int(start),
+        None if ack == none else int(ack),
+        None if end == none else int(end)))
+
+  def __getitem__(self, key):
+    lo, hi = self.Bounds()
+    if isinstance(key, slice):
+      start, stop, step = key.indices(hi - lo)
+      if step != 1:
+        return [self.Record(lo + i) for i in xrange(start, stop, step)]
+      view = TCPDumpColumns.__new__(TCPDumpColumns)
+      view.__dict__.update(self.__dict__)
+      view.lo = lo + start
+      view.hi = lo + max(start, stop)
+      return view
+    if key < 0:
+      key += hi - lo
+    if not 0 <= key < hi - lo:
+      raise IndexError('record index out of range')
+    return self.Record(lo + key)
+
+  def __iter__(self):
+    lo, hi = self.Bounds()
+    for index in xrange(lo, hi):
+      yield self.Record(index)
+
+  def Column(self, name):
+    """Returns a copy of the values of one field.
+
+    With numpy installed this is a numpy array and otherwise an array.array.
+    Either way it is a copy, as appending a record can move the column and a
+    numpy array over its memory would be left pointing at memory that was
+    freed.  Missing values are NONE and src and dst are indexes into
+    self.addresses.
+
+    Args:
+      name: a field name (see FIELDS).
+
+    Returns:
+      numpy array or array.array of the values.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    column = self.columns[name]
+    lo, hi = self.Bounds()
+    if numpy is not None:
+      if not column:
+        return numpy.zeros(0, dtype=column.typecode)
+      # The view over the column is gone before anything can be appended.
+      return numpy.frombuffer(column, dtype=column.typecode)[lo:hi].copy()
+    return column[lo:hi]
+
+  def Sort(self):
+    """Puts the records in time order (not for slices).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    assert self.hi is None and self.lo == 0
+    time_stamp = self.columns['time_stamp']
+    pairs = itertools.izip(time_stamp, itertools.islice(time_stamp, 1, None))
+    for previous, current in pairs:
+      if current < previous:
+        break
+    else:
+      return
+    order = sorted(xrange(len(time_stamp)), key=time_stamp.__getitem__)
+    for name, typecode in TCPDumpColumns.FIELDS:
+      column = self.columns[name]
+      self.columns[name] = array.array(typecode, [column[i] for i in order])
+
+  def Save(self, out):
+    """Writes the columns to a file so Load can read them back.
+
+    After a header and the addresses each column is written as it is in
+    memory (machine byte order, starting on an 8 Byte boundary) so it can be
+    read back with one read per column (or mapped).  Only the part of the
+    columns a slice covers is written.
+
+    Args:
+      out: a file opened for writing in binary mode (or a cStringIO).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    lo, hi = self.Bounds()
+    addresses = '\0'.join(self.addresses)
+    header = struct.pack('<4s12sQQ', TCPDumpColumns.MAGIC,
+                         TCPDumpColumns.LAYOUT, hi - lo, len(addresses))
+    out.write(header)
+    out.write(addresses)
+    out.write('\0' * (-(len(header) + len(addresses)) % 8))
+    for name, _ in TCPDumpColumns.FIELDS:
+      column = self.columns[name]
+      if lo or hi != len(column):
+        column = column[lo:hi]
+      out.write(column.tostring())
+      out.write('\0' * (-(len(column) * column.itemsize) % 8))
+
+  @classmethod
+  def Load(cls, infile):
+    """Reads back columns written by Save.
+
+    Args:
+      infile: a file opened for reading in binary mode (or a cStringIO).
+
+    Returns:
+      TCPDumpColumns: the columns.
+
+    Raises:
+      ValueError: if the file was not written by Save on a machine like this
+        one or is cut short.
+    """
+    header = infile.read(struct.calcsize('<4s12sQQ'))
+    if len(header) != struct.calcsize('<4s12sQQ'):
+      raise ValueError('not a TCPDumpColumns file')
+    magic, layout, count, size = struct.unpack('<4s12sQQ', header)
+    if magic != TCPDumpColumns.MAGIC:
+      raise ValueError('not a TCPDumpColumns file')
+    if layout.rstrip('\0') != TCPDumpColumns.LAYOUT:
+      raise ValueError('columns written on another kind of machine')
+    columns = cls()
+    addresses = infile.read(size)
+    if len(addresses) != size:
+      raise ValueError('TCPDumpColumns file is cut short')
+    if addresses:
+      columns.addresses = addresses.split('\0')
+    columns.__address_index = dict((address, i) for i, address in
+                                   enumerate(columns.addresses))
+    infile.read(-(len(header) + size) % 8)
+    for name, typecode in TCPDumpColumns.FIELDS:
+      column = columns.columns[name]
+      data = infile.read(count * column.itemsize)
+      if len(data) != count * column.itemsize:
+        raise ValueError('TCPDumpColumns file is cut short')
+      column.fromstring(data)
+      infile.read(-(count * column.itemsize) % 8)
+    return columns
+#END CLASS TCPDumpColumns
+
+
+class TCPDumpView(object):
+  """Read only range of a list of records that shares the list.
+
+  This is what TCPDumpResults.Slice uses for records kept in a list (a slice
+  of a TCPDumpColumns is already a view).  len, indexing, iterating and
+  slicing act like the list of records in the range.
+
+  Attributes:
+    records: the list of records.
+    lo: the first record in the range.
+    hi: the record the range stops before.
+  """
+
+  def __init__(self, records, lo=0, hi=None):
+    """Inits TCPDumpView with a range of a list of records.
+
+    Args:
+      records: the list of records.
+      lo: the first record in the range.
+      hi: the record the range stops before (None for the end).
+
+    Returns:
+      TCPDumpView: an instance of the TCPDumpView class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if hi is None:
+      hi = len(records)
+    self.records = records
+    self.lo = lo
+    self.hi = max(lo, hi)
+
+  def Bounds(self):
+    """Returns (lo, hi) the part of the list this object covers."""
+    return (self.lo, self.hi)
+
+  def __len__(self):
+    return self.hi - self.lo
+
+  def __getitem__(self, key):
+    lo, hi = self.lo, self.hi
+    if isinstance(key, slice):
+      start, stop, step = key.indices(hi - lo)
+      if step != 1:
+        return self.records[lo + start:lo + stop:step]
+      return TCPDumpView(self.records, lo + start, lo + stop)
+    if key < 0:
+      key += hi - lo
+    if not 0 <= key < hi - lo:
+      raise IndexError('record index out of range')
+    return self.records[lo + key]
+
+  def __iter__(self):
+    return itertools.islice(self.records, self.lo, self.hi)
+
+  def __eq__(self, other):
+    return list(self) == list(other)
+
+  def __ne__(self, other):
+    return not self == other
+#END CLASS TCPDumpView
+
+
+class SequenceRanges(object):
+  """Sorted, non overlapping [start, end) ranges of sequence space.
+
+  Ranges that overlap or touch are merged so a flow that is sent in order is
+  a single range and adding to it is O(1).  Anything else is found with
+  bisect.
+
+  Attributes:
+    starts: sorted list of where each range starts.
+    ends: sorted list of where each range ends.
+  """
+
+  def __init__(self):
+    """Inits SequenceRanges with nothing covered.
+
+    Returns:
+      SequenceRanges: an instance of the SequenceRanges class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    self.starts = list()
+    self.ends = list()
+
+  def __len__(self):
+    return len(self.starts)
+
+  def Covered(self, start, end):
+    """Returns how much of [start, end) is already covered."""
+    starts = self.starts
+    ends = self.ends
+    lo = bisect.bisect_right(ends, start)
+    hi = bisect.bisect_left(starts, end)
+    covered = 0
+    for i in xrange(lo, hi):
+      covered += min(end, ends[i]) - max(start, starts[i])
+    return covered
+
+  def Add(self, start, end):
+    """Covers [start, end).
+
+    Args:
+      start: first sequence number.
+      end: sequence number after the last one.
+
+    Returns:
+      how much of [start, end) was already covered.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if end <= start:
+      return 0
+    starts = self.starts
+    ends = self.ends
+    if not starts or start > ends[-1]:
+      starts.append(start)
+      ends.append(end)
+      return 0
+    if start >= starts[-1]:
+      covered = max(0, min(end, ends[-1]) - start)
+      if end > ends[-1]:
+        ends[-1] = end
+      return covered
+    covered = self.Covered(start, end)
+    lo = bisect.bisect_left(ends, start)
+    hi = bisect.bisect_right(starts, end)
+    if lo < hi:
+      start = min(start, starts[lo])
+      end = max(end, ends[hi - 1])
+    starts[lo:hi] = [start]
+    ends[lo:hi] = [end]
+    return covered
+#END CLASS SequenceRanges
+
+
 class TCPDumpSet(object):
 
   def __init__(self, target):
     self.td_list = list()
+    self.offsets = list()
     if isinstance(target, list):
       for t in target:
         self.td_list.append(TCPDump(t))
+        self.offsets.append(0.0)
 
   def __del__(self):
     for td in self.td_list:
       del td
 
   def Start(self, src=None, dst=None, interface=config.DEFAULT_INTERFACE,
-            count=config.TCPDUMP_COUNT):
+            count=config.TCPDUMP_COUNT, bpf=None):
     length = len(self.td_list)
     if isinstance(src, list):
       assert len(src) == length
@@ -272,26 +1118,146 @@ class TCPDumpSet(object):
       count_list = count
     else:
       count_list = [count] * length
+    if isinstance(bpf, list):
+      assert len(bpf) == length
+      bpf_list = bpf
+    else:
+      bpf_list = [bpf] * length
 
     for i in range(0, length):
       self.td_list[i].Start(src_list[i], dst_list[i], interface_list[i],
-                            count_list[i])
+                            count_list[i], bpf_list[i])
 
   def Stop(self):
     for td in self.td_list:
       td.Stop()
 
   def Restart(self, src=None, dst=None, interface=config.DEFAULT_INTERFACE,
-              count=config.TCPDUMP_COUNT):
+              count=config.TCPDUMP_COUNT, bpf=None):
     self.Stop()
-    self.Start(src, dst, interface, count)
+    self.Start(src, dst, interface, count, bpf)
 
-  def Results(self):
+  def Results(self, processes=None):
+    """Returns the results of every host.
+
+    With processes the captures (or text) of all of the hosts are parsed at
+    the same time by a pool of that many processes (see ParseParallel) and
+    the records are TCPDumpColumns.  Live, rotating and summary captures are
+    not parsed here so they are always done one after the other.
+
+    Args:
+      processes: how many processes to parse with (None for one at a time).
+
+    Returns:
+      A list of TCPDumpResults (or TCPDumpSummary) in the order of td_list.
+
+    Raises:
+      ValueError: if a native capture is not a pcap or pcapng capture.
+    """
     results_list = list()
-    for td in self.td_list:
-      results_list.append(td.Results())
+    if not processes:
+      for td in self.td_list:
+        results_list.append(td.Results())
+      return results_list
+    parse = list()
+    for i, td in enumerate(self.td_list):
+      if td.live or td.rotate or td.summary:
+        results_list.append(td.Results())
+      else:
+        results_list.append(None)
+        parse.append(i)
+    parsed = ParseParallel([self.td_list[i].Data() for i in parse], processes)
+    for i, results in itertools.izip(parse, parsed):
+      results_list[i] = results
     return results_list
 
+  def ClockOffsets(self, samples=10):
+    """Estimates how far the clock of each host is off from ours.
+
+    See bash.Host.ClockOffset.  A host that never answers (or whose clock can
+    not be read) keeps its offset.
+
+    Args:
+      samples: how many round trips to time for each host.
+
+    Returns:
+      A list of the offsets (seconds each host's clock is ahead of ours).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    for i, td in enumerate(self.td_list):
+      estimate = td.host.ClockOffset(samples)
+      if estimate is not None:
+        self.offsets[i] = estimate[0]
+    return self.offsets
+
+  def Merge(self, results_list=None):
+    """Merges the records of every host into one time ordered view.
+
+    The records of each host are already in order so they are merged lazily
+    (heapq.merge) and nothing is copied.  The records themselves are left as
+    they are, the time stamp that orders them has the host's clock offset
+    (see ClockOffsets) taken out.
+
+    Simple usage:
+      tcp_set.ClockOffsets()
+      for time_stamp, i, record in tcp_set.Merge():
+        print time_stamp, tcp_set.td_list[i].host.host, record.src
+
+    Args:
+      results_list: the TCPDumpResults of each host (default Results()).
+
+    Returns:
+      An iterator of (time_stamp, host index, TCPDumpRecord) tuples.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if results_list is None:
+      results_list = self.Results()
+    assert len(results_list) == len(self.offsets)
+    return heapq.merge(*[TCPDumpSet.__Shifted(results.records, i, offset)
+                         for i, (results, offset) in
+                         enumerate(itertools.izip(results_list,
+                                                  self.offsets))])
+
+  def OneWayDelays(self, sender=0, receiver=1, results_list=None,
+                   zero_shift=False):
+    """Computes the one way delays and losses from one host to another.
+
+    See TCPDumpResults.OneWayDelays, the clock offsets between the two hosts
+    (see ClockOffsets) are taken out.
+
+    Args:
+      sender: the index of the host the packets were sent from.
+      receiver: the index of the host further along the path.
+      results_list: the TCPDumpResults of each host (default Results()).
+      zero_shift: should we adjust the output so that the first x value of
+        the sender's trace is 0.
+
+    Returns:
+      A tuple of dicts mapping (src, dst) to (x, y) lists of send time stamps
+      and one way delays and to lists of lost TCPDumpRecords.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if results_list is None:
+      results_list = self.Results()
+    return results_list[sender].OneWayDelays(
+        results_list[receiver],
+        self.offsets[receiver] - self.offsets[sender], zero_shift)
+
+  @staticmethod
+  def __Shifted(records, index, offset):
+    """Yields (time_stamp - offset, index, record) for each record."""
+    for record in records:
+      yield (record[0] - offset, index, record)
+
 
 class TCPDumpResults(object):
   """Class to simplify working with tcpdump results.
@@ -299,8 +1265,13 @@ class TCPDumpResults(object):
   This class takes care of parsing and performing simple calculations on the
   output from tcpdump traces.  Any assumptions about the output format are to be
   met by the collection methods in the TCPDump class.
+
+  Attributes:
+    EVENTS: the kinds of events Events finds.
   """
 
+  EVENTS = ('retransmission', 'spurious', 'dupack', 'reorder')
+
   def __init__(self, trace):
     """Inits TCPDumpResults with some tcpdump results.
 
@@ -320,90 +1291,1725 @@ class TCPDumpResults(object):
       No new exceptions generated here.
     """
     self.records = list()
+    self.flow_index = None
+    self.__indexed = 0
 
     self.trace = trace.splitlines()
-    self.trace.sort()
     self.__Parse()
 
-  def __Parse(self):
-    """Parse lines of tcpdump output.
+  @classmethod
+  def FromPcap(cls, data, udp=False, columnar=False):
+    """Makes a TCPDumpResults straight from a pcap or pcapng capture.
 
-    Take the lines of the tcpdump output (self.trace) and produce records that
-    are easier to work with.
+    The records are the same as the ones parsed from the text output (see
+    netlib.net.pcap.Decode) but there are no trace lines.  With columnar the
+    records go straight into a TCPDumpColumns without ever making a list.
+
+    Args:
+      data: the capture file contents (a string or an mmap).
+      udp: should UDP packets be included (with start and ack of None)?
+      columnar: should the records be kept in a TCPDumpColumns?
+
+    Returns:
+      TCPDumpResults: in instance of the TCPDumpResults class.
 
     Raises:
-      No exceptions handled here.
-      No new exceptions generated here.
+      ValueError: if data is not a pcap or pcapng capture.
     """
-    for line in self.trace:
-      l = line.split()
-      if len(l) >= 29 and l[1] == 'IP':
-        if l[21] == 'cksum':
-          if l[24] == 'ack':
-            start_tmp = None
-            ack_tmp = int(l[25])
-          elif l[25] == 'ack':
-            tmp = l[24].split(':')
-            start_tmp = int(tmp[0])
-            ack_tmp = int(l[26])
-          elif l[25] == 'win':
-            tmp = l[24].split(':')
-            start_tmp = int(tmp[0])
-            ack_tmp = None
-          else:
-            logging.debug('skipping line -- \"%s...\"', line)
-        elif l[22] == 'ack':
-          tmp = l[21].split(':')
-          start_tmp = int(tmp[0])
-          ack_tmp = int(l[23])
-        else:
-          logging.debug('skipping line -- \"%s...\"', line)
-          continue
-        self.records.append(TCPDumpRecord(time_stamp=float(l[0]),
-                                          id_num=int(l[7][:-1]),
-                                          length=int(l[16][:-1]),
-                                          src=l[17],
-                                          dst=l[19][:-1],
-                                          start=start_tmp,
-                                          ack=ack_tmp))
-      else:
-        logging.debug('skipping line -- \"%s...\"', line)
-
-  def Throughput(self, step=0.1, zero_shift=False):
-    """Computes the average throughput for this trace.
+    results = cls('')
+    if columnar:
+      results.records = pcap.Decode(data, udp=udp, out=TCPDumpColumns())
+      results.records.Sort()
+    else:
+      results.records = pcap.Decode(data, TCPDumpRecord, udp)
+      results.records.sort(key=operator.itemgetter(0))
+    return results
 
-    The throughput is calculated as the number of bits received for every step.
-    If zero_shift is true then we will also normalize everything so that the
-    trace begins at zero.  The units of throughput are Mbps.
+  @classmethod
+  def Parallel(cls, trace, processes=None, udp=False):
+    """Parses one big trace with a pool of processes (see ParseParallel).
 
     Args:
-      step: the size of the bin to use in calculating throughput (seconds).
-      zero_shift: should we adjust the output so that the first x value is 0.
+      trace: a pcap or pcapng capture or the text tcpdump -tt -v -n -S
+        prints (a string or an mmap).
+      processes: how many processes (default one per CPU).
+      udp: should UDP packets be included (captures only)?
 
     Returns:
-      (x, y): a tuple of lists for the timestamps and throughput values.
+      TCPDumpResults: with TCPDumpColumns records.
 
     Raises:
-      No exceptions handled here.
-      No new exceptions generated here.
+      ValueError: if trace looks like a capture but is not one.
     """
-    pkt_count = len(self.records)
-    conv = 8.0 / 1000000.0 / step  # Bytes per bin to Mbps
+    return ParseParallel([trace], processes, udp)[0]
+
+  @classmethod
+  def FromFile(cls, path, udp=False, columnar=False, start=None, end=None,
+               processes=None):
+    """Makes a TCPDumpResults from a local capture file (see FromPcap).
+
+    The file is mapped rather than read (see netlib.net.pcap.PcapFile) so a
+    capture much bigger than memory can be read, and with start or end only
+    the packets in that time range are decoded.  With processes the whole
+    file is decoded by a pool of processes (see ParseParallel), which share
+    the mapping, into TCPDumpColumns.
+
+    Args:
+      path: the capture file.
+      udp: should UDP packets be included (with start and ack of None)?
+      columnar: should the records be kept in a TCPDumpColumns?
+      start: the first time stamp to include (None for the first packet).
+      end: the time stamp to stop before (None for after the last packet).
+      processes: how many processes to decode with (None for just this one).
+
+    Returns:
+      TCPDumpResults: in instance of the TCPDumpResults class.
+
+    Raises:
+      IOError: if the file can not be opened.
+      ValueError: if the file is not a pcap or pcapng capture.
+    """
+    results = cls('')
+    capture = pcap.PcapFile(path, TCPDumpRecord, udp)
+    try:
+      if processes and start is None and end is None:
+        results.records = ParseParallel([capture.data], processes,
+                                        udp)[0].records
+        return results
+      if start is None and end is None:
+        lo, hi = 0, None
+      else:
+        lo, hi = capture.Range(start, end)
+      if columnar:
+        results.records = capture.Records(lo, hi, TCPDumpColumns())
+        results.records.Sort()
+      else:
+        results.records = capture.Records(lo, hi)
+        results.records.sort(key=operator.itemgetter(0))
+    finally:
+      capture.Close()
+    return results
+
+  def Columnar(self):
+    """Moves the records into a TCPDumpColumns to save memory.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if not isinstance(self.records, TCPDumpColumns):
+      self.records = TCPDumpColumns(self.records)
+
+  def IndexFlows(self):
+    """Builds the flow index (Flows and the Flow methods do this as needed).
+
+    self.flow_index maps (src, dst) to [array of record indexes, Bytes].  It
+    is rebuilt when the number of records changes; call this after changing
+    the records in any other way.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    index = dict()
+    if isinstance(self.records, TCPDumpColumns):
+      lo, hi = self.records.Bounds()
+      columns = self.records.columns
+      addresses = self.records.addresses
+      pairs = itertools.izip(itertools.islice(columns['src'], lo, hi),
+                             itertools.islice(columns['dst'], lo, hi),
+                             itertools.islice(columns['length'], lo, hi))
+      for i, (src, dst, length) in enumerate(pairs):
+        entry = index.get((src, dst))
+        if entry is None:
+          entry = index[(src, dst)] = [array.array('l'), 0]
+        entry[0].append(i)
+        entry[1] += length
+      index = dict(((addresses[src], addresses[dst]), entry)
+                   for (src, dst), entry in index.iteritems())
+    else:
+      for i, record in enumerate(self.records):
+        entry = index.get((record[3], record[4]))
+        if entry is None:
+          entry = index[(record[3], record[4])] = [array.array('l'), 0]
+        entry[0].append(i)
+        entry[1] += record[2]
+    self.flow_index = index
+    self.__indexed = len(self.records)
+
+  def __Index(self):
+    """Returns the flow index, building it if it is missing or stale."""
+    if self.flow_index is None or self.__indexed != len(self.records):
+      self.IndexFlows()
+    return self.flow_index
+
+  def Flows(self):
+    """Returns the totals for every flow.
+
+    Returns:
+      dict mapping (src, dst) to a TCPDumpFlow.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    return dict((key, self.Flow(*key)) for key in self.__Index())
+
+  def Flow(self, src, dst):
+    """Returns the totals for one flow.
+
+    Args:
+      src: source IP address and port ('10.0.0.1.41063').
+      dst: destination IP address and port.
+
+    Returns:
+      TCPDumpFlow or None if there are no packets from src to dst.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    index = self.__Index()
+    entry = index.get((src, dst))
+    if entry is None:
+      return None
+    indexes, size = entry
+    first = self.records[indexes[0]][0]
+    last = self.records[indexes[-1]][0]
+    start, end = first, last
+    reverse = index.get((dst, src))
+    if reverse is not None:
+      start = min(start, self.records[reverse[0][0]][0])
+      end = max(end, self.records[reverse[0][-1]][0])
+    duration = last - first
+    if duration > 0:
+      throughput = size * 8 / duration / 1000000.0
+    else:
+      throughput = 0.0
+    return TCPDumpFlow(src=src, dst=dst, packets=len(indexes), bytes=size,
+                       first=first, last=last, duration=duration,
+                       throughput=throughput, completion=end - start)
+
+  def FlowResults(self, src, dst):
+    """Returns the records of one flow as a TCPDumpResults of their own.
+
+    Any of the analysis can then be run on just that flow.
+
+    Args:
+      src: source IP address and port ('10.0.0.1.41063').
+      dst: destination IP address and port.
+
+    Returns:
+      TCPDumpResults: with only the records from src to dst (maybe none).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    results = TCPDumpResults('')
+    entry = self.__Index().get((src, dst))
+    if entry is not None:
+      records = self.records
+      results.records = [records[i] for i in entry[0]]
+    return results
+
+  def FlowThroughput(self, src, dst, step=0.1, zero_shift=False):
+    """Computes the throughput of one flow (see Throughput).
+
+    Args:
+      src: source IP address and port ('10.0.0.1.41063').
+      dst: destination IP address and port.
+      step: the size of the bin to use in calculating throughput (seconds).
+      zero_shift: should we adjust the output so that the first x value is 0.
+
+    Returns:
+      (x, y): a tuple of lists for the timestamps and throughput values.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    return self.FlowResults(src, dst).Throughput(step, zero_shift)
+
+  def RTTs(self, zero_shift=False):
+    """Computes round trip time samples for every flow.
+
+    Each data segment is matched to the first ACK that covers it.  An ACK
+    that moves the window gives one sample, the time since the newest segment
+    it covers was sent, so delayed ACKs do not add to the RTT.  Following
+    Karn's rule there is no sample from an ACK that covers a segment that was
+    sent more than once.  Sequence numbers are unwrapped so this works past
+    4 GBytes.  It is one pass over the records with an ordered queue of
+    outstanding segments per flow.
+
+    Args:
+      zero_shift: should we adjust the output so that the first x value of
+        the trace is 0.
+
+    Returns:
+      dict mapping the (src, dst) of the data to (x, y) lists of ACK time
+      stamps and RTTs in seconds.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    samples = self.__Scan(self.__RTTSamples)
+    if zero_shift and len(self.records):
+      zero = self.records[0][0]
+      for x, _ in samples.itervalues():
+        x[:] = [time_stamp - zero for time_stamp in x]
+    return samples
+
+  def FlowRTT(self, src, dst, zero_shift=False):
+    """Computes round trip time samples for one flow (see RTTs).
+
+    Only the packets of the flow and its ACKs are looked at (from the flow
+    index).
+
+    Args:
+      src: source IP address and port of the data ('10.0.0.1.41063').
+      dst: destination IP address and port of the data.
+      zero_shift: should we adjust the output so that the first x value of
+        the trace is 0.
+
+    Returns:
+      (x, y): lists of ACK time stamps and RTTs in seconds.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    index = self.__Index()
+    indexes = [index[key][0] for key in ((src, dst), (dst, src))
+               if key in index]
+    records = self.records
+    items = (operator.itemgetter(0, 3, 4, 5, 6, 7)(records[i])
+             for i in heapq.merge(*indexes))
+    x, y = self.__RTTSamples(items, None).get((src, dst), ([], []))
+    if zero_shift and len(records):
+      zero = records[0][0]
+      x = [time_stamp - zero for time_stamp in x]
+    return (x, y)
+
+  def RTTSummaries(self):
+    """Summarizes the round trip times of every flow (see RTTs).
+
+    Returns:
+      dict mapping the (src, dst) of the data to a TCPDumpRTT.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    summaries = dict()
+    for (src, dst), (_, y) in self.RTTs().iteritems():
+      if not y:
+        continue
+      y = sorted(y)
+      summaries[(src, dst)] = TCPDumpRTT(
+          src=src, dst=dst, samples=len(y), min=y[0], mean=stats.Mean(y),
+          median=stats.Percentile(y, 50), p90=stats.Percentile(y, 90),
+          p99=stats.Percentile(y, 99), max=y[-1], stdev=stats.StdDev(y))
+    return summaries
+
+  def __Scan(self, scan, fields=('time_stamp', 'src', 'dst', 'start', 'ack',
+                                  'end')):
+    """Runs a pass over some of the fields of every record.
+
+    Args:
+      scan: function taking tuples of the fields in time order and the value
+        used for a missing start, ack or end, and returning a dict keyed by
+        (src, dst).
+      fields: the names of the fields to pass to scan.
+
+    Returns:
+      the dict from scan (keyed by 'address.port' strings).
+    """
+    items, none, addresses = self.__Items(fields)
+    results = scan(items, none)
+    if addresses is None:
+      return results
+    return dict(((addresses[src], addresses[dst]), value)
+                for (src, dst), value in results.iteritems())
+
+  def __Items(self, fields):
+    """Returns tuples of some of the fields of every record (see __Scan).
+
+    Args:
+      fields: the names of the fields in each tuple.
+
+    Returns:
+      A tuple of the iterator of tuples, the value used for a missing field
+      and the list that src and dst index into (None if they are strings).
+    """
+    records = self.records
+    if not isinstance(records, TCPDumpColumns):
+      getter = operator.itemgetter(*[TCPDumpRecord._fields.index(name)
+                                     for name in fields])
+      return (itertools.imap(getter, records), None, None)
+    lo, hi = records.Bounds()
+    columns = list()
+    for name in fields:
+      column = itertools.islice(records.columns[name], lo, hi)
+      if (name in ('start', 'ack', 'end') and
+          TCPDumpColumns.SEQUENCE == 'd'):
+        # The scans do bit arithmetic on sequence numbers.
+        column = itertools.imap(int, column)
+      columns.append(column)
+    items = itertools.izip(*columns)
+    return (items, TCPDumpColumns.NONE, records.addresses)
+
+  def __RTTSamples(self, items, none):
+    """Matches segments to ACKs (see RTTs).
+
+    Args:
+      items: (time_stamp, src, dst, start, ack, end) tuples in time order.
+      none: the value used for a missing start, ack or end.
+
+    Returns:
+      dict mapping (src, dst) to (x, y) lists.
+    """
+    # (src, dst) -> [ends, times, retransmitted, head, high, acked, control]
+    # where the segments from head on have not been acked yet, high is the
+    # highest unwrapped end sent and control is where the last SYN or FIN
+    # (a segment with no data) was sent.
+    flows = dict()
+    samples = dict()
+    half = 0x80000000
+    bisect_right = bisect.bisect_right
+    for time_stamp, src, dst, start, ack, end in items:
+      if start != none:
+        state = flows.get((src, dst))
+        if state is None:
+          state = flows[(src, dst)] = [[], [], [], 0, start, start, None]
+        high = state[4]
+        # Unwrap relative to the highest end sent so far.
+        start = high + ((start - high + half) & 0xffffffff) - half
+        end = start + ((end - start) & 0xffffffff)
+        ends = state[0]
+        head = state[3]
+        if start < high or start == end == state[6]:
+          retransmitted = state[2]
+          if start == end:
+            first = bisect.bisect_left(ends, start, head)
+          else:
+            first = bisect_right(ends, start, head)
+          for i in xrange(first, bisect_right(ends, end, head)):
+            retransmitted[i] = True
+          if end > high:
+            ends.append(end)
+            state[1].append(time_stamp)
+            retransmitted.append(True)
+            state[4] = end
+        else:
+          ends.append(end)
+          state[1].append(time_stamp)
+          state[2].append(False)
+          state[4] = end
+          if start == end:
+            state[6] = end
+      if ack != none:
+        state = flows.get((dst, src))
+        if state is not None:
+          high = state[4]
+          ack = high + ((ack - high + half) & 0xffffffff) - half
+          if ack > state[5]:
+            state[5] = ack
+            ends, times, retransmitted, head = state[:4]
+            covered = bisect_right(ends, ack, head)
+            if covered > head:
+              if not any(retransmitted[head:covered]):
+                xy = samples.get((dst, src))
+                if xy is None:
+                  xy = samples[(dst, src)] = ([], [])
+                xy[0].append(time_stamp)
+                xy[1].append(time_stamp - times[covered - 1])
+              if covered > 4096 and covered * 2 > len(ends):
+                del ends[:covered]
+                del times[:covered]
+                del retransmitted[:covered]
+                covered = 0
+              state[3] = covered
+    return samples
+
+  def Events(self):
+    """Finds retransmissions, duplicate ACKs and reordering in every flow.
+
+    One pass over the records keeps the sequence space each flow has sent in
+    a SequenceRanges along with the highest ACK it has had back.  A segment
+    that overlaps what was already sent is a 'retransmission' and also
+    'spurious' if all of it had already been acked.  A segment below the
+    highest one sent that does not overlap anything sent is a 'reorder'.  An
+    ACK without data that repeats the last ACK while data is outstanding is a
+    'dupack' of the flow it is acking.
+
+    Returns:
+      dict mapping the (src, dst) of the data to a dict mapping each of
+      EVENTS to a list of time stamps.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    return self.__Scan(self.__EventScan)
+
+  def EventCounts(self, step=0.1, zero_shift=False):
+    """Counts the events of every flow in the bins Throughput uses.
+
+    The bins cover the whole trace (not just the flow) so they line up with
+    Throughput(step) for every flow.
+
+    Args:
+      step: the size of the bin (seconds).
+      zero_shift: should we adjust the output so that the first x value is 0.
+
+    Returns:
+      dict mapping the (src, dst) of the data to a dict mapping each of
+      EVENTS to (x, y) lists of the bin ends and the counts.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    counts = dict()
+    if not len(self.records):
+      return counts
+    first = self.records[0][0]
+    last = self.records[-1][0]
+    if zero_shift:
+      zero = first
+    else:
+      zero = 0
+    size = max(1, int(math.ceil((last - first) / step)))
+    x = [end - zero for end in self.__Ends(size, step, first, last)]
+    for key, events in self.Events().iteritems():
+      counts[key] = dict()
+      for name, time_stamps in events.iteritems():
+        y = [0] * size
+        for time_stamp in time_stamps:
+          index = int(math.ceil((time_stamp - first) / step)) - 1
+          y[min(max(index, 0), size - 1)] += 1
+        counts[key][name] = (list(x), y)
+    return counts
+
+  def __EventScan(self, items, none):
+    """Finds the events of every flow (see Events).
+
+    Args:
+      items: (time_stamp, src, dst, start, ack, end) tuples in time order.
+      none: the value used for a missing start, ack or end.
+
+    Returns:
+      dict mapping (src, dst) to a dict of lists of time stamps.
+    """
+    # (src, dst) -> [sent, high, acked, last_ack] where sent is a
+    # SequenceRanges of everything sent, high is the highest unwrapped end
+    # sent, acked is the highest ACK back and last_ack the last one.
+    flows = dict()
+    events = dict()
+    half = 0x80000000
+    for time_stamp, src, dst, start, ack, end in items:
+      if start != none:
+        state = flows.get((src, dst))
+        if state is None:
+          state = flows[(src, dst)] = [SequenceRanges(), start, start, None]
+          events[(src, dst)] = dict((name, list())
+                                    for name in TCPDumpResults.EVENTS)
+        high = state[1]
+        start = high + ((start - high + half) & 0xffffffff) - half
+        end = start + ((end - start) & 0xffffffff)
+        if end == start:
+          # A SYN or FIN takes up one sequence number.
+          end += 1
+        if state[0].Add(start, end):
+          events[(src, dst)]['retransmission'].append(time_stamp)
+          if end <= state[2]:
+            events[(src, dst)]['spurious'].append(time_stamp)
+        elif start < high:
+          events[(src, dst)]['reorder'].append(time_stamp)
+        if end > high:
+          state[1] = end
+      if ack != none:
+        state = flows.get((dst, src))
+        if state is not None:
+          high = state[1]
+          ack = high + ((ack - high + half) & 0xffffffff) - half
+          if start == none and ack == state[3] and ack < high:
+            events[(dst, src)]['dupack'].append(time_stamp)
+          state[3] = ack
+          if ack > state[2]:
+            state[2] = ack
+    return events
+
+  def Goodput(self, step=0.1, zero_shift=False):
+    """Computes the throughput and goodput of every flow side by side.
+
+    Throughput counts the IP length of every packet of the flow like
+    Throughput does.  Goodput only counts the TCP payload Bytes that cover
+    sequence space the flow had not sent before (kept in a SequenceRanges),
+    so headers, retransmissions and pure ACKs are left out.  The bins cover
+    the whole trace so they line up with Throughput(step) and EventCounts.
+
+    Args:
+      step: the size of the bin (seconds).
+      zero_shift: should we adjust the output so that the first x value is 0.
+
+    Returns:
+      dict mapping (src, dst) to (x, throughput, goodput, ratio) lists where
+      throughput and goodput are in Mbps and ratio is goodput / throughput
+      (None for a bin the flow sent nothing in).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    goodput = dict()
+    if not len(self.records):
+      return goodput
+    first = self.records[0][0]
+    last = self.records[-1][0]
+    if zero_shift:
+      zero = first
+    else:
+      zero = 0
+    size = max(1, int(math.ceil((last - first) / step)))
+    scan = lambda items, none: self.__GoodputScan(items, none, first, step,
+                                                  size)
+    bins = self.__Scan(scan, ('time_stamp', 'src', 'dst', 'start', 'end',
+                              'length'))
+    for key, (sizes, new, _, _) in bins.iteritems():
+      x, thr_y = self.Rates(sizes, step, first, last, zero)
+      _, good_y = self.Rates(new, step, first, last, zero)
+      ratio = [float(b) / a if a else None for a, b in zip(sizes, new)]
+      goodput[key] = (x, thr_y, good_y, ratio)
+    return goodput
+
+  def GoodputSummaries(self):
+    """Totals the throughput and goodput of every flow (see Goodput).
+
+    Returns:
+      dict mapping (src, dst) to a TCPDumpGoodput.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    summaries = dict()
+    if not len(self.records):
+      return summaries
+    first = self.records[0][0]
+    step = max(self.records[-1][0] - first, 1e-9)
+    scan = lambda items, none: self.__GoodputScan(items, none, first, step, 1)
+    bins = self.__Scan(scan, ('time_stamp', 'src', 'dst', 'start', 'end',
+                              'length'))
+    for (src, dst), (sizes, new, _, _) in bins.iteritems():
+      flow = self.Flow(src, dst)
+      if flow.duration > 0:
+        goodput = new[0] * 8 / flow.duration / 1000000.0
+      else:
+        goodput = 0.0
+      summaries[(src, dst)] = TCPDumpGoodput(
+          src=src, dst=dst, bytes=sizes[0], new_bytes=new[0],
+          duration=flow.duration, throughput=flow.throughput, goodput=goodput,
+          ratio=float(new[0]) / sizes[0])
+    return summaries
+
+  def __GoodputScan(self, items, none, first, step, size):
+    """Bins the Bytes and new sequence Bytes of every flow (see Goodput).
+
+    Args:
+      items: (time_stamp, src, dst, start, end, length) tuples in time order.
+      none: the value used for a missing start or end.
+      first: where the first bin starts.
+      step: the size of the bins.
+      size: the number of bins.
+
+    Returns:
+      dict mapping (src, dst) to [Bytes, new Bytes, sent, high] where the
+      first two are lists with one number per bin.
+    """
+    flows = dict()
+    half = 0x80000000
+    last = size - 1
+    ceil = math.ceil
+    for time_stamp, src, dst, start, end, length in items:
+      state = flows.get((src, dst))
+      if state is None:
+        state = flows[(src, dst)] = [[0] * size, [0] * size, SequenceRanges(),
+                                     None]
+      index = int(ceil((time_stamp - first) / step)) - 1
+      if index < 0:
+        index = 0
+      elif index > last:
+        index = last
+      state[0][index] += length
+      if start != none:
+        high = state[3]
+        if high is None:
+          high = start
+        start = high + ((start - high + half) & 0xffffffff) - half
+        end = start + ((end - start) & 0xffffffff)
+        if end > start:
+          state[1][index] += end - start - state[2].Add(start, end)
+        if end > high:
+          high = end
+        state[3] = high
+    return flows
+
+  def OneWayDelays(self, receiver, offset=0.0, zero_shift=False):
+    """Matches the packets of this trace to the same packets in another one.
+
+    The other trace is captured further along the path (with a TCPDumpSet).
+    A packet is the same packet if it has the same flow, IP id and starting
+    sequence number.  The receiver is hashed once (per flow, on an int made
+    from the IP id and sequence number) and then this trace is joined to it in
+    one pass, so it is linear in the number of packets.  A key that was seen
+    more than once (the IP id wraps) is matched in order.
+
+    A packet with no match is lost once a later packet of its flow made it
+    (so the packets still in flight when the receiver stopped are not), and
+    the packets sent before the receiver started are left out.  Flows where
+    most of the matched packets arrived before they were sent are going the
+    other way, so they are left out as well (swap the traces and the sign of
+    offset for those).
+
+    Args:
+      receiver: the TCPDumpResults captured further along the path.
+      offset: seconds the receiver's clock is ahead of ours (see
+        TCPDumpSet.ClockOffsets).
+      zero_shift: should we adjust the output so that the first x value of
+        the trace is 0.
+
+    Returns:
+      A tuple of two dicts.  The first maps (src, dst) to (x, y) lists of the
+      time stamps packets were sent and their one way delays in seconds.  The
+      second maps (src, dst) to lists of the TCPDumpRecords that were lost.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    delays = dict()
+    lost = dict()
+    if not len(self.records) or not len(receiver.records):
+      return (delays, lost)
+    arrivals = receiver.__Scan(TCPDumpResults.__Arrivals,
+                               ('time_stamp', 'src', 'dst', 'id_num', 'start'))
+    first = receiver.records[0][0] - offset
+    if zero_shift:
+      zero = self.records[0][0]
+    else:
+      zero = 0
+    items, none, addresses = self.__Items(('time_stamp', 'src', 'dst',
+                                           'id_num', 'start'))
+    names = dict()
+    missing = dict()
+    for index, (time_stamp, src, dst, id_num, start) in enumerate(items):
+      flow = (src, dst)
+      if addresses is not None:
+        name = names.get(flow)
+        if name is None:
+          name = names[flow] = (addresses[src], addresses[dst])
+        flow = name
+      waiting = arrivals.get(flow)
+      if waiting is None:
+        continue
+      if start != none:
+        key = (start + 1) << 17
+      else:
+        key = 0
+      if id_num != none:
+        key |= id_num + 1
+      arrival = waiting.pop(key, None)
+      if type(arrival) is list:
+        if len(arrival) > 1:
+          waiting[key] = arrival[1:]
+        arrival = arrival[0]
+      if arrival is None:
+        if time_stamp >= first:
+          flow_missing = missing.get(flow)
+          if flow_missing is None:
+            flow_missing = missing[flow] = list()
+          flow_missing.append(index)
+        continue
+      xy = delays.get(flow)
+      if xy is None:
+        xy = delays[flow] = ([], [])
+      xy[0].append(time_stamp - zero)
+      xy[1].append(arrival - offset - time_stamp)
+      flow_missing = missing.get(flow)
+      if flow_missing:
+        lost.setdefault(flow, []).extend(flow_missing)
+        del flow_missing[:]
+    for flow, (_, y) in delays.items():
+      if sum(1 for delay in y if delay < 0) * 2 > len(y):
+        del delays[flow]
+        lost.pop(flow, None)
+    records = self.records
+    for flow, indexes in lost.iteritems():
+      lost[flow] = [records[i] for i in indexes]
+    return (delays, lost)
+
+  @staticmethod
+  def __Arrivals(items, none):
+    """Hashes when each packet was captured (see OneWayDelays).
+
+    Args:
+      items: (time_stamp, src, dst, id_num, start) tuples in time order.
+      none: the value used for a missing id_num or start.
+
+    Returns:
+      dict mapping (src, dst) to a dict mapping the key of each packet to its
+      time stamp (or a list of them if the key was seen more than once).
+    """
+    flows = dict()
+    for time_stamp, src, dst, id_num, start in items:
+      waiting = flows.get((src, dst))
+      if waiting is None:
+        waiting = flows[(src, dst)] = dict()
+      if start != none:
+        key = (start + 1) << 17
+      else:
+        key = 0
+      if id_num != none:
+        key |= id_num + 1
+      seen = waiting.get(key)
+      if seen is None:
+        waiting[key] = time_stamp
+      elif type(seen) is list:
+        seen.append(time_stamp)
+      else:
+        waiting[key] = [seen, time_stamp]
+    return flows
+
+  @classmethod
+  def FromStream(cls, items, reorder=None, keep=True, columnar=False):
+    """Makes a TCPDumpResults from an iterator of lines or records.
+
+    Nothing but the records (and only if keep) is held on to, so this can read
+    a trace straight from a file or a pipe without the whole of it ever being
+    in memory.  See TCPDumpStream for the details.
+
+    Args:
+      items: iterable of tcpdump -tt -v -n -S lines and/or TCPDumpRecords.
+      reorder: how many records to hold back to put them in time order.
+      keep: should the records be kept?
+      columnar: should the records be kept in a TCPDumpColumns?
+
+    Returns:
+      TCPDumpResults: in instance of the TCPDumpResults class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    stream = TCPDumpStream(reorder=reorder, keep=keep, columnar=columnar)
+    stream.Feed(items)
+    return stream.Results()
+
+  @staticmethod
+  def ParseLine(line):
+    """Parses one line of tcpdump -tt -v -n -S output.
+
+    Args:
+      line: a line of the text tcpdump prints for a packet.
+
+    Returns:
+      TCPDumpRecord or None if the line is not a TCP packet we understand.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    l = line.split()
+    if len(l) < 29 or l[1] != 'IP':
+      return None
+    # The sequence numbers are printed as start:end(length).
+    if l[21] == 'cksum':
+      if l[24] == 'ack':
+        seq_tmp = None
+        ack_tmp = int(l[25])
+      elif l[25] == 'ack':
+        seq_tmp = l[24]
+        ack_tmp = int(l[26])
+      elif l[25] == 'win':
+        seq_tmp = l[24]
+        ack_tmp = None
+      else:
+        return None
+    elif l[22] == 'ack':
+      seq_tmp = l[21]
+      ack_tmp = int(l[23])
+    else:
+      return None
+    if seq_tmp is None:
+      start_tmp = end_tmp = None
+    else:
+      start_tmp, _, end_tmp = seq_tmp.partition(':')
+      start_tmp = int(start_tmp)
+      end_tmp = int(end_tmp.partition('(')[0])
+    return tuple.__new__(TCPDumpRecord, (float(l[0]), int(l[7][:-1]),
+                                         int(l[16][:-1]), l[17], l[19][:-1],
+                                         start_tmp, ack_tmp, end_tmp))
+
+  def __Parse(self):
+    """Parse lines of tcpdump output.
+
+    Take the lines of the tcpdump output (self.trace) and produce records that
+    are easier to work with.  The records are put in order by time stamp (the
+    lines are left as they were).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    parse = TCPDumpResults.ParseLine
+    for line in self.trace:
+      record = parse(line)
+      if record is None:
+        logging.debug('skipping line -- \"%s...\"', line)
+      else:
+        self.records.append(record)
+    self.records.sort(key=operator.itemgetter(0))
+
+  def Slice(self, start=None, end=None):
+    """Returns the part of the trace from start up to end.
+
+    The records are always kept in time order so the range is found with a
+    binary search on the time stamps rather than by looking at every record.
+    Nothing is copied, the records of the slice are a view of these ones (a
+    TCPDumpColumns slice or a TCPDumpView), and the slice is a TCPDumpResults
+    so Throughput, Flows, RTTs and the rest all work on it.
+
+    Args:
+      start: the first time stamp to include (None for the first record).
+      end: the time stamp to stop before (None for after the last record).
+
+    Returns:
+      TCPDumpResults: with the records from start up to end.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    records = self.records
+    count = len(records)
+    if start is None:
+      lo = 0
+    else:
+      lo = self.__Search(start, 0, count)
+    if end is None:
+      hi = count
+    else:
+      hi = self.__Search(end, lo, count)
+    results = TCPDumpResults('')
+    if isinstance(records, list):
+      results.records = TCPDumpView(records, lo, hi)
+    else:
+      results.records = records[lo:hi]
+    return results
+
+  def Window(self, offset, length):
+    """Returns length seconds of the trace starting offset seconds in.
+
+    Like Slice (a view, nothing is copied) but relative to the first record
+    like the x values of Throughput(zero_shift=True) are.
+
+    Args:
+      offset: seconds from the first record to the start of the window.
+      length: the size of the window (seconds).
+
+    Returns:
+      TCPDumpResults: with the records in the window.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if not len(self.records):
+      return self.Slice()
+    start = self.records[0][0] + offset
+    return self.Slice(start, start + length)
+
+  def __Search(self, time_stamp, lo, hi):
+    """Returns the first index from lo on with a time stamp >= time_stamp."""
+    records = self.records
+    if isinstance(records, TCPDumpColumns):
+      base = records.Bounds()[0]
+      return bisect.bisect_left(records.columns['time_stamp'], time_stamp,
+                                base + lo, base + hi) - base
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if records[mid][0] < time_stamp:
+        lo = mid + 1
+      else:
+        hi = mid
+    return lo
+
+  def Bins(self, step=0.1):
+    """Returns the Bytes in each bin Throughput(step) would use (a list)."""
+    if not len(self.records):
+      return list()
+    time_stamps, lengths = self.__Columns()
+    return self.__Bins(time_stamps, lengths, step)
+
+  def Throughput(self, step=0.1, zero_shift=False):
+    """Computes the average throughput for this trace.
+
+    The throughput is calculated as the number of bits received for every step.
+    If zero_shift is true then we will also normalize everything so that the
+    trace begins at zero.  The units of throughput are Mbps.
+
+    Bin k covers (first + k * step, first + (k + 1) * step] (the first bin also
+    holds the first packet) and x is the end of the bin.  Empty bins are
+    reported as 0.  The last bin usually ends after the last packet, so it is
+    reported at the time of the last packet and averaged over the part of the
+    bin up to it.
+
+    Args:
+      step: the size of the bin to use in calculating throughput (seconds).
+      zero_shift: should we adjust the output so that the first x value is 0.
+
+    Returns:
+      (x, y): a tuple of lists for the timestamps and throughput values.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    return self.Throughputs([step], zero_shift)[step]
+
+  def Throughputs(self, steps, zero_shift=False):
+    """Computes the throughput for several bin sizes at once.
+
+    The packets are only binned once at the smallest step (with numpy when it
+    is installed) and any step that is a whole multiple of it is made by
+    adding up those bins.  Other steps need a pass of their own.  See
+    Throughput for how the bins are laid out.
+
+    Args:
+      steps: list of bin sizes (seconds).
+      zero_shift: should we adjust the output so that the first x value is 0.
+
+    Returns:
+      dict mapping each step to an (x, y) tuple of lists.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    steps = sorted(set(steps))
+    results = dict()
+    if not len(self.records):
+      for step in steps:
+        results[step] = ([], [])
+      return results
+    time_stamps, lengths = self.__Columns()
+    first = time_stamps[0]
+    last = time_stamps[-1]
+    if zero_shift:
+      zero = first
+    else:
+      zero = 0
+    base = steps[0]
+    fine = None
+    for step in steps:
+      factor = int(round(step / base))
+      if abs(factor * base - step) <= 1e-9 * step:
+        if fine is None:
+          fine = self.__Bins(time_stamps, lengths, base)
+        bins = [sum(fine[i:i + factor]) for i in xrange(0, len(fine), factor)]
+      else:
+        bins = self.__Bins(time_stamps, lengths, step)
+      results[step] = self.Rates(bins, step, first, last, zero)
+    return results
+
+  @classmethod
+  def Rates(cls, bins, step, first, last, zero=0):
+    """Turns the Bytes in each bin into throughput.
+
+    Args:
+      bins: list of Bytes in each bin (see Throughput for the layout).
+      step: the size of the bins (seconds).
+      first: time stamp of the first packet.
+      last: time stamp of the last packet.
+      zero: subtracted from every x value.
+
+    Returns:
+      (x, y): a tuple of lists for the timestamps and throughput values.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    ends = cls.__Ends(len(bins), step, first, last)
+    conv = 8.0 / 1000000.0
+    x = [end - zero for end in ends]
     y = list()
-    x = list()
+    begin = first
+    for i, size in enumerate(bins):
+      y.append(size * conv / max(ends[i] - begin, step * 1e-9))
+      begin = ends[i]
+    return (x, y)
+
+  def ThroughputWindow(self, window, step=0.1, zero_shift=False):
+    """Computes the throughput over a sliding window.
+
+    Every step seconds (at the same x values as Throughput) this reports the
+    throughput over the last window seconds, or over the whole trace so far
+    while it is still shorter than the window.
+
+    Args:
+      window: the size of the window (seconds), a whole multiple of step.
+      step: how often to report (seconds).
+      zero_shift: should we adjust the output so that the first x value is 0.
+
+    Returns:
+      (x, y): a tuple of lists for the timestamps and throughput values.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    factor = int(round(window / step))
+    assert factor >= 1 and abs(factor * step - window) <= 1e-9 * window
+    if not len(self.records):
+      return ([], [])
+    time_stamps, lengths = self.__Columns()
+    first = time_stamps[0]
     if zero_shift:
-      zero = self.records[0].time_stamp
+      zero = first
     else:
       zero = 0
-    pos = self.records[0].time_stamp + step
-    tmp = list()
-    for i in range(0, pkt_count):
-      if self.records[i].time_stamp <= pos:
-        tmp.append(self.records[i].length)
+    bins = self.__Bins(time_stamps, lengths, step)
+    ends = self.__Ends(len(bins), step, first, time_stamps[-1])
+    total = [0]
+    for size in bins:
+      total.append(total[-1] + size)
+    conv = 8.0 / 1000000.0
+    x = list()
+    y = list()
+    for i in xrange(len(bins)):
+      lo = max(0, i + 1 - factor)
+      span = ends[i] - (first + lo * step)
+      x.append(ends[i] - zero)
+      y.append((total[i + 1] - total[lo]) * conv / max(span, step * 1e-9))
+    return (x, y)
+
+  def ThroughputEWMA(self, step=0.1, alpha=0.125, zero_shift=False):
+    """Computes an exponentially weighted moving average of the throughput.
+
+    Each value is alpha times the throughput of its bin (see Throughput) plus
+    1 - alpha times the previous value.
+
+    Args:
+      step: the size of the bin to use in calculating throughput (seconds).
+      alpha: weight of the newest bin (0.0 - 1.0).
+      zero_shift: should we adjust the output so that the first x value is 0.
+
+    Returns:
+      (x, y): a tuple of lists for the timestamps and throughput values.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    assert 0.0 < alpha <= 1.0
+    x, samples = self.Throughput(step, zero_shift)
+    y = list()
+    for sample in samples:
+      if y:
+        y.append(alpha * sample + (1.0 - alpha) * y[-1])
       else:
-        y.append(sum(tmp) * conv)
-        x.append(pos - zero)
-        tmp = [self.records[i].length]
-        pos += step
+        y.append(sample)
     return (x, y)
+
+  def __Columns(self):
+    """Returns (time_stamps, lengths) as numpy arrays if possible or lists."""
+    if isinstance(self.records, TCPDumpColumns):
+      return (self.records.Column('time_stamp'), self.records.Column('length'))
+    count = len(self.records)
+    if numpy is not None:
+      return (numpy.fromiter((x[0] for x in self.records), 'd', count),
+              numpy.fromiter((x[2] for x in self.records), 'l', count))
+    return ([x[0] for x in self.records], [x[2] for x in self.records])
+
+  def __Bins(self, time_stamps, lengths, step):
+    """Returns the Bytes in each bin of a (sorted) trace as a list."""
+    first = time_stamps[0]
+    count = max(1, int(math.ceil((time_stamps[-1] - first) / step)))
+    if numpy is not None:
+      time_stamps = numpy.asarray(time_stamps)
+      index = numpy.ceil((time_stamps - first) / step).astype(numpy.intp) - 1
+      numpy.clip(index, 0, count - 1, out=index)
+      bins = numpy.bincount(index, weights=numpy.asarray(lengths),
+                            minlength=count)
+      return [int(size) for size in bins]
+    bins = [0] * count
+    last = count - 1
+    ceil = math.ceil
+    for time_stamp, length in itertools.izip(time_stamps, lengths):
+      index = int(ceil((time_stamp - first) / step)) - 1
+      if index < 0:
+        index = 0
+      elif index > last:
+        index = last
+      bins[index] += length
+    return bins
+
+  @staticmethod
+  def __Ends(count, step, first, last):
+    """Returns where each of count bins ends (the last one at last)."""
+    ends = [first + (i + 1) * step for i in xrange(count)]
+    if last > first:
+      ends[-1] = min(ends[-1], last)
+    return ends
 #END CLASS TCPDumpResults
+
+
+class TCPDumpStream(object):
+  """Class to parse tcpdump output a line (or a record) at a time.
+
+  Records go through a small heap keyed on their time stamps before they are
+  counted, so packets that show up a little out of order (tcpdump on several
+  interfaces, merged captures) still come out in order.  A record that shows up
+  after reorder newer ones has already been let through is counted in late and
+  the kept records are sorted once at the end.
+
+  Totals are kept as the records go by so with keep=False the memory used does
+  not grow with the trace (other than the per flow totals and, with step, one
+  number per bin).
+
+  Attributes:
+    REORDER: default number of records held back to put them in order.
+    packets: number of records counted.
+    bytes: Bytes in the records counted.
+    first: earliest time stamp counted.
+    last: latest time stamp counted.
+    skipped: number of lines that were not TCP packets we understand.
+    late: number of records that came out of order despite the heap.
+    flows: maps (src, dst) to [packets, Bytes].
+    records: list or TCPDumpColumns of the records (None without keep).
+  """
+
+  REORDER = 1000
+
+  def __init__(self, reorder=None, keep=True, columnar=False, step=None):
+    """Inits TCPDumpStream.
+
+    Args:
+      reorder: how many records to hold back to put them in time order.
+      keep: should the records be kept?
+      columnar: should the records be kept in a TCPDumpColumns?
+      step: bin size (seconds) to keep a running throughput with.
+
+    Returns:
+      TCPDumpStream: an instance of the TCPDumpStream class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if reorder is None:
+      reorder = TCPDumpStream.REORDER
+    assert reorder >= 0
+    self.reorder = reorder
+    self.step = step
+    if not keep:
+      self.records = None
+    elif columnar:
+      self.records = TCPDumpColumns()
+    else:
+      self.records = list()
+    self.buffer = list()
+    self.sequence = 0
+    self.released = None
+    self.origin = None
+    self.bins = list()
+    self.packets = 0
+    self.bytes = 0
+    self.first = None
+    self.last = None
+    self.skipped = 0
+    self.late = 0
+    self.flows = dict()
+
+  def Add(self, item):
+    """Adds a line of tcpdump -tt -v -n -S output or a record.
+
+    Args:
+      item: a line (str) or a TCPDumpRecord (or a tuple with the same fields).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    self.Feed((item,))
+
+  def Feed(self, items):
+    """Adds each of an iterable of lines or records (see Add).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    parse = TCPDumpResults.ParseLine
+    push = heapq.heappush
+    pushpop = heapq.heappushpop
+    release = self.__Release
+    buffer = self.buffer
+    reorder = self.reorder
+    sequence = self.sequence
+    for item in items:
+      if isinstance(item, basestring):
+        record = parse(item)
+        if record is None:
+          self.skipped += 1
+          continue
+      elif isinstance(item, TCPDumpRecord):
+        record = item
+      else:
+        record = TCPDumpRecord(*item)
+      # The sequence number keeps records with the same time stamp in order.
+      sequence += 1
+      if len(buffer) < reorder:
+        push(buffer, (record[0], sequence, record))
+      else:
+        release(pushpop(buffer, (record[0], sequence, record))[2])
+    self.sequence = sequence
+
+  def Flush(self):
+    """Counts every record still held back in the heap."""
+    while self.buffer:
+      self.__Release(heapq.heappop(self.buffer)[2])
+
+  def __Release(self, record):
+    """Counts (and keeps) a record that has come out of the heap."""
+    time_stamp = record[0]
+    length = record[2]
+    if self.released is None:
+      self.released = self.origin = self.first = self.last = time_stamp
+    elif time_stamp < self.released:
+      self.late += 1
+      self.first = min(self.first, time_stamp)
+    else:
+      self.released = self.last = time_stamp
+    self.packets += 1
+    self.bytes += length
+    flow = self.flows.get((record[3], record[4]))
+    if flow is None:
+      flow = self.flows[(record[3], record[4])] = [0, 0]
+    flow[0] += 1
+    flow[1] += length
+    if self.step:
+      # Same bins as TCPDumpResults.Throughput.
+      index = max(0, int(math.ceil((time_stamp - self.origin) /
+                                   self.step)) - 1)
+      if index >= len(self.bins):
+        self.bins.extend([0] * (index + 1 - len(self.bins)))
+      self.bins[index] += length
+    if self.records is not None:
+      self.records.append(record)
+
+  def Throughput(self, zero_shift=False):
+    """Computes the throughput from the running bins (needs step).
+
+    This matches TCPDumpResults.Throughput(step) for the same records unless
+    a late record came before the first one counted (it is put in the first
+    bin).  Records still in the heap are not counted until Flush.
+
+    Args:
+      zero_shift: should we adjust the output so that the first x value is 0.
+
+    Returns:
+      (x, y): a tuple of lists for the timestamps and throughput values.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    assert self.step
+    if not self.bins:
+      return ([], [])
+    if zero_shift:
+      zero = self.origin
+    else:
+      zero = 0
+    return TCPDumpResults.Rates(self.bins, self.step, self.origin, self.last,
+                                zero)
+
+  def Results(self):
+    """Flushes the heap and returns the kept records as a TCPDumpResults.
+
+    Returns:
+      TCPDumpResults: with the records in time order (none without keep).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    self.Flush()
+    results = TCPDumpResults('')
+    if self.records is not None:
+      if self.late:
+        if isinstance(self.records, TCPDumpColumns):
+          self.records.Sort()
+        else:
+          self.records.sort(key=operator.itemgetter(0))
+      results.records = self.records
+    return results
+#END CLASS TCPDumpStream
+
+
+class TCPDumpSummary(object):
+  """Class for a compact summary of a capture made where it was captured.
+
+  The summary has the totals of every flow, the Bytes in each bin of the
+  throughput and optionally every sample-th record.  Pack turns it into a few
+  KBytes of compressed binary (packed in network order so it does not matter
+  what the two hosts are) and Unpack turns that back into a TCPDumpSummary.
+
+  Attributes:
+    MAGIC: the first four Bytes of a packed summary.
+    CODES: maps each field to its struct code in a packed summary (the same
+      on every machine, whatever TCPDumpColumns.SEQUENCE is).
+    step: the size of the throughput bins (seconds).
+    sample: every sample-th record was kept (0 for none).
+    first: time stamp of the first packet.
+    last: time stamp of the last packet.
+    bins: list of Bytes in each bin (see TCPDumpResults.Throughput).
+    flows: maps (src, dst) to (packets, bytes, first, last).
+    samples: TCPDumpResults with the sampled records (in columns).
+  """
+
+  MAGIC = 'NLS1'
+  CODES = {'time_stamp': 'd', 'id_num': 'l', 'length': 'l', 'src': 'l',
+           'dst': 'l', 'start': 'q', 'ack': 'q', 'end': 'q'}
+
+  def __init__(self, step=0.1, sample=0):
+    """Inits an empty TCPDumpSummary.
+
+    Args:
+      step: the size of the throughput bins (seconds).
+      sample: keep every sample-th record (0 for none).
+
+    Returns:
+      TCPDumpSummary: an instance of the TCPDumpSummary class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    self.step = step
+    self.sample = sample
+    self.first = None
+    self.last = None
+    self.bins = list()
+    self.flows = dict()
+    self.samples = TCPDumpResults('')
+    self.samples.records = TCPDumpColumns()
+
+  @classmethod
+  def FromResults(cls, results, step=0.1, sample=0):
+    """Summarizes a TCPDumpResults.
+
+    Args:
+      results: the TCPDumpResults to summarize.
+      step: the size of the throughput bins (seconds).
+      sample: keep every sample-th record (0 for none).
+
+    Returns:
+      TCPDumpSummary: an instance of the TCPDumpSummary class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    summary = cls(step, sample)
+    if not len(results.records):
+      return summary
+    summary.first = results.records[0][0]
+    summary.last = results.records[-1][0]
+    summary.bins = results.Bins(step)
+    for key, flow in results.Flows().iteritems():
+      summary.flows[key] = (flow.packets, flow.bytes, flow.first, flow.last)
+    if sample:
+      summary.samples.records.extend(itertools.islice(results.records, 0, None,
+                                                      sample))
+    return summary
+
+  def Throughput(self, zero_shift=False):
+    """Computes the throughput from the bins (see TCPDumpResults.Throughput).
+
+    Args:
+      zero_shift: should we adjust the output so that the first x value is 0.
+
+    Returns:
+      (x, y): a tuple of lists for the timestamps and throughput values.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if not self.bins:
+      return ([], [])
+    if zero_shift:
+      zero = self.first
+    else:
+      zero = 0
+    return TCPDumpResults.Rates(self.bins, self.step, self.first, self.last,
+                                zero)
+
+  def Flows(self):
+    """Returns the totals for every flow.
+
+    Returns:
+      dict mapping (src, dst) to a TCPDumpFlow.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    flows = dict()
+    for (src, dst), (packets, size, first, last) in self.flows.iteritems():
+      start, end = first, last
+      if (dst, src) in self.flows:
+        start = min(start, self.flows[(dst, src)][2])
+        end = max(end, self.flows[(dst, src)][3])
+      duration = last - first
+      if duration > 0:
+        throughput = size * 8 / duration / 1000000.0
+      else:
+        throughput = 0.0
+      flows[(src, dst)] = TCPDumpFlow(src=src, dst=dst, packets=packets,
+                                      bytes=size, first=first, last=last,
+                                      duration=duration, throughput=throughput,
+                                      completion=end - start)
+    return flows
+
+  def Pack(self):
+    """Returns the summary as a compressed binary string.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    columns = self.samples.records
+    addresses = list(columns.addresses)
+    index = dict((address, i) for i, address in enumerate(addresses))
+    for key in self.flows:
+      for address in key:
+        if address not in index:
+          index[address] = len(addresses)
+          addresses.append(address)
+    count = len(columns)
+    out = [struct.pack('!4sdddLLLLL', TCPDumpSummary.MAGIC, self.step,
+                       self.first or 0.0, self.last or 0.0, self.sample,
+                       len(self.bins), len(self.flows), len(addresses),
+                       count)]
+    out.append(struct.pack('!%dQ' % len(self.bins), *self.bins))
+    for (src, dst), (packets, size, first, last) in self.flows.iteritems():
+      out.append(struct.pack('!LLQQdd', index[src], index[dst], packets, size,
+                             first, last))
+    names = '\0'.join(addresses)
+    out.append(struct.pack('!L', len(names)) + names)
+    for name, _ in TCPDumpColumns.FIELDS:
+      code = TCPDumpSummary.CODES[name]
+      values = columns.Column(name).tolist()
+      if code == 'q':
+        values = [int(x) for x in values]
+      out.append(struct.pack('!%d%s' % (count, code), *values))
+    return zlib.compress(''.join(out))
+
+  @classmethod
+  def Unpack(cls, data):
+    """Makes a TCPDumpSummary from the output of Pack.
+
+    Args:
+      data: the string from Pack.
+
+    Returns:
+      TCPDumpSummary: an instance of the TCPDumpSummary class.
+
+    Raises:
+      ValueError: if data is not a packed summary.
+    """
+    try:
+      data = zlib.decompress(data)
+    except zlib.error:
+      raise ValueError('not a packed TCPDumpSummary')
+    header = struct.Struct('!4sdddLLLLL')
+    if len(data) < header.size or data[:4] != TCPDumpSummary.MAGIC:
+      raise ValueError('not a packed TCPDumpSummary')
+    (_, step, first, last, sample, bins, flows, names,
+     count) = header.unpack_from(data, 0)
+    summary = cls(step, int(sample))
+    pos = header.size
+    summary.bins = list(struct.unpack_from('!%dQ' % bins, data, pos))
+    pos += 8 * bins
+    flow_list = list()
+    for _ in xrange(flows):
+      flow_list.append(struct.unpack_from('!LLQQdd', data, pos))
+      pos += 40
+    size = struct.unpack_from('!L', data, pos)[0]
+    pos += 4
+    addresses = data[pos:pos + size].split('\0')
+    pos += size
+    for src, dst, packets, size, flow_first, flow_last in flow_list:
+      summary.flows[(addresses[src], addresses[dst])] = (
+          packets, size, flow_first, flow_last)
+    if bins or flows:
+      summary.first = first
+      summary.last = last
+    columns = summary.samples.records
+    for name, typecode in TCPDumpColumns.FIELDS:
+      code = TCPDumpSummary.CODES[name]
+      values = struct.unpack_from('!%d%s' % (count, code), data, pos)
+      pos += struct.calcsize('!' + code) * count
+      columns.columns[name] = array.array(typecode, values)
+    if count:
+      columns.addresses = addresses
+    return summary
+#END CLASS TCPDumpSummary
+
+
+# The traces being parsed by ParseParallel.  Worker processes are forked with
+# them so they are never pickled.
+__worker_traces = None
+__worker_udp = False
+
+
+def ParseParallel(traces, processes=None, udp=False):
+  """Parses several traces (or one big one) with a pool of processes.
+
+  Each trace is split into chunks of whole packets (see pcap.Chunks) or whole
+  lines, about two per process over all of the traces so the processes stay
+  busy even when the traces differ in size, and every chunk is parsed into a
+  TCPDumpColumns by one of the processes.  Only the parsed columns (see
+  TCPDumpColumns.Save) are sent back, then the chunks of each trace are
+  joined in order and sorted by time stamp (which costs one pass when they
+  are in order already).
+
+  Args:
+    traces: list of pcap or pcapng captures or the text tcpdump -tt -v -n -S
+      prints (strings or mmaps).
+    processes: how many processes (default one per CPU, 1 parses here).
+    udp: should UDP packets be included (captures only)?
+
+  Returns:
+    list of TCPDumpResults with TCPDumpColumns records, one per trace.
+
+  Raises:
+    ValueError: if a trace looks like a capture but is not one.
+  """
+  if processes is None:
+    processes = multiprocessing.cpu_count()
+  total = sum(len(trace) for trace in traces) or 1
+  tasks = list()
+  for index, trace in enumerate(traces):
+    count = max(1, int(round(2.0 * processes * len(trace) / total)))
+    if pcap.IsCapture(trace):
+      chunks = pcap.Chunks(trace, count)
+    else:
+      chunks = __LineChunks(trace, count)
+    tasks.extend((index, start, stop) for start, stop in chunks)
+  __InitWorker(traces, udp)
+  try:
+    if processes > 1 and len(tasks) > 1:
+      pool = multiprocessing.Pool(min(processes, len(tasks)), __InitWorker,
+                                  (traces, udp))
+      try:
+        parts = pool.map(__SaveChunk, tasks, chunksize=1)
+      finally:
+        pool.close()
+        pool.join()
+      parts = [TCPDumpColumns.Load(cStringIO.StringIO(part))
+               for part in parts]
+    else:
+      parts = [__ParseChunk(task) for task in tasks]
+  finally:
+    __InitWorker(None, False)
+  results_list = list()
+  for _ in traces:
+    results = TCPDumpResults('')
+    results.records = TCPDumpColumns()
+    results_list.append(results)
+  for (index, _, _), part in itertools.izip(tasks, parts):
+    results_list[index].records.AppendColumns(part)
+  for results in results_list:
+    results.records.Sort()
+  return results_list
+
+
+def __LineChunks(trace, count):
+  """Splits text into about count (start, stop) ranges of whole lines."""
+  size = len(trace)
+  target = max(1, size // count)
+  chunks = list()
+  start = 0
+  for i in xrange(1, count):
+    stop = trace.find('\n', max(start, i * target)) + 1
+    if stop <= 0:
+      break
+    if stop > start:
+      chunks.append((start, stop))
+      start = stop
+  chunks.append((start, size))
+  return chunks
+
+
+def __InitWorker(traces, udp):
+  """Hands the traces to a worker (or this process) for __ParseChunk."""
+  global __worker_traces, __worker_udp
+  __worker_traces = traces
+  __worker_udp = udp
+
+
+def __ParseChunk(task):
+  """Parses one (index, start, stop) chunk of a trace into TCPDumpColumns."""
+  index, start, stop = task
+  trace = __worker_traces[index]
+  columns = TCPDumpColumns()
+  if pcap.IsCapture(trace):
+    pcap.Decode(trace, udp=__worker_udp, out=columns,
+                packets=pcap.Packets(trace, start, stop))
+  else:
+    parse = TCPDumpResults.ParseLine
+    for line in trace[start:stop].splitlines():
+      record = parse(line)
+      if record is not None:
+        columns.append(record)
+  columns.Sort()
+  return columns
+
+
+def __SaveChunk(task):
+  """Parses a chunk in a worker and returns it saved (see __ParseChunk)."""
+  out = cStringIO.StringIO()
+  __ParseChunk(task).Save(out)
+  return out.getvalue()
+
+
+def Main(argv):
+  """Summarizes a capture for TCPDump(summary=True).
+
+  The capture is read from the file named on the command line (or stdin) and
+  the packed TCPDumpSummary is written to stdout base64 encoded so it makes it
+  back through the shell.
+  """
+  parser = optparse.OptionParser(usage='%prog [-s step] [-n sample] [file]')
+  parser.add_option('-s', dest='step', type='float', default=0.1)
+  parser.add_option('-n', dest='sample', type='int', default=0)
+  (opts, args) = parser.parse_args(argv)
+  if args:
+    capture = open(args[0], 'rb')
+  else:
+    capture = sys.stdin
+  results = TCPDumpResults.FromPcap(capture.read(), columnar=True)
+  summary = TCPDumpSummary.FromResults(results, opts.step, opts.sample)
+  sys.stdout.write(base64.b64encode(summary.Pack()))
+
+
+if __name__ == '__main__':
+  Main(sys.argv[1:])
@@ -0,0 +1,157 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks for reading traces and computing throughput.
+
+Benchmark builds a bulk transfer trace of the given number of packets both as
+a pcap capture and as the text tcpdump -tt -v -n -S prints for it, then times
+TCPDumpResults on the text and TCPDumpResults.FromStream on the lines of it
+against TCPDumpResults.FromPcap on the capture.
+
+BenchmarkThroughput fills a TCPDumpColumns with the given number of packets and
+times Throughput once per step against Throughputs for all of the steps at
+once, with numpy (if it is installed) and without.
+
+BenchmarkParallel times ParseParallel on the same capture and text with one
+process up to one per CPU.
+
+Usage:
+  python -m netlib.net.tcpdump_bench [packets]
+  python -m netlib.net.tcpdump_bench throughput [packets]
+  python -m netlib.net.tcpdump_bench parallel [packets]
+"""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import array
+import cStringIO
+import multiprocessing
+import sys
+import time
+
+from netlib.net import pcap_test
+from netlib.net import tcpdump
+
+
+def Benchmark(count=1000000):
+  """Returns a dictionary of seconds taken by each path."""
+  packets, text = pcap_test.Transfer(count)
+  capture = pcap_test.Pcap(packets)
+  del packets
+  results = dict()
+  start = time.time()
+  parsed = tcpdump.TCPDumpResults(text)
+  results['text'] = time.time() - start
+  del parsed
+  start = time.time()
+  parsed = tcpdump.TCPDumpResults.FromStream(cStringIO.StringIO(text))
+  results['stream'] = time.time() - start
+  assert len(parsed.records) == count
+  del parsed
+  start = time.time()
+  parsed = tcpdump.TCPDumpResults.FromPcap(capture)
+  results['pcap'] = time.time() - start
+  assert len(parsed.records) == count
+  return results
+
+
+def BenchmarkThroughput(count=10000000, steps=(0.001, 0.01, 0.1, 1.0)):
+  """Returns a dictionary of seconds taken by each way of binning."""
+  columns = tcpdump.TCPDumpColumns()
+  # About 100 seconds of full sized packets with a little jitter.
+  columns.columns['time_stamp'] = array.array(
+      'd', (1328812345.0 + i * 0.00001 + (i * 7919 % 100) * 1e-7
+            for i in xrange(count)))
+  columns.columns['length'] = array.array('i', [1500]) * count
+  for name in ('id_num', 'src', 'dst'):
+    columns.columns[name] = array.array('i', [0]) * count
+  for name in ('start', 'ack'):
+    columns.columns[name] = array.array(tcpdump.TCPDumpColumns.SEQUENCE,
+                                        [0]) * count
+  columns.addresses = ['10.0.0.1.41063']
+  results = tcpdump.TCPDumpResults('')
+  results.records = columns
+  numpy = tcpdump.numpy
+  timings = dict()
+  for backend in ('numpy', 'python'):
+    if backend == 'numpy' and numpy is None:
+      continue
+    if backend == 'python':
+      tcpdump.numpy = None
+    try:
+      start = time.time()
+      for step in steps:
+        results.Throughput(step)
+      timings['%s one step at a time' % backend] = time.time() - start
+      start = time.time()
+      results.Throughputs(steps)
+      timings['%s all steps at once' % backend] = time.time() - start
+    finally:
+      tcpdump.numpy = numpy
+  return timings
+
+
+def BenchmarkParallel(count=1000000, processes=None):
+  """Returns a dictionary of seconds taken by each number of processes."""
+  if processes is None:
+    processes = multiprocessing.cpu_count()
+  packets, text = pcap_test.Transfer(count)
+  capture = pcap_test.Pcap(packets)
+  del packets
+  results = dict()
+  n = 1
+  while True:
+    for name, trace in (('pcap', capture), ('text', text)):
+      start = time.time()
+      parsed = tcpdump.TCPDumpResults.Parallel(trace, n)
+      results[(name, n)] = time.time() - start
+      assert len(parsed.records) == count
+      del parsed
+    if n >= processes:
+      break
+    n = min(n * 2, processes)
+  return results
+
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1 and sys.argv[1] == 'parallel':
+    if len(sys.argv) > 2:
+      bench_count = int(sys.argv[2])
+    else:
+      bench_count = 1000000
+    bench_results = BenchmarkParallel(bench_count)
+    for name, n in sorted(bench_results):
+      seconds = bench_results[(name, n)]
+      print '%-4s %3d processes %8.2f s %5.2fx' % (
+          name, n, seconds, bench_results[(name, 1)] / seconds)
+    sys.exit(0)
+  if len(sys.argv) > 1 and sys.argv[1] == 'throughput':
+    if len(sys.argv) > 2:
+      bench_count = int(sys.argv[2])
+    else:
+      bench_count = 10000000
+    bench_results = BenchmarkThroughput(bench_count)
+    for name in sorted(bench_results):
+      print '%-28s %8.2f s' % (name, bench_results[name])
+    sys.exit(0)
+  if len(sys.argv) > 1:
+    bench_count = int(sys.argv[1])
+  else:
+    bench_count = 1000000
+  bench_results = Benchmark(bench_count)
+  for name in sorted(bench_results):
+    print '%-8s %8.2f s %10.0f pkts/s' % (name, bench_results[name],
+                                         bench_count / bench_results[name])
@@ -0,0 +1,234 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keeps parsed traces on disk so the same capture is only parsed once.
+
+  TCPDumpCache: Class that maps captures to their parsed TCPDumpColumns.
+
+A capture (pcap or the text tcpdump prints) is looked up by a hash of its
+contents and of the version of the parser, so changing either one is a miss.
+The parsed records are kept as TCPDumpColumns (see TCPDumpColumns.Save) which
+are read back with one read per column.  The least recently used traces are
+removed once the cache is bigger than its size limit.
+
+Simple object usage:
+  cache = TCPDumpCache()
+  results = cache.Results(open('trace.pcap', 'rb').read())
+  thr_x, thr_y = results.Throughput(step=0.25)
+"""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import hashlib
+import logging
+import os
+import tempfile
+
+from netlib import config
+from netlib.net import pcap
+from netlib.net import tcpdump
+
+
+class TCPDumpCache(object):
+  """Class that maps captures to their parsed TCPDumpColumns.
+
+  Attributes:
+    VERSION: bump this whenever parsing a capture gives different records.
+    SUFFIX: the file name ending of the traces in the cache.
+    PATH: the directory used if config has no TRACE_CACHE_DIR.
+    SIZE: the most Bytes kept if config has no TRACE_CACHE_SIZE.
+    path: the directory the traces are kept in.
+    size: the most Bytes of traces to keep.
+  """
+
+  VERSION = 1
+  SUFFIX = '.columns'
+  PATH = '/tmp/netlib-trace-cache'
+  SIZE = 1024 * 1024 * 1024
+
+  def __init__(self, path=None, size=None):
+    """Inits TCPDumpCache with a directory (which is made if need be).
+
+    The defaults come from config when it has them, as a config made from an
+    older configExample may not.
+
+    Args:
+      path: the directory the traces are kept in (None for the default).
+      size: the most Bytes of traces to keep (None for the default).
+
+    Returns:
+      TCPDumpCache: an instance of the TCPDumpCache class.
+
+    Raises:
+      No exceptions handled here.
+      OSError: if the directory can not be made.
+    """
+    if path is None:
+      path = getattr(config, 'TRACE_CACHE_DIR', TCPDumpCache.PATH)
+    if size is None:
+      size = getattr(config, 'TRACE_CACHE_SIZE', TCPDumpCache.SIZE)
+    self.path = path
+    self.size = size
+    if not os.path.isdir(path):
+      os.makedirs(path)
+
+  def Key(self, data, udp=False):
+    """Returns the key for a capture.
+
+    Args:
+      data: the capture (pcap or text).
+      udp: is UDP kept (see TCPDumpResults.FromPcap)?
+
+    Returns:
+      A hex string.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    # md5 is plenty for telling captures apart and hashes over twice as fast
+    # as sha1, which matters as it is most of the time taken by a hit.
+    digest = hashlib.md5('%d %s %d\n' % (TCPDumpCache.VERSION,
+                                         tcpdump.TCPDumpColumns.LAYOUT,
+                                         bool(udp)))
+    digest.update(data)
+    return digest.hexdigest()
+
+  def __File(self, key):
+    """Returns the path of the trace for a key."""
+    return os.path.join(self.path, key + TCPDumpCache.SUFFIX)
+
+  def Get(self, key):
+    """Returns the cached results for a key.
+
+    Args:
+      key: see Key.
+
+    Returns:
+      TCPDumpResults with TCPDumpColumns records or None if it is not cached.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    name = self.__File(key)
+    try:
+      infile = open(name, 'rb')
+    except IOError:
+      return None
+    try:
+      try:
+        columns = tcpdump.TCPDumpColumns.Load(infile)
+      except ValueError, e:
+        logging.warn('dropping %s from the cache -- %s', name, e)
+        self.__Remove(name)
+        return None
+    finally:
+      infile.close()
+    # The modification time is when it was last used (see Evict).
+    os.utime(name, None)
+    results = tcpdump.TCPDumpResults('')
+    results.records = columns
+    return results
+
+  def Put(self, key, results):
+    """Adds results to the cache (and evicts older ones if need be).
+
+    Args:
+      key: see Key.
+      results: TCPDumpResults (the records are stored as TCPDumpColumns).
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    records = results.records
+    if not isinstance(records, tcpdump.TCPDumpColumns):
+      records = tcpdump.TCPDumpColumns(records)
+    # Written to a temporary file first so a reader never sees half of it.
+    handle, name = tempfile.mkstemp(dir=self.path)
+    out = os.fdopen(handle, 'wb')
+    try:
+      records.Save(out)
+    finally:
+      out.close()
+    os.rename(name, self.__File(key))
+    self.Evict()
+
+  def Results(self, data, udp=False):
+    """Returns the results for a capture, parsing it only if it is not cached.
+
+    Args:
+      data: the capture (pcap or the text tcpdump -tt -v -n -S prints).
+      udp: should UDP be kept (pcap only, see TCPDumpResults.FromPcap)?
+
+    Returns:
+      TCPDumpResults with TCPDumpColumns records.
+
+    Raises:
+      ValueError: if data looks like a capture file but is not one.
+    """
+    key = self.Key(data, udp)
+    results = self.Get(key)
+    if results is not None:
+      return results
+    if pcap.IsCapture(data):
+      results = tcpdump.TCPDumpResults.FromPcap(data, udp, columnar=True)
+    else:
+      results = tcpdump.TCPDumpResults(data)
+      results.Columnar()
+    self.Put(key, results)
+    return results
+
+  def Evict(self):
+    """Removes the least recently used traces until the cache fits its size.
+
+    Returns:
+      The number of traces removed.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    traces = list()
+    total = 0
+    for name in os.listdir(self.path):
+      if not name.endswith(TCPDumpCache.SUFFIX):
+        continue
+      name = os.path.join(self.path, name)
+      try:
+        stat = os.stat(name)
+      except OSError:
+        continue
+      traces.append((stat.st_mtime, stat.st_size, name))
+      total += stat.st_size
+    traces.sort()
+    removed = 0
+    for _, size, name in traces:
+      if total <= self.size:
+        break
+      self.__Remove(name)
+      total -= size
+      removed += 1
+    return removed
+
+  def __Remove(self, name):
+    """Removes a trace (another process may have done it already)."""
+    try:
+      os.remove(name)
+    except OSError:
+      pass
+#END CLASS TCPDumpCache
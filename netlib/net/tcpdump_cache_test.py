@@ -0,0 +1,132 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for netlib.net.tcpdump_cache."""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from netlib import config
+from netlib.net import pcap_test
+from netlib.net import tcpdump
+from netlib.net import tcpdump_cache
+
+
+class TCPDumpCacheTest(unittest.TestCase):
+  """Test for TCPDumpCache."""
+
+  def setUp(self):
+    """An empty cache in a new directory and a small capture."""
+    self.path = tempfile.mkdtemp()
+    self.cache = tcpdump_cache.TCPDumpCache(os.path.join(self.path, 'cache'))
+    packets, self.text = pcap_test.Transfer(60)
+    self.capture = pcap_test.Pcap(packets)
+    self.expected = tcpdump.TCPDumpResults.FromPcap(self.capture)
+
+  def tearDown(self):
+    """Remove the cache."""
+    shutil.rmtree(self.path)
+
+  def Files(self):
+    """Returns the traces in the cache."""
+    return [x for x in os.listdir(self.cache.path)
+            if x.endswith(tcpdump_cache.TCPDumpCache.SUFFIX)]
+
+  def testResults(self):
+    """The first time the capture is parsed, after that it is loaded."""
+    results = self.cache.Results(self.capture)
+    self.assertEqual(list(results.records), self.expected.records)
+    self.assertEqual(len(self.Files()), 1)
+    key = self.cache.Key(self.capture)
+    self.assertNotEqual(self.cache.Get(key), None)
+    loaded = self.cache.Results(self.capture)
+    self.assertTrue(isinstance(loaded.records, tcpdump.TCPDumpColumns))
+    self.assertEqual(list(loaded.records), self.expected.records)
+    self.assertEqual(loaded.Throughput(step=0.01),
+                     self.expected.Throughput(step=0.01))
+    self.assertEqual(len(self.Files()), 1)
+
+  def testOldConfig(self):
+    """A config without the cache settings falls back on the defaults."""
+    saved = dict()
+    for name in ('TRACE_CACHE_DIR', 'TRACE_CACHE_SIZE'):
+      if hasattr(config, name):
+        saved[name] = getattr(config, name)
+        delattr(config, name)
+    try:
+      cache = tcpdump_cache.TCPDumpCache(self.cache.path)
+      self.assertEqual(cache.size, tcpdump_cache.TCPDumpCache.SIZE)
+    finally:
+      for name, value in saved.items():
+        setattr(config, name, value)
+
+  def testKeys(self):
+    """The contents, the parser version and UDP all change the key."""
+    key = self.cache.Key(self.capture)
+    self.assertEqual(key, self.cache.Key(self.capture[:]))
+    self.assertNotEqual(key, self.cache.Key(self.capture[:-1]))
+    self.assertNotEqual(key, self.cache.Key(self.capture, udp=True))
+    version = tcpdump_cache.TCPDumpCache.VERSION
+    try:
+      tcpdump_cache.TCPDumpCache.VERSION += 1
+      self.assertNotEqual(key, self.cache.Key(self.capture))
+    finally:
+      tcpdump_cache.TCPDumpCache.VERSION = version
+
+  def testText(self):
+    """Text is parsed like TCPDumpResults does."""
+    results = self.cache.Results(self.text)
+    self.assertEqual(len(results.records), 60)
+    self.assertEqual(results.records[-1].dst, self.expected.records[-1].dst)
+    self.assertEqual(len(self.cache.Results(self.text).records), 60)
+
+  def testBroken(self):
+    """A trace that does not load is dropped and parsed again."""
+    self.cache.Results(self.capture)
+    name = os.path.join(self.cache.path, self.Files()[0])
+    open(name, 'wb').write('junk')
+    self.assertEqual(self.cache.Get(self.cache.Key(self.capture)), None)
+    self.assertEqual(self.Files(), [])
+    self.assertEqual(len(self.cache.Results(self.capture).records), 60)
+
+  def testEvict(self):
+    """The least recently used traces go first."""
+    self.cache.Results(self.capture)
+    size = os.path.getsize(os.path.join(self.cache.path, self.Files()[0]))
+    self.cache.size = size * 2 + 64
+    first = self.cache.Key(self.capture)
+    self.cache.Results(self.text)
+    # Make the first one older and then use it so the text is the oldest.
+    for name in self.Files():
+      os.utime(os.path.join(self.cache.path, name), (1, time.time() - 100))
+    self.cache.Get(first)
+    self.cache.Results(pcap_test.Pcap(pcap_test.Transfer(61)[0]))
+    self.assertEqual(len(self.Files()), 2)
+    self.assertNotEqual(self.cache.Get(first), None)
+    self.assertEqual(self.cache.Get(self.cache.Key(self.text)), None)
+    self.cache.size = 0
+    self.assertEqual(self.cache.Evict(), 2)
+    self.assertEqual(self.Files(), [])
+#END CLASS TCPDumpCacheTest
+
+
+if __name__ == '__main__':
+  unittest.main()
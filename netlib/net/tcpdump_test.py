@@ -18,10 +18,19 @@
 
 __author__ = 'gavaletz@google.com (Eric Gavaletz)'
 
+import base64
+import cStringIO
 import os
+import random
+import sys
+import tempfile
+import time
 import unittest
 
 from netlib import config
+from netlib.net import bpf
+from netlib.net import bpf_test
+from netlib.net import pcap_test
 from netlib.net import tcpdump
 from netlib.shell import mock
 
@@ -39,7 +48,7 @@ class TCPDumpTest(unittest.TestCase):
 
   TRACE = open('trace.dat', 'r').read()
   TMP_FILE = '/tmp/tcpdump.dat.rnd10ext'
-  mock.MockHost.results['mktemp -t tcpdump.dat.XXXXXXXXXX'] = TMP_FILE
+  mock.MockHost.results['sudo mktemp -t tcpdump.dat.XXXXXXXXXX'] = TMP_FILE
   mock.MockHost.results['sudo tcpdump -tt -v -n -S -r %s' % TMP_FILE] = TRACE
 
   def setUp(self):
@@ -117,6 +126,23 @@ class TCPDumpTest(unittest.TestCase):
     self.assertIn(' and dst %s' % self.dst, cmd)
     self.assertGreater(self.td_obj.child_pid, 0)
 
+  def testStartBPF(self):
+    """A filter is compiled first and picks the snap length."""
+    td_filter = bpf.BPFFilter(hosts=self.dst, ports=5001)
+    mock.MockHost.results["sudo tcpdump -d -i %s '%s'" % (
+        self.interface, td_filter.Expression())] = bpf_test.PROGRAM
+    self.td_obj.Start(interface=self.interface, bpf=td_filter)
+    cmd = self.fake_host.process_dict[3].cmd
+    self.assertIn(" 'tcp and host %s and port 5001'" % self.dst, cmd)
+    self.assertIn(' -s 138', cmd)
+    self.assertNotIn(' ip src ', cmd)
+    self.assertGreater(self.td_obj.child_pid, 0)
+    td_obj = tcpdump.TCPDump(self.fake_host)
+    self.assertRaises(ValueError, td_obj.Start, interface=self.interface,
+                      bpf=bpf.BPFFilter(ports=1))
+    self.assertEqual(td_obj.child_pid, None)
+    del td_obj
+
   def testStop(self):
     """Make sure the breaks work...
 
@@ -133,6 +159,7 @@ class TCPDumpTest(unittest.TestCase):
     self.assertIn(' -n ', cmd)
     self.assertIn(' -S ', cmd)
     self.assertIn(' -r %s' % TCPDumpTest.TMP_FILE, cmd)
+    self.td_obj.Results()
     self.assertIsNone(self.td_obj.child_pid)
 
   def testRestart(self):
@@ -144,12 +171,177 @@ class TCPDumpTest(unittest.TestCase):
                         count=self.count)
     self.assertGreater(self.td_obj.child_pid, 0)
 
+  def testRestartBPF(self):
+    """A restart captures with the new filter and its snap length."""
+    td_filter = bpf.BPFFilter(hosts=self.dst, ports=5001)
+    mock.MockHost.results["sudo tcpdump -d -i %s '%s'" % (
+        self.interface, td_filter.Expression())] = bpf_test.PROGRAM
+    self.td_obj.Start(src=self.src, dst=self.dst, interface=self.interface)
+    self.td_obj.Stop()
+    self.td_obj.Restart(interface=self.interface, bpf=td_filter)
+    self.assertIsNotNone(self.td_obj.data)
+    cmd = self.fake_host.process_dict[self.td_obj.child_pid].cmd
+    self.assertIn(" 'tcp and host %s and port 5001'" % self.dst, cmd)
+    self.assertIn(' -s 138', cmd)
+    self.assertNotIn(' -s %d' % tcpdump.TCPDump.SNAPLEN, cmd)
+    self.assertNotIn(' ip src ', cmd)
+    self.assertEqual(cmd.count(' -i '), 1)
+
   def testResults(self):
     """After a stop we should have some data to look at..."""
     self.td_obj.Start(interface=self.interface)
     self.td_obj.Stop()
+    self.td_obj.Results()
     self.assertIsNotNone(self.td_obj.data)
 
+  def testNative(self):
+    """The capture file is copied back and decoded without tcpdump -r."""
+    packets, _ = pcap_test.Transfer(30)
+    capture = pcap_test.Pcap(packets)
+    mock.MockHost.results['sudo base64 %s' % TCPDumpTest.TMP_FILE] = (
+        base64.b64encode(capture))
+    td_obj = tcpdump.TCPDump(self.fake_host, native=True)
+    td_obj.Start(interface=self.interface)
+    td_obj.Stop()
+    results = td_obj.Results()
+    self.assertEqual(td_obj.data, capture)
+    self.assertEqual(len(results.records), 30)
+    self.assertEqual(results.records[0].src, '10.0.0.1.41063')
+
+  def testLive(self):
+    """The capture is streamed back, counted and teed without a tmp file."""
+    packets, _ = pcap_test.Transfer(60)
+    capture = pcap_test.Pcap(packets)
+    mock.MockHost.results['sudo tcpdump -i eth0 -w - -U -s 96 -c 100'] = capture
+    tee = tempfile.NamedTemporaryFile()
+    td_obj = tcpdump.TCPDump(self.fake_host, live=True, tee=tee.name)
+    self.assertIsNone(td_obj.tmp_file)
+    td_obj.Start(interface=self.interface)
+    stream = td_obj.Update()
+    self.assertEqual(stream.packets, 60)
+    self.assertEqual(stream.flows[('10.0.0.1.41063', '10.0.0.2.5001')],
+                     [40, 40 * 1488])
+    expected = tcpdump.TCPDumpResults.FromPcap(capture)
+    self.assertEqual(stream.Throughput(), expected.Throughput())
+    td_obj.Stop()
+    self.assertIsNone(td_obj.child_pid)
+    self.assertEqual(td_obj.Results().records, expected.records)
+    self.assertEqual(open(tee.name, 'rb').read(), capture)
+
+  def testRotate(self):
+    """Each finished segment is decoded and removed while the capture runs."""
+    packets, _ = pcap_test.Transfer(60)
+    segment = '%s.%%d' % TCPDumpTest.TMP_FILE
+    for i in xrange(3):
+      mock.MockHost.results['sudo base64 %s' % segment % i] = base64.b64encode(
+          pcap_test.Pcap(packets[i * 20:(i + 1) * 20]))
+    # tcpdump echoes the first two, the third is still open when it stops.
+    mock.MockHost.results['sudo tcpdump -i eth0 -w %s. -C 1 -W 3 -z echo -s 96 '
+                          '-c 100' % TCPDumpTest.TMP_FILE] = (
+                              '%s\n%s\n' % (segment % 0, segment % 1))
+    mock.MockHost.results['sudo sh -c \'ls -tr %s.*\'' %
+                          TCPDumpTest.TMP_FILE] = segment % 2
+    td_obj = tcpdump.TCPDump(self.fake_host, rotate_size=1, rotate_files=3)
+    td_obj.Start(interface=self.interface)
+    stream = td_obj.Update()
+    self.assertEqual(td_obj.segments, 3)
+    self.assertEqual(stream.packets, 60)
+    cmds = [x.cmd for x in self.fake_host.process_dict.values()]
+    for i in xrange(3):
+      self.assertIn('sudo rm %s' % segment % i, cmds)
+    td_obj.Stop()
+    expected = tcpdump.TCPDumpResults.FromPcap(pcap_test.Pcap(packets))
+    self.assertEqual(td_obj.Results().records, expected.records)
+    self.assertEqual(stream.Throughput(), expected.Throughput())
+
+  def testRotateSeconds(self):
+    """Segments by time are named after the time they were started."""
+    td_obj = tcpdump.TCPDump(self.fake_host, rotate_seconds=60)
+    td_obj.Start(interface=self.interface, count=None)
+    cmd = self.fake_host.process_dict[max(self.fake_host.process_dict)].cmd
+    self.assertIn(' -w %s.%%s. -G 60 ' % TCPDumpTest.TMP_FILE, cmd)
+    self.assertIn(' -z echo ', cmd)
+    self.assertNotIn(' -C ', cmd)
+
+
+class TCPDumpSetTest(unittest.TestCase):
+  """Test for TCPDumpSet."""
+
+  def setUp(self):
+    """Two hosts whose clocks are 100 seconds ahead of ours."""
+    self.hosts = [mock.MockHost('a.src'), mock.MockHost('a.dst')]
+    self.td_set = tcpdump.TCPDumpSet(self.hosts)
+    now = time.time()
+    mock.MockHost.results['sh -c \'while read line; do date +%s.%N; done\''] = (
+        '\n'.join('%.6f' % (now + 100.0 + i * 0.01) for i in xrange(3)))
+
+  def tearDown(self):
+    """Free up the objects under test."""
+    del self.td_set
+    del self.hosts
+
+  def testClockOffsets(self):
+    """Each host gets the offset of its quickest round trip."""
+    offset, delay = self.hosts[0].ClockOffset(samples=3)
+    self.assertAlmostEqual(offset, 100.0, delta=1.0)
+    self.assertGreaterEqual(delay, 0.0)
+    offsets = self.td_set.ClockOffsets(samples=5)
+    self.assertEqual(len(offsets), 2)
+    for offset in offsets:
+      self.assertAlmostEqual(offset, 100.0, delta=1.0)
+
+  def testClockOffsetsBadDate(self):
+    """A date that can not print %N gives no offset instead of an error."""
+    mock.MockHost.results['sh -c \'while read line; do date +%s.%N; done\''] = (
+        '\n'.join(['1328812345.N'] * 3))
+    self.assertIsNone(self.hosts[0].ClockOffset(samples=3))
+    self.td_set.offsets = [0.0, 0.5]
+    self.assertEqual(self.td_set.ClockOffsets(samples=3), [0.0, 0.5])
+
+  def testMerge(self):
+    """The records of both hosts are merged in order on our clock."""
+    src = tcpdump.TCPDumpResults.FromPcap(pcap_test.Pcap(
+        pcap_test.Transfer(30)[0]))
+    dst = tcpdump.TCPDumpResults.FromPcap(pcap_test.Pcap(
+        pcap_test.Transfer(20, t=1328812345.01)[0]), columnar=True)
+    self.td_set.offsets = [0.0, 0.5]
+    merged = list(self.td_set.Merge([src, dst]))
+    self.assertEqual(len(merged), 50)
+    self.assertEqual(merged, sorted(merged))
+    self.assertEqual([x[2] for x in merged if x[1] == 0], list(src.records))
+    for time_stamp, i, record in merged:
+      if i == 1:
+        self.assertAlmostEqual(time_stamp, record.time_stamp - 0.5)
+
+  def testOneWayDelays(self):
+    """The clock offsets between the two hosts are taken out."""
+    packets = pcap_test.Transfer(30)[0]
+    src = tcpdump.TCPDumpResults.FromPcap(pcap_test.Pcap(packets))
+    dst = tcpdump.TCPDumpResults.FromPcap(pcap_test.Pcap(
+        [(t + 2.01, frame) for t, frame in packets]))
+    self.td_set.offsets = [1.0, 3.0]
+    delays, lost = self.td_set.OneWayDelays(results_list=[src, dst])
+    _, y = delays[('10.0.0.1.41063', '10.0.0.2.5001')]
+    self.assertEqual(len(y), 20)
+    for delay in y:
+      self.assertAlmostEqual(delay, 0.01, places=5)
+    self.assertEqual(lost, {})
+
+  def testResultsParallel(self):
+    """A capture and a text trace are parsed at the same time."""
+    packets, text = pcap_test.Transfer(40)
+    self.td_set.td_list[0].data = pcap_test.Pcap(packets)
+    self.td_set.td_list[0].native = True
+    self.td_set.td_list[1].data = text
+    native, parsed = self.td_set.Results(processes=2)
+    self.assertTrue(isinstance(native.records, tcpdump.TCPDumpColumns))
+    self.assertEqual(list(native.records),
+                     tcpdump.TCPDumpResults.FromPcap(
+                         self.td_set.td_list[0].data).records)
+    self.assertEqual(list(parsed.records),
+                     tcpdump.TCPDumpResults(text).records)
+#END CLASS TCPDumpSetTest
+
 
 class TCPDumpResultsTest(unittest.TestCase):
   """Test for TCPDumpResults.
@@ -178,6 +370,14 @@ class TCPDumpResultsTest(unittest.TestCase):
     self.assertLessEqual(len(self.td_res_obj.records),
                          len(self.td_res_obj.trace))
 
+  def testNumericOrder(self):
+    """Records are in time order even when the lines would sort otherwise."""
+    lines = [pcap_test.TEXT_TCP % (t, 1, 40, 'a.1', 'b.2', '', 1)
+             for t in (10.5, 9.5, 100.25)]
+    results = tcpdump.TCPDumpResults('\n'.join(lines))
+    self.assertEqual([x.time_stamp for x in results.records],
+                     [9.5, 10.5, 100.25])
+
   def testThroughput(self):
     """Test throughput calculations.
 
@@ -207,5 +407,747 @@ class TCPDumpResultsTest(unittest.TestCase):
     self.assertGreaterEqual(min(y), 0.0)
 
 
+class TCPDumpColumnsTest(unittest.TestCase):
+  """Test for TCPDumpColumns."""
+
+  def setUp(self):
+    """Create the same records as a list and as columns."""
+    packets, _ = pcap_test.Transfer(60)
+    self.capture = pcap_test.Pcap(packets)
+    self.records = tcpdump.TCPDumpResults.FromPcap(self.capture).records
+    self.columns = tcpdump.TCPDumpColumns(self.records)
+
+  def testCompatible(self):
+    """Indexing, iterating and len act like the list of records."""
+    self.assertEqual(len(self.columns), 60)
+    self.assertEqual(list(self.columns), self.records)
+    self.assertEqual(self.columns[2], self.records[2])
+    self.assertEqual(self.columns[-1], self.records[-1])
+    self.assertTrue(isinstance(self.columns[0], tcpdump.TCPDumpRecord))
+    self.assertEqual(self.columns[2].start, None)
+    self.assertEqual(self.columns[0].ack, 1)
+    self.assertEqual(self.columns[::7], self.records[::7])
+    self.assertRaises(IndexError, self.columns.__getitem__, 60)
+    self.assertEqual(len(self.columns.addresses), 2)
+
+  def testSlice(self):
+    """Slices share the columns and can be sliced again."""
+    view = self.columns[10:40]
+    self.assertTrue(view.columns is self.columns.columns)
+    self.assertEqual(len(view), 30)
+    self.assertEqual(list(view), self.records[10:40])
+    self.assertEqual(list(view[5:10]), self.records[15:20])
+    self.assertEqual(len(view[25:100]), 5)
+    self.assertEqual(len(view[20:10]), 0)
+    self.assertEqual(list(view.Column('length')),
+                     [x.length for x in self.records[10:40]])
+
+  def testColumnCopy(self):
+    """A column is a copy that outlives later appends."""
+    lengths = self.columns.Column('length')
+    lengths[0] = 12345
+    self.columns.extend(self.records * 100)
+    self.assertEqual(len(lengths), 60)
+    self.assertEqual(list(lengths[1:]), [x.length for x in self.records[1:]])
+    self.assertNotEqual(self.columns[0].length, 12345)
+
+  def testNone(self):
+    """Missing values survive the trip through the columns."""
+    record = tcpdump.TCPDumpRecord(1.0, None, 40, 'a.1', 'b.2', None, None)
+    columns = tcpdump.TCPDumpColumns([record])
+    self.assertEqual(columns[0], record)
+    self.assertEqual(list(columns.Column('ack')), [tcpdump.TCPDumpColumns.NONE])
+
+  def testSort(self):
+    """Out of order records are sorted by time stamp."""
+    columns = tcpdump.TCPDumpColumns(reversed(self.records))
+    columns.Sort()
+    self.assertEqual(list(columns), self.records)
+
+  def testFromPcap(self):
+    """Decoding into columns gives the same results."""
+    results = tcpdump.TCPDumpResults.FromPcap(self.capture, columnar=True)
+    self.assertTrue(isinstance(results.records, tcpdump.TCPDumpColumns))
+    self.assertEqual(list(results.records), self.records)
+    listed = tcpdump.TCPDumpResults.FromPcap(self.capture)
+    self.assertEqual(results.Throughput(step=0.01),
+                     listed.Throughput(step=0.01))
+    listed.Columnar()
+    self.assertEqual(list(listed.records), self.records)
+
+  def testFromFile(self):
+    """A capture file is mapped and can be cut to a time range."""
+    capture = tempfile.NamedTemporaryFile()
+    capture.write(self.capture)
+    capture.flush()
+    results = tcpdump.TCPDumpResults.FromFile(capture.name)
+    self.assertEqual(results.records, self.records)
+    start = self.records[10].time_stamp
+    end = self.records[20].time_stamp
+    results = tcpdump.TCPDumpResults.FromFile(capture.name, columnar=True,
+                                              start=start, end=end)
+    self.assertTrue(isinstance(results.records, tcpdump.TCPDumpColumns))
+    self.assertEqual(list(results.records), self.records[10:20])
+    capture.close()
+
+  def testSaveLoad(self):
+    """Saved columns (or a slice of them) load back the same."""
+    for columns, records in ((self.columns, self.records),
+                             (self.columns[7:20], self.records[7:20]),
+                             (tcpdump.TCPDumpColumns(), [])):
+      out = tempfile.TemporaryFile()
+      columns.Save(out)
+      self.assertEqual(out.tell() % 8, 0)
+      out.seek(0)
+      loaded = tcpdump.TCPDumpColumns.Load(out)
+      self.assertEqual(list(loaded), records)
+      self.assertEqual(loaded.addresses, columns.addresses)
+      loaded.append(self.records[0])
+      self.assertEqual(len(loaded.addresses), len(columns.addresses) or 2)
+    out.seek(0)
+    data = out.read()
+    for bad in ('', 'x' * 40, data[:-8]):
+      self.assertRaises(ValueError, tcpdump.TCPDumpColumns.Load,
+                        cStringIO.StringIO(bad))
+
+  def testLargeSequence(self):
+    """Absolute sequence numbers past 2**31 survive every format."""
+    record = tcpdump.TCPDumpRecord(1328812345.0, 1, 1500, 'a.1', 'b.2',
+                                   0xFFFFFFF0, 0xFFFFFFFF, 0xFFFFFFF0 + 1448)
+    columns = tcpdump.TCPDumpColumns([record])
+    self.assertEqual(columns[0], record)
+    self.assertTrue(isinstance(columns[0].start, (int, long)))
+    out = tempfile.TemporaryFile()
+    columns.Save(out)
+    out.seek(0)
+    self.assertEqual(list(tcpdump.TCPDumpColumns.Load(out)), [record])
+    results = tcpdump.TCPDumpResults('')
+    results.records = [record]
+    summary = tcpdump.TCPDumpSummary.FromResults(results, 0.05, 1)
+    summary = tcpdump.TCPDumpSummary.Unpack(summary.Pack())
+    self.assertEqual(list(summary.samples.records), [record])
+
+
+class ParallelTest(unittest.TestCase):
+  """Test for ParseParallel and TCPDumpColumns.AppendColumns."""
+
+  def setUp(self):
+    """A capture and the text tcpdump prints for it."""
+    packets, self.text = pcap_test.Transfer(200)
+    self.capture = pcap_test.Pcap(packets)
+    self.records = tcpdump.TCPDumpResults.FromPcap(self.capture).records
+
+  def testSameAsSerial(self):
+    """Any number of processes gives the same records."""
+    text_records = tcpdump.TCPDumpResults(self.text).records
+    for processes in (1, 2, 3):
+      results = tcpdump.TCPDumpResults.Parallel(self.capture, processes)
+      self.assertTrue(isinstance(results.records, tcpdump.TCPDumpColumns))
+      self.assertEqual(list(results.records), self.records)
+      results = tcpdump.TCPDumpResults.Parallel(self.text, processes)
+      self.assertEqual(list(results.records), text_records)
+
+  def testSeveral(self):
+    """Traces of different sizes and kinds come back in order."""
+    small = pcap_test.Pcap(pcap_test.Transfer(5)[0])
+    results_list = tcpdump.ParseParallel(['', small, self.capture], 3)
+    self.assertEqual([len(x.records) for x in results_list], [0, 5, 200])
+    self.assertEqual(list(results_list[2].records), self.records)
+
+  def testFromFile(self):
+    """Workers share the mapped file."""
+    capture = tempfile.NamedTemporaryFile()
+    capture.write(self.capture)
+    capture.flush()
+    results = tcpdump.TCPDumpResults.FromFile(capture.name, processes=2)
+    self.assertEqual(list(results.records), self.records)
+    capture.close()
+
+  def testAppendColumns(self):
+    """Addresses interned in another order are renumbered."""
+    columns = tcpdump.TCPDumpColumns(self.records[:10])
+    other = tcpdump.TCPDumpColumns(self.records[2:20])[1:]
+    self.assertEqual(other.addresses, list(reversed(columns.addresses)))
+    columns.AppendColumns(other)
+    columns.AppendColumns(tcpdump.TCPDumpColumns(self.records)[30:40])
+    self.assertEqual(list(columns), self.records[:10] + self.records[3:20] +
+                     self.records[30:40])
+    self.assertEqual(len(columns.addresses), 2)
+#END CLASS ParallelTest
+
+
+class SliceTest(unittest.TestCase):
+  """Test for TCPDumpResults.Slice and Window."""
+
+  def setUp(self):
+    """A transfer as a list of records and as columns."""
+    self.capture = pcap_test.Pcap(pcap_test.Transfer(300)[0])
+    self.results = tcpdump.TCPDumpResults.FromPcap(self.capture)
+    self.records = self.results.records
+    self.start = self.records[40].time_stamp
+    self.end = self.records[200].time_stamp
+
+  def Copy(self, records):
+    """Returns a TCPDumpResults of its own with a copy of some records."""
+    results = tcpdump.TCPDumpResults('')
+    results.records = list(records)
+    return results
+
+  def testSlice(self):
+    """The records in the range are shared, not copied."""
+    zoomed = self.results.Slice(self.start, self.end)
+    self.assertTrue(isinstance(zoomed.records, tcpdump.TCPDumpView))
+    self.assertTrue(zoomed.records.records is self.records)
+    self.assertEqual(list(zoomed.records), self.records[40:200])
+    self.assertEqual(zoomed.records[-1], self.records[199])
+    self.assertEqual(list(zoomed.records[10:20]), self.records[50:60])
+    self.assertEqual(len(self.results.Slice(end=self.start).records), 40)
+    self.assertEqual(len(self.results.Slice(start=self.end).records), 100)
+    self.assertEqual(len(self.results.Slice(self.end, self.start).records), 0)
+    self.assertEqual(len(self.results.Slice(self.end + 100).records), 0)
+    inner = zoomed.Slice(self.records[100].time_stamp)
+    self.assertEqual(list(inner.records), self.records[100:200])
+    self.assertEqual(tcpdump.TCPDumpResults('').Slice(1.0, 2.0).records, [])
+
+  def testAnalyses(self):
+    """A slice gives the same answers as a copy of the same records."""
+    for columnar in (False, True):
+      if columnar:
+        self.results.Columnar()
+      zoomed = self.results.Slice(self.start, self.end)
+      copy = self.Copy(self.records[40:200])
+      self.assertEqual(zoomed.Throughput(step=0.01),
+                       copy.Throughput(step=0.01))
+      self.assertEqual(zoomed.Flows(), copy.Flows())
+      self.assertEqual(zoomed.RTTs(), copy.RTTs())
+      self.assertEqual(zoomed.Goodput(), copy.Goodput())
+      flow = zoomed.FlowResults('10.0.0.1.41063', '10.0.0.2.5001')
+      self.assertEqual(list(flow.records), [
+          x for x in self.records[40:200] if x.src == '10.0.0.1.41063'])
+
+  def testWindow(self):
+    """Windows are relative to the first record."""
+    first = self.records[0].time_stamp
+    zoomed = self.results.Window(self.start - first, self.end - self.start)
+    self.assertEqual(list(zoomed.records), self.records[40:200])
+    self.results.Columnar()
+    zoomed = self.results.Window(self.start - first, self.end - self.start)
+    self.assertTrue(zoomed.records.columns is self.results.records.columns)
+    self.assertEqual(list(zoomed.records), self.records[40:200])
+#END CLASS SliceTest
+
+
+class ThroughputTest(unittest.TestCase):
+  """Test for the TCPDumpResults throughput calculations."""
+
+  def setUp(self):
+    """1000 Bytes at 0.0, 0.05, 0.12, 0.15 then nothing until 0.42 and 0.45."""
+    self.results = tcpdump.TCPDumpResults('')
+    self.results.records = [
+        tcpdump.TCPDumpRecord(10.0 + t, 1, 1000, 'a.1', 'b.2', 1, None)
+        for t in (0.0, 0.05, 0.12, 0.15, 0.42, 0.45)]
+    self.numpy = tcpdump.numpy
+
+  def tearDown(self):
+    tcpdump.numpy = self.numpy
+
+  def testBins(self):
+    """Empty bins are zero and the last bin is only as long as the trace."""
+    x, y = self.results.Throughput(step=0.1, zero_shift=True)
+    for a, b in zip(x, [0.1, 0.2, 0.3, 0.4, 0.45]):
+      self.assertAlmostEqual(a, b)
+    for a, b in zip(y, [0.16, 0.16, 0.0, 0.0, 0.32]):
+      self.assertAlmostEqual(a, b)
+
+  def testThroughputs(self):
+    """Several steps at once match one at a time."""
+    steps = [0.05, 0.1, 0.2, 0.15]
+    together = self.results.Throughputs(steps)
+    self.assertEqual(sorted(together), sorted(steps))
+    for step in steps:
+      x, y = self.results.Throughput(step)
+      self.assertEqual(len(x), len(together[step][0]))
+      for a, b in zip(y, together[step][1]):
+        self.assertAlmostEqual(a, b)
+      total = sum([size * (end - begin) for size, begin, end in
+                   zip(y, [10.0] + x[:-1], x)])
+      self.assertAlmostEqual(total, 6 * 1000 * 8 / 1000000.0)
+
+  def testWithoutNumpy(self):
+    """The pure Python path gives the same answers."""
+    expected = self.results.Throughputs([0.05, 0.1, 0.3])
+    tcpdump.numpy = None
+    self.assertEqual(self.results.Throughputs([0.05, 0.1, 0.3]), expected)
+    self.results.Columnar()
+    self.assertEqual(self.results.Throughputs([0.05, 0.1, 0.3]), expected)
+
+  def testWindow(self):
+    """A window that covers two bins."""
+    x, y = self.results.ThroughputWindow(0.2, step=0.1, zero_shift=True)
+    self.assertEqual(len(x), 5)
+    for a, b in zip(y, [0.16, 0.16, 0.08, 0.0, 0.32 * 0.05 / 0.15]):
+      self.assertAlmostEqual(a, b)
+    x1, y1 = self.results.ThroughputWindow(0.1, step=0.1)
+    self.assertEqual((x1, y1), self.results.Throughput(step=0.1))
+
+  def testEWMA(self):
+    """Each value moves alpha of the way to the newest bin."""
+    x, y = self.results.ThroughputEWMA(step=0.1, alpha=0.5)
+    for a, b in zip(y, [0.16, 0.16, 0.08, 0.04, 0.18]):
+      self.assertAlmostEqual(a, b)
+
+  def testEmpty(self):
+    """No records, no throughput."""
+    results = tcpdump.TCPDumpResults('')
+    self.assertEqual(results.Throughput(), ([], []))
+    self.assertEqual(results.ThroughputWindow(1.0), ([], []))
+
+
+class FlowTest(unittest.TestCase):
+  """Test for the TCPDumpResults flow index."""
+
+  SRC = '10.0.0.1.41063'
+  DST = '10.0.0.2.5001'
+
+  def setUp(self):
+    """A bulk transfer with some background traffic mixed in."""
+    packets, _ = pcap_test.Transfer(30)
+    records = tcpdump.TCPDumpResults.FromPcap(pcap_test.Pcap(packets)).records
+    start = records[0].time_stamp
+    self.noise = [tcpdump.TCPDumpRecord(start + i * 0.001, 1, 100, 'c.1',
+                                        'd.2', 1, None) for i in xrange(10)]
+    self.transfer = records
+    self.results = tcpdump.TCPDumpResults('')
+    self.results.records = sorted(records + self.noise)
+
+  def testFlow(self):
+    """Totals for one direction, completion for both."""
+    flow = self.results.Flow(FlowTest.SRC, FlowTest.DST)
+    data = [x for x in self.transfer if x.src == FlowTest.SRC]
+    acks = [x for x in self.transfer if x.src == FlowTest.DST]
+    self.assertEqual(flow.packets, 20)
+    self.assertEqual(flow.bytes, 20 * 1488)
+    self.assertEqual((flow.first, flow.last),
+                     (data[0].time_stamp, data[-1].time_stamp))
+    self.assertAlmostEqual(flow.throughput,
+                           20 * 1488 * 8 / flow.duration / 1000000.0)
+    self.assertAlmostEqual(flow.completion,
+                           acks[-1].time_stamp - data[0].time_stamp)
+    self.assertEqual(self.results.Flow(FlowTest.DST, FlowTest.SRC).bytes,
+                     10 * 40)
+    self.assertEqual(self.results.Flow('c.1', FlowTest.DST), None)
+    self.assertEqual(len(self.results.Flows()), 3)
+
+  def testFlowThroughput(self):
+    """The background traffic is left out."""
+    alone = tcpdump.TCPDumpResults('')
+    alone.records = [x for x in self.transfer if x.src == FlowTest.SRC]
+    self.assertEqual(self.results.FlowThroughput(FlowTest.SRC, FlowTest.DST),
+                     alone.Throughput())
+    self.assertEqual(self.results.FlowResults('c.1', 'd.2').records,
+                     self.noise)
+    self.assertEqual(self.results.FlowResults('x.1', 'y.2').records, [])
+
+  def testColumnsAndStale(self):
+    """Columns give the same flows and new records rebuild the index."""
+    expected = self.results.Flows()
+    self.results.Columnar()
+    self.results.IndexFlows()
+    self.assertEqual(self.results.Flows(), expected)
+    self.results.records = self.results.records[:10]
+    self.assertEqual(self.results.Flow(FlowTest.SRC, FlowTest.DST).packets,
+                     len([x for x in self.results.records
+                          if x.src == FlowTest.SRC]))
+
+
+class RTTTest(unittest.TestCase):
+  """Test for the TCPDumpResults round trip times."""
+
+  def Records(self, shift=0):
+    """A handshake, a delayed ACK, a retransmission and a duplicate ACK."""
+    a, b = 'a.1', 'b.2'
+    packets = [(0.0, a, b, 100, None, 100),
+               (0.01, b, a, 500, 101, 500),
+               (0.02, a, b, None, 501, None),
+               (0.03, a, b, 101, 501, 1101),
+               (0.031, a, b, 1101, 501, 2101),
+               (0.05, b, a, None, 2101, None),
+               (0.06, a, b, 2101, 501, 3101),
+               (0.3, a, b, 2101, 501, 3101),
+               (0.31, b, a, None, 3101, None),
+               (0.32, a, b, 3101, 501, 4101),
+               (0.33, b, a, None, 3101, None),
+               (0.34, b, a, None, 4101, None)]
+    records = list()
+    for time_stamp, src, dst, start, ack, end in packets:
+      if start is not None:
+        start = (start + shift) & 0xffffffff
+        end = (end + shift) & 0xffffffff
+      if ack is not None:
+        ack = (ack + shift) & 0xffffffff
+      records.append(tcpdump.TCPDumpRecord(10.0 + time_stamp, 1, 40, src, dst,
+                                           start, ack, end))
+    results = tcpdump.TCPDumpResults('')
+    results.records = records
+    return results
+
+  def assertSamples(self, samples, x, y):
+    """The samples are about (x, y)."""
+    self.assertEqual(len(samples[0]), len(x))
+    for a, b in zip(samples[0] + samples[1], x + y):
+      self.assertAlmostEqual(a, b)
+
+  def testSamples(self):
+    """One sample per new ACK and none for the retransmitted segment."""
+    rtts = self.Records().RTTs(zero_shift=True)
+    self.assertEqual(sorted(rtts), [('a.1', 'b.2'), ('b.2', 'a.1')])
+    self.assertSamples(rtts[('a.1', 'b.2')], [0.01, 0.05, 0.34],
+                       [0.01, 0.019, 0.02])
+    self.assertSamples(rtts[('b.2', 'a.1')], [0.02], [0.01])
+
+  def testWrap(self):
+    """Sequence numbers that wrap give the same samples."""
+    expected = self.Records().RTTs()
+    self.assertEqual(self.Records(2 ** 32 - 2000).RTTs(), expected)
+
+  def testSynRetransmitted(self):
+    """A second SYN makes the handshake ambiguous."""
+    results = self.Records()
+    syn = results.records[0]
+    results.records.insert(1, syn._replace(time_stamp=10.005))
+    self.assertSamples(results.RTTs(zero_shift=True)[('a.1', 'b.2')],
+                       [0.05, 0.34], [0.019, 0.02])
+
+  def testFlowAndColumns(self):
+    """The flow index and columns give the same samples."""
+    results = self.Records()
+    expected = results.RTTs()
+    self.assertEqual(results.FlowRTT('a.1', 'b.2'), expected[('a.1', 'b.2')])
+    self.assertEqual(results.FlowRTT('c.1', 'b.2'), ([], []))
+    results.Columnar()
+    self.assertEqual(results.RTTs(), expected)
+
+  def testSummaries(self):
+    """Distribution of the samples."""
+    summary = self.Records().RTTSummaries()[('a.1', 'b.2')]
+    self.assertEqual(summary.samples, 3)
+    self.assertAlmostEqual(summary.min, 0.01)
+    self.assertAlmostEqual(summary.median, 0.019)
+    self.assertAlmostEqual(summary.max, 0.02)
+
+  def testTransfer(self):
+    """Text and pcap traces give the same samples."""
+    packets, text = pcap_test.Transfer(300)
+    native = tcpdump.TCPDumpResults.FromPcap(pcap_test.Pcap(packets)).RTTs()
+    parsed = tcpdump.TCPDumpResults(text).RTTs()
+    key = ('10.0.0.1.41063', '10.0.0.2.5001')
+    self.assertEqual(len(native[key][1]), 100)
+    for a, b in zip(native[key][1], parsed[key][1]):
+      self.assertAlmostEqual(a, b, places=6)
+
+
+class SequenceRangesTest(unittest.TestCase):
+  """Test for SequenceRanges."""
+
+  def testAdd(self):
+    """Ranges merge and overlaps are counted."""
+    ranges = tcpdump.SequenceRanges()
+    self.assertEqual(ranges.Add(0, 100), 0)
+    self.assertEqual(ranges.Add(100, 200), 0)
+    self.assertEqual(len(ranges), 1)
+    self.assertEqual(ranges.Add(300, 400), 0)
+    self.assertEqual(ranges.Add(500, 600), 0)
+    self.assertEqual(len(ranges), 3)
+    self.assertEqual(ranges.Covered(150, 550), 200)
+    self.assertEqual(ranges.Add(150, 350), 100)
+    self.assertEqual((ranges.starts, ranges.ends), ([0, 500], [400, 600]))
+    self.assertEqual(ranges.Add(400, 500), 0)
+    self.assertEqual((ranges.starts, ranges.ends), ([0], [600]))
+    self.assertEqual(ranges.Add(550, 650), 50)
+    self.assertEqual(ranges.Add(10, 20), 10)
+    self.assertEqual(ranges.Add(5, 5), 0)
+#END CLASS SequenceRangesTest
+
+
+class EventsTest(unittest.TestCase):
+  """Test for the TCPDumpResults retransmission and reordering events."""
+
+  def Records(self, shift=0):
+    """One of each kind of event, a packet every 0.1 seconds."""
+    a, b = 'a.1', 'b.2'
+    packets = [(a, b, 100, None, 100),
+               (b, a, 500, 101, 500),
+               (a, b, None, 501, None),
+               (a, b, 101, 501, 1101),
+               (a, b, 1101, 501, 2101),
+               (a, b, 2101, 501, 3101),
+               (b, a, None, 1101, None),
+               (b, a, None, 1101, None),
+               (b, a, None, 1101, None),
+               (a, b, 1101, 501, 2101),
+               (b, a, None, 3101, None),
+               (a, b, 2101, 501, 3101),
+               (a, b, 4101, 501, 5101),
+               (a, b, 3101, 501, 4101),
+               (b, a, None, 5101, None)]
+    results = tcpdump.TCPDumpResults('')
+    for i, (src, dst, start, ack, end) in enumerate(packets):
+      if start is not None:
+        start = (start + shift) & 0xffffffff
+        end = (end + shift) & 0xffffffff
+      if ack is not None:
+        ack = (ack + shift) & 0xffffffff
+      results.records.append(tcpdump.TCPDumpRecord(10.0 + i * 0.1, 1, 40, src,
+                                                   dst, start, ack, end))
+    return results
+
+  def testEvents(self):
+    """Each kind of event is found where it happened."""
+    events = self.Records().Events()
+    self.assertEqual(sorted(events), [('a.1', 'b.2'), ('b.2', 'a.1')])
+    found = dict((name, [int(round((x - 10.0) * 10)) for x in time_stamps])
+                 for name, time_stamps in events[('a.1', 'b.2')].iteritems())
+    self.assertEqual(found, {'retransmission': [9, 11], 'spurious': [11],
+                             'dupack': [7, 8], 'reorder': [13]})
+    self.assertEqual(sum([len(x) for x in events[('b.2', 'a.1')].values()]),
+                     0)
+
+  def testWrapAndColumns(self):
+    """Wrapped sequence numbers and columns give the same events."""
+    expected = self.Records().Events()
+    self.assertEqual(self.Records(2 ** 32 - 1500).Events(), expected)
+    results = self.Records()
+    results.Columnar()
+    self.assertEqual(results.Events(), expected)
+
+  def testCounts(self):
+    """Counts line up with the throughput bins."""
+    results = self.Records()
+    counts = results.EventCounts(step=0.5, zero_shift=True)[('a.1', 'b.2')]
+    x, _ = results.Throughput(step=0.5, zero_shift=True)
+    self.assertEqual(counts['dupack'], (x, [0, 2, 0]))
+    self.assertEqual(counts['retransmission'], (x, [0, 1, 1]))
+    self.assertEqual(counts['spurious'], (x, [0, 0, 1]))
+    self.assertEqual(counts['reorder'], (x, [0, 0, 1]))
+    self.assertEqual(tcpdump.TCPDumpResults('').EventCounts(), {})
+#END CLASS EventsTest
+
+
+class GoodputTest(unittest.TestCase):
+  """Test for the TCPDumpResults goodput calculations."""
+
+  def setUp(self):
+    """The records from EventsTest with 40 Bytes of headers on the payload."""
+    self.results = EventsTest('testEvents').Records()
+    self.results.records = [
+        x._replace(length=40 + (x.end - x.start if x.start else 0))
+        for x in self.results.records]
+
+  def testGoodput(self):
+    """Retransmissions and headers are left out of goodput."""
+    goodput = self.results.Goodput(step=0.5, zero_shift=True)
+    x, thr_y, good_y, ratio = goodput[('a.1', 'b.2')]
+    all_x, all_y = self.results.Throughput(step=0.5, zero_shift=True)
+    self.assertEqual(x, all_x)
+    for a, b in zip(ratio, [3000 / 3200.0, 0.0, 2000 / 3120.0]):
+      self.assertAlmostEqual(a, b)
+    for a, b, c in zip(good_y, thr_y, ratio):
+      self.assertAlmostEqual(a, b * c)
+    _, ack_y, ack_good_y, _ = goodput[('b.2', 'a.1')]
+    self.assertEqual(ack_good_y, [0.0, 0.0, 0.0])
+    for a, b, c in zip(thr_y, ack_y, all_y):
+      self.assertAlmostEqual(a + b, c)
+
+  def testSummaries(self):
+    """Totals over the whole flow."""
+    summary = self.results.GoodputSummaries()[('a.1', 'b.2')]
+    self.assertEqual((summary.bytes, summary.new_bytes), (7360, 5000))
+    self.assertAlmostEqual(summary.ratio, 5000 / 7360.0)
+    self.assertAlmostEqual(summary.goodput / summary.throughput, summary.ratio)
+    self.results.Columnar()
+    self.assertEqual(self.results.GoodputSummaries()[('a.1', 'b.2')],
+                     summary)
+    self.assertEqual(tcpdump.TCPDumpResults('').Goodput(), {})
+#END CLASS GoodputTest
+
+
+class OneWayDelayTest(unittest.TestCase):
+  """Test for matching packets across two traces."""
+
+  def setUp(self):
+    """A transfer seen again 20 ms later on a clock 5 seconds ahead.
+
+    The ACKs go the other way (20 ms earlier), a few data segments are lost
+    on the way and the receiver stopped before the last segment and ACK.
+    """
+    self.sender = tcpdump.TCPDumpResults.FromPcap(pcap_test.Pcap(
+        pcap_test.Transfer(300)[0]))
+    self.receiver = tcpdump.TCPDumpResults('')
+    self.lost = [self.sender.records[i] for i in (10, 51, 250)]
+    for record in self.sender.records[:-2]:
+      if record in self.lost:
+        continue
+      if record.src == '10.0.0.1.41063':
+        delay = 0.02
+      else:
+        delay = -0.02
+      self.receiver.records.append(
+          record._replace(time_stamp=record.time_stamp + delay + 5.0))
+    self.receiver.records.sort()
+
+  def testOneWayDelays(self):
+    """Every packet that made it is matched and the holes are lost."""
+    for columnar in (False, True):
+      if columnar:
+        self.sender.Columnar()
+        self.receiver.Columnar()
+      delays, lost = self.sender.OneWayDelays(self.receiver, offset=5.0,
+                                              zero_shift=True)
+      self.assertEqual(delays.keys(), [('10.0.0.1.41063', '10.0.0.2.5001')])
+      x, y = delays[('10.0.0.1.41063', '10.0.0.2.5001')]
+      self.assertEqual(len(x), 200 - 3 - 1)
+      self.assertEqual(x[0], 0.0)
+      for delay in y:
+        self.assertAlmostEqual(delay, 0.02, places=5)
+      self.assertEqual(lost, {('10.0.0.1.41063', '10.0.0.2.5001'): self.lost})
+
+  def testReverse(self):
+    """The ACKs are matched by swapping the traces."""
+    delays, lost = self.receiver.OneWayDelays(self.sender, offset=-5.0)
+    x, y = delays[('10.0.0.2.5001', '10.0.0.1.41063')]
+    self.assertEqual(len(x), 99)
+    self.assertAlmostEqual(min(y), 0.02, places=5)
+    self.assertEqual(lost, {})
+
+  def testDuplicateKeys(self):
+    """A key seen more than once is matched in order."""
+    first = self.sender.records[0]
+    again = first._replace(time_stamp=first.time_stamp + 1.0)
+    self.sender.records = [first, again]
+    self.receiver.records = [x._replace(time_stamp=x.time_stamp + 0.01)
+                             for x in (first, again)]
+    delays, lost = self.sender.OneWayDelays(self.receiver)
+    _, y = delays[(first.src, first.dst)]
+    self.assertEqual(len(y), 2)
+    for delay in y:
+      self.assertAlmostEqual(delay, 0.01)
+    self.assertEqual(lost, {})
+#END CLASS OneWayDelayTest
+
+
+class TCPDumpSummaryTest(unittest.TestCase):
+  """Test for TCPDumpSummary."""
+
+  def setUp(self):
+    """A summary of a short transfer."""
+    packets, _ = pcap_test.Transfer(300)
+    self.capture = pcap_test.Pcap(packets)
+    self.results = tcpdump.TCPDumpResults.FromPcap(self.capture)
+    self.summary = tcpdump.TCPDumpSummary.FromResults(self.results, 0.05, 7)
+
+  def testSummary(self):
+    """Throughput, flows and samples match the full results."""
+    self.assertEqual(self.summary.Throughput(True),
+                     self.results.Throughput(0.05, True))
+    self.assertEqual(self.summary.Flows(), self.results.Flows())
+    self.assertEqual(list(self.summary.samples.records),
+                     self.results.records[::7])
+
+  def testPack(self):
+    """Nothing is lost on the way through Pack and Unpack."""
+    packed = self.summary.Pack()
+    self.assertLess(len(packed), len(self.capture) / 10)
+    summary = tcpdump.TCPDumpSummary.Unpack(packed)
+    self.assertEqual(summary.Throughput(), self.summary.Throughput())
+    self.assertEqual(summary.Flows(), self.summary.Flows())
+    self.assertEqual(list(summary.samples.records),
+                     list(self.summary.samples.records))
+    empty = tcpdump.TCPDumpSummary.Unpack(tcpdump.TCPDumpSummary().Pack())
+    self.assertEqual((empty.Throughput(), empty.Flows()), (([], []), {}))
+    self.assertEqual(len(empty.samples.records), 0)
+    self.assertRaises(ValueError, tcpdump.TCPDumpSummary.Unpack, 'garbage')
+
+  def testMain(self):
+    """The command line summarizes a capture file."""
+    capture = tempfile.NamedTemporaryFile()
+    capture.write(self.capture)
+    capture.flush()
+    out = tempfile.TemporaryFile()
+    stdout = sys.stdout
+    sys.stdout = out
+    try:
+      tcpdump.Main(['-s', '0.05', '-n', '7', capture.name])
+    finally:
+      sys.stdout = stdout
+    out.seek(0)
+    summary = tcpdump.TCPDumpSummary.Unpack(base64.b64decode(out.read()))
+    self.assertEqual(summary.Flows(), self.summary.Flows())
+    self.assertEqual(summary.sample, 7)
+
+  def testTCPDump(self):
+    """TCPDump(summary=True) only copies back the summary."""
+    fake_host = mock.MockHost('a.remote_host.com')
+    cmd = ('sh -c \'sudo cat %s | python -m netlib.net.tcpdump -s 0.05 -n 7\''
+           % TCPDumpTest.TMP_FILE)
+    mock.MockHost.results[cmd] = base64.b64encode(self.summary.Pack())
+    td_obj = tcpdump.TCPDump(fake_host, summary=True, step=0.05, sample=7)
+    td_obj.Start(interface='eth0')
+    td_obj.Stop()
+    summary = td_obj.Results()
+    self.assertEqual(fake_host.process_dict[3].cmd, cmd)
+    self.assertEqual(summary.Flows(), self.summary.Flows())
+#END CLASS TCPDumpSummaryTest
+
+
+class TCPDumpStreamTest(unittest.TestCase):
+  """Test for TCPDumpStream and TCPDumpResults.FromStream."""
+
+  def setUp(self):
+    """The sample trace with each line moved a few places at random."""
+    self.lines = TCPDumpResultsTest.TRACE.splitlines()
+    self.expected = tcpdump.TCPDumpResults(TCPDumpResultsTest.TRACE)
+    rand = random.Random(7)
+    keys = [i + rand.uniform(0, 20) for i in xrange(len(self.lines))]
+    self.shuffled = [line for _, line in sorted(zip(keys, self.lines))]
+
+  def testSameAsString(self):
+    """Streaming gives the same records as parsing the whole string."""
+    results = tcpdump.TCPDumpResults.FromStream(iter(self.shuffled),
+                                                reorder=50)
+    self.assertEqual(results.records, self.expected.records)
+    self.assertEqual(results.Throughput(step=0.1),
+                     self.expected.Throughput(step=0.1))
+    results = tcpdump.TCPDumpResults.FromStream(self.shuffled, reorder=50,
+                                                columnar=True)
+    self.assertEqual(list(results.records), self.expected.records)
+
+  def testTotals(self):
+    """Totals and the running throughput need no records."""
+    stream = tcpdump.TCPDumpStream(reorder=50, keep=False, step=0.1)
+    stream.Feed(self.shuffled + ['not a packet'])
+    stream.Flush()
+    records = self.expected.records
+    self.assertEqual(stream.records, None)
+    self.assertEqual(stream.packets, len(records))
+    self.assertEqual(stream.bytes, sum([x.length for x in records]))
+    self.assertEqual((stream.first, stream.last),
+                     (records[0].time_stamp, records[-1].time_stamp))
+    self.assertEqual((stream.skipped, stream.late), (1, 0))
+    self.assertEqual(sum([x[0] for x in stream.flows.values()]),
+                     len(records))
+    self.assertEqual(stream.Throughput(zero_shift=True),
+                     self.expected.Throughput(step=0.1, zero_shift=True))
+    self.assertEqual(tcpdump.TCPDumpResults.FromStream([], keep=False).records,
+                     [])
+
+  def testLate(self):
+    """Records too far out of order are counted and still end up sorted."""
+    stream = tcpdump.TCPDumpStream(reorder=1)
+    records = self.expected.records[:10]
+    stream.Feed([records[0]] + records[3:] + [tuple(records[2]), records[1]])
+    self.assertEqual(stream.late, 2)
+    self.assertEqual(stream.Results().records, records)
+
+
 if __name__ == '__main__':
   unittest.main()
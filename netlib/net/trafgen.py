@@ -0,0 +1,610 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pure Python traffic generator that can stand in for iperf.
+
+Some end systems do not have iperf installed, and for loopback tests we would
+rather not depend on it.  This module understands the subset of the iperf
+command line used by netlib.net.iperf and prints its reports in the iperf
+format, so IperfResults can parse the output of either one.
+
+  TrafficServer: Class that receives TCP or UDP traffic and reports on it.
+  TrafficClient: Class that sends TCP or UDP traffic and reports on it.
+  ParseSize: Helper for iperf style sizes and rates (i.e. 10M 256K).
+  FormatReport: Helper that formats a report line like iperf does.
+  IntervalReporter: Class that prints the interval reports for one stream.
+
+TCP data is sent from a single pre-allocated buffer, with os.sendfile when the
+interpreter has it and through a memoryview otherwise, and the receive side
+reuses one buffer through recv_into.  UDP senders are paced to the requested
+rate and UDP receivers report jitter and loss the same way iperf does.
+
+Command line usage (run on an end system, see IperfSet(backend='python')):
+  python -m netlib.net.trafgen -s
+  python -m netlib.net.trafgen -c a.remote_host.com -t 10 -i 1
+  python -m netlib.net.trafgen -u -c a.remote_host.com -t 10 -b 10M
+"""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import optparse
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+
+PORT = 5001
+TCP_LEN = 128 * 1024
+UDP_LEN = 1470
+UDP_RATE = '1M'
+LENGTH = 10
+SEPARATOR = '-' * 60
+
+# UDP datagram header: sequence number, send time seconds and microseconds.
+UDP_HEADER = struct.Struct('!lLL')
+# UDP report sent back to the client: Bytes, lost, total, jitter and duration.
+UDP_REPORT = struct.Struct('!QLLdd')
+
+try:
+  View = memoryview
+except NameError:
+  View = buffer  # Python 2.6
+
+
+def ParseSize(value, base=1024):
+  """Helper for iperf style sizes and rates.
+
+  Args:
+    value: a number with an optional K, M or G suffix (i.e. 10M 256K).
+    base: 1024 for sizes in Bytes and 1000 for rates in bits/sec.
+
+  Returns:
+    the value as an int.
+
+  Raises:
+    No exceptions handled here.
+    ValueError: if value is not a number.
+  """
+  value = str(value).strip()
+  mult = {'K': base, 'M': base ** 2, 'G': base ** 3}
+  if value and value[-1].upper() in mult:
+    return int(float(value[:-1]) * mult[value[-1].upper()])
+  return int(float(value))
+
+
+def __Scale(value, base, units):
+  """Picks the largest unit that keeps value above one (iperf adaptive)."""
+  unit = ''
+  for u in units:
+    if value < base:
+      break
+    value /= float(base)
+    unit = u
+  if value < 9.995:
+    return '%4.2f %s' % (value, unit)
+  elif value < 99.95:
+    return '%4.1f %s' % (value, unit)
+  return '%4.0f %s' % (value, unit)
+
+
+def FormatReport(stream, start, end, size, jitter=None, lost=None, total=None):
+  """Formats a report line like iperf does.
+
+  Args:
+    stream: the stream id (or 'SUM').
+    start: start of the reporting interval in seconds.
+    end: end of the reporting interval in seconds.
+    size: Bytes transferred during the interval.
+    jitter: UDP jitter in ms (only for UDP receivers).
+    lost: UDP datagrams lost (only for UDP receivers).
+    total: UDP datagrams sent (only for UDP receivers).
+
+  Returns:
+    the report line as a string.
+
+  Raises:
+    No exceptions handled here.
+    No new exceptions generated here.
+  """
+  duration = max(end - start, 1e-9)
+  line = '[%3s] %4.1f-%4.1f sec  %sBytes  %sbits/sec' % (
+      stream, start, end, __FormatBytes(size),
+      __FormatBits(size * 8.0 / duration))
+  if jitter is not None:
+    line += '  %6.3f ms %4d/%5d (%.2g%%)' % (
+        jitter, lost, total, 100.0 * lost / max(total, 1))
+  return line
+
+
+def __FormatBytes(size):
+  """Formats a number of Bytes like iperf does."""
+  return __Scale(float(size), 1024, 'KMG')
+
+
+def __FormatBits(rate):
+  """Formats a rate in bits/sec like iperf does."""
+  return __Scale(float(rate), 1000, 'KMG')
+
+
+class IntervalReporter(object):
+  """Keeps track of the interval reports for one stream.
+
+  Reporters for parallel streams pass everything they count on to a parent
+  reporter for the SUM stream, which may be shared by several threads.
+  """
+
+  def __init__(self, stream, interval, out, lock, parent=None):
+    self.stream = stream
+    self.interval = interval
+    self.out = out
+    self.lock = lock
+    self.parent = parent
+    self.count_lock = threading.Lock()
+    self.start = time.time()
+    self.next_report = interval
+    self.total = 0
+    self.last_total = 0
+
+  def Add(self, size, now):
+    """Counts size Bytes and prints any interval reports that are due."""
+    if self.parent:
+      self.parent.Add(size, now)
+    self.count_lock.acquire()
+    try:
+      self.total += size
+      if self.interval:
+        while now - self.start >= self.next_report:
+          self.Print(FormatReport(self.stream,
+                                  self.next_report - self.interval,
+                                  self.next_report,
+                                  self.total - self.last_total))
+          self.last_total = self.total
+          self.next_report += self.interval
+    finally:
+      self.count_lock.release()
+
+  def Print(self, line):
+    self.lock.acquire()
+    try:
+      self.out.write(line + '\n')
+      self.out.flush()
+    finally:
+      self.lock.release()
+
+
+class TrafficServer(object):
+  """Class that receives TCP or UDP traffic and reports on it.
+
+  Like an iperf server this keeps accepting new clients until it is killed
+  (or Stop is called) and prints a report for every client.
+
+  Attributes:
+    port: the port to listen on.
+    udp: receive UDP datagrams instead of a TCP stream.
+    interval: how long to wait between bandwidth reports in seconds.
+    size: size of the receive buffer in Bytes.
+    window: socket receive buffer size in Bytes.
+  """
+
+  def __init__(self, port=PORT, udp=False, interval=None, size=None,
+               window=None, out=None):
+    """Inits TrafficServer.
+
+    Args:
+      port: the port to listen on (0 picks a free port).
+      udp: receive UDP datagrams instead of a TCP stream.
+      interval: how long to wait between bandwidth reports in seconds.
+      size: size of the receive buffer in Bytes.
+      window: socket receive buffer size in Bytes.
+      out: file like object for the reports (default sys.stdout).
+
+    Returns:
+      TrafficServer: an instance of the TrafficServer class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    self.udp = udp
+    self.interval = interval
+    self.size = size or (UDP_LEN if udp else TCP_LEN)
+    self.window = window
+    self.out = out or sys.stdout
+    self.lock = threading.Lock()
+    self.running = False
+    self.__stream = 3
+    self.__finished = dict()
+    self.__workers = list()
+    if udp:
+      self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    else:
+      self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if window:
+      self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, window)
+    self.sock.bind(('', port))
+    self.port = self.sock.getsockname()[1]
+    if not udp:
+      self.sock.listen(5)
+
+  def __Print(self, line):
+    self.lock.acquire()
+    try:
+      self.out.write(line + '\n')
+      self.out.flush()
+    finally:
+      self.lock.release()
+
+  def __NextStream(self):
+    """Returns the next stream id (only called from the thread in Run)."""
+    self.__stream += 1
+    return self.__stream
+
+  def Run(self):
+    """Serves clients until Stop is called (blocking)."""
+    self.running = True
+    self.__Print(SEPARATOR)
+    self.__Print('Server listening on %s port %d' %
+                 (self.udp and 'UDP' or 'TCP', self.port))
+    self.__Print(SEPARATOR)
+    if self.udp:
+      self.__RunUDP()
+    else:
+      self.__RunTCP()
+
+  def Stop(self, timeout=1.0):
+    """Stops serving new clients and waits for current ones to report."""
+    self.running = False
+    try:
+      self.sock.close()
+    except socket.error:
+      pass
+    for worker in self.__workers:
+      worker.join(timeout)
+
+  def __RunTCP(self):
+    """Accepts TCP clients and hands each one to its own thread."""
+    while self.running:
+      try:
+        conn, addr = self.sock.accept()
+      except socket.error:
+        break
+      # The id is picked here so parallel clients never share one.
+      worker = threading.Thread(target=self.__ServeTCP,
+                                args=(conn, addr, self.__NextStream()))
+      worker.daemon = True
+      worker.start()
+      self.__workers.append(worker)
+
+  def __ServeTCP(self, conn, addr, stream):
+    """Drains one TCP client into a single reused buffer."""
+    local = conn.getsockname()
+    self.__Print('[%3d] local %s port %d connected with %s port %d' %
+                 (stream, local[0], local[1], addr[0], addr[1]))
+    buf = bytearray(self.size)
+    reporter = IntervalReporter(stream, self.interval, self.out, self.lock)
+    recv_into = conn.recv_into
+    while True:
+      try:
+        n = recv_into(buf)
+      except socket.error:
+        break
+      if not n:
+        break
+      reporter.Add(n, time.time())
+    end = time.time() - reporter.start
+    conn.close()
+    reporter.Print(FormatReport(stream, 0.0, end, reporter.total))
+
+  def __RunUDP(self):
+    """Receives datagrams from any number of UDP clients."""
+    buf = bytearray(self.size)
+    view = View(buf)
+    clients = dict()
+    while self.running:
+      try:
+        n, addr = self.sock.recvfrom_into(buf)
+      except socket.error:
+        break
+      now = time.time()
+      if n < UDP_HEADER.size:
+        continue
+      seq, sec, usec = UDP_HEADER.unpack_from(view)
+      if not addr in clients:
+        if seq < 0:
+          if addr in self.__finished:
+            self.sock.sendto(self.__finished[addr], addr)
+          continue
+        stream = self.__NextStream()
+        local = self.sock.getsockname()
+        self.__Print('[%3d] local %s port %d connected with %s port %d' %
+                     (stream, local[0], local[1], addr[0], addr[1]))
+        clients[addr] = {'reporter': IntervalReporter(stream, self.interval,
+                                                      self.out, self.lock),
+                         'max_seq': -1, 'count': 0, 'jitter': 0.0,
+                         'transit': None}
+      client = clients[addr]
+      if seq < 0:
+        self.__FinishUDP(addr, client, now)
+        del clients[addr]
+        continue
+      transit = now - (sec + usec / 1e6)
+      if client['transit'] is not None:
+        d = abs(transit - client['transit'])
+        client['jitter'] += (d - client['jitter']) / 16.0
+      client['transit'] = transit
+      client['count'] += 1
+      client['max_seq'] = max(client['max_seq'], seq)
+      client['reporter'].Add(n, now)
+
+  def __FinishUDP(self, addr, client, now):
+    """Sends the final report back to a UDP client and prints it."""
+    reporter = client['reporter']
+    total = client['max_seq'] + 1
+    lost = max(total - client['count'], 0)
+    jitter = client['jitter'] * 1000.0
+    end = now - reporter.start
+    self.__finished[addr] = UDP_REPORT.pack(reporter.total, lost, total,
+                                            jitter, end)
+    self.sock.sendto(self.__finished[addr], addr)
+    reporter.Print(FormatReport(reporter.stream, 0.0, end, reporter.total,
+                                jitter, lost, total))
+#END CLASS TrafficServer
+
+
+class TrafficClient(object):
+  """Class that sends TCP or UDP traffic and reports on it.
+
+  Attributes:
+    dst: the host to send traffic to.
+    port: the port the server is listening on.
+    udp: send UDP datagrams instead of a TCP stream.
+    length: how many seconds to generate traffic for.
+    interval: how long to wait between bandwidth reports in seconds.
+    rate: UDP rate in bits/sec.
+    size: size of each write (TCP) or datagram (UDP) in Bytes.
+    window: socket send buffer size in Bytes.
+    parallel: number of parallel streams (each with its own thread).
+  """
+
+  FIN_TRIES = 10
+  FIN_WAIT = 0.25  # seconds
+
+  def __init__(self, dst, port=PORT, udp=False, length=LENGTH, interval=None,
+               rate=None, size=None, window=None, mss=None, out=None,
+               parallel=1):
+    """Inits TrafficClient.
+
+    Args:
+      dst: the host to send traffic to.
+      port: the port the server is listening on.
+      udp: send UDP datagrams instead of a TCP stream.
+      length: how many seconds to generate traffic for.
+      interval: how long to wait between bandwidth reports in seconds.
+      rate: UDP rate in bits/sec or an iperf style string (i.e. 10M).
+      size: size of each write (TCP) or datagram (UDP) in Bytes.
+      window: socket send buffer size in Bytes.
+      mss: TCP maximum segment size in Bytes.
+      out: file like object for the reports (default sys.stdout).
+      parallel: number of parallel streams (UDP streams each get the rate).
+
+    Returns:
+      TrafficClient: an instance of the TrafficClient class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    self.dst = dst
+    self.port = port
+    self.udp = udp
+    self.length = length or LENGTH
+    self.interval = interval
+    self.rate = ParseSize(rate or UDP_RATE, 1000)
+    self.size = size or (UDP_LEN if udp else TCP_LEN)
+    self.window = window
+    self.mss = mss
+    self.out = out or sys.stdout
+    self.lock = threading.Lock()
+    self.parallel = max(parallel or 1, 1)
+
+  def __Print(self, line):
+    self.lock.acquire()
+    try:
+      self.out.write(line + '\n')
+      self.out.flush()
+    finally:
+      self.lock.release()
+
+  def __Connect(self, stream):
+    """Creates the socket and prints its connection line."""
+    if self.udp:
+      sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    else:
+      sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      if self.mss:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_MAXSEG, self.mss)
+    if self.window:
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.window)
+    sock.connect((self.dst, self.port))
+    local = sock.getsockname()
+    peer = sock.getpeername()
+    self.__Print('[%3d] local %s port %d connected with %s port %d' %
+                 (stream, local[0], local[1], peer[0], peer[1]))
+    return sock
+
+  def Run(self):
+    """Generates traffic for length seconds (blocking)."""
+    self.__Print(SEPARATOR)
+    self.__Print('Client connecting to %s, %s port %d' %
+                 (self.dst, self.udp and 'UDP' or 'TCP', self.port))
+    self.__Print(SEPARATOR)
+    streams = range(3, 3 + self.parallel)
+    socks = [self.__Connect(x) for x in streams]
+    parent = None
+    if self.parallel > 1:
+      parent = IntervalReporter('SUM', self.interval, self.out, self.lock)
+    if self.udp:
+      target = self.__RunUDP
+    else:
+      target = self.__RunTCP
+    threads = list()
+    try:
+      for stream, sock in zip(streams, socks):
+        thread = threading.Thread(target=target, args=(sock, stream, parent))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+      for thread in threads:
+        thread.join()
+    finally:
+      for sock in socks:
+        sock.close()
+    if parent:
+      parent.Print(FormatReport('SUM', 0.0, time.time() - parent.start,
+                                parent.total))
+
+  def __RunTCP(self, sock, stream, parent):
+    """Sends the same buffer over and over without copying it."""
+    reporter = IntervalReporter(stream, self.interval, self.out, self.lock,
+                                parent)
+    deadline = reporter.start + self.length
+    sendfile = getattr(os, 'sendfile', None)
+    if sendfile:
+      tmp = tempfile.TemporaryFile()
+      tmp.write(bytearray(self.size))
+      tmp.flush()
+      in_fd = tmp.fileno()
+      out_fd = sock.fileno()
+      size = self.size
+      try:
+        now = time.time()
+        while now < deadline:
+          offset = 0
+          while offset < size:
+            offset += sendfile(out_fd, in_fd, offset, size - offset)
+          now = time.time()
+          reporter.Add(size, now)
+      finally:
+        tmp.close()
+    else:
+      view = View(bytearray(self.size))
+      sendall = sock.sendall
+      now = time.time()
+      while now < deadline:
+        sendall(view)
+        now = time.time()
+        reporter.Add(self.size, now)
+    reporter.Print(FormatReport(stream, 0.0, now - reporter.start,
+                                reporter.total))
+
+  def __RunUDP(self, sock, stream, parent):
+    """Sends paced datagrams and asks the server for its report."""
+    buf = bytearray(self.size)
+    view = View(buf)
+    reporter = IntervalReporter(stream, self.interval, self.out, self.lock,
+                                parent)
+    deadline = reporter.start + self.length
+    gap = self.size * 8.0 / self.rate
+    next_send = reporter.start
+    seq = 0
+    send = sock.send
+    now = time.time()
+    while now < deadline:
+      if now < next_send:
+        time.sleep(next_send - now)
+        now = time.time()
+      UDP_HEADER.pack_into(buf, 0, seq, int(now), int((now % 1) * 1e6))
+      send(view)
+      seq += 1
+      next_send += gap
+      reporter.Add(self.size, now)
+      now = time.time()
+    end = now - reporter.start
+    reporter.Print(FormatReport(stream, 0.0, end, reporter.total))
+    reporter.Print('[%3d] Sent %d datagrams' % (stream, seq))
+    report = self.__Finish(sock, buf, view, seq)
+    if report:
+      size, lost, total, jitter, duration = report
+      reporter.Print('[%3d] Server Report:' % stream)
+      reporter.Print(FormatReport(stream, 0.0, duration, size, jitter,
+                                  lost, total))
+    else:
+      reporter.Print('[%3d] WARNING: did not receive ack of last datagram '
+                     'after %d tries.' % (stream, self.FIN_TRIES))
+
+  def __Finish(self, sock, buf, view, seq):
+    """Sends the final datagram until the server answers with its report."""
+    sock.settimeout(self.FIN_WAIT)
+    reply = bytearray(UDP_REPORT.size)
+    for _ in range(self.FIN_TRIES):
+      now = time.time()
+      UDP_HEADER.pack_into(buf, 0, -seq - 1, int(now), int((now % 1) * 1e6))
+      sock.send(view)
+      try:
+        n = sock.recv_into(reply)
+      except socket.timeout:
+        continue
+      if n == UDP_REPORT.size:
+        return UDP_REPORT.unpack_from(View(reply))
+    return None
+#END CLASS TrafficClient
+
+
+def Main(argv):
+  """Parses an iperf style command line and runs a client or server."""
+  parser = optparse.OptionParser(usage='%prog (-s | -c host) [options]')
+  parser.add_option('-s', dest='server', action='store_true', default=False)
+  parser.add_option('-c', dest='client')
+  parser.add_option('-u', dest='udp', action='store_true', default=False)
+  parser.add_option('-p', dest='port', type='int', default=PORT)
+  parser.add_option('-t', dest='length', type='float', default=LENGTH)
+  parser.add_option('-i', dest='interval', type='float')
+  parser.add_option('-b', dest='rate')
+  parser.add_option('-l', dest='size')
+  parser.add_option('-w', dest='window')
+  parser.add_option('-M', dest='mss', type='int')
+  parser.add_option('-P', dest='parallel', type='int', default=1)
+  parser.add_option('-d', dest='dual', action='store_true', default=False)
+  parser.add_option('-r', dest='tradeoff', action='store_true', default=False)
+  (opts, _) = parser.parse_args(argv)
+  if opts.dual or opts.tradeoff:
+    parser.error('dual (-d) and tradeoff (-r) tests need iperf')
+  size = opts.size and ParseSize(opts.size)
+  window = opts.window and ParseSize(opts.window)
+  if opts.rate:
+    opts.udp = True
+  if opts.server:
+    server = TrafficServer(opts.port, opts.udp, opts.interval, size, window)
+    try:
+      server.Run()
+    except KeyboardInterrupt:
+      server.Stop()
+  elif opts.client:
+    client = TrafficClient(opts.client, opts.port, opts.udp, opts.length,
+                           opts.interval, opts.rate, size, window, opts.mss,
+                           parallel=opts.parallel)
+    client.Run()
+  else:
+    parser.error('one of -s or -c is required')
+
+
+if __name__ == '__main__':
+  Main(sys.argv[1:])
@@ -0,0 +1,56 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Loopback throughput of netlib.net.trafgen compared with iperf.
+
+Runs the same IperfTCP test on the local host with each backend that is
+installed and prints the throughput that the client reported.
+
+Usage:
+  python -m netlib.net.trafgen_bench [length]
+"""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import sys
+
+from netlib import config
+from netlib.net import iperf
+from netlib.shell import bash
+
+
+def Benchmark(length=5):
+  """Returns a dictionary of loopback throughput (Mbps) by backend."""
+  host = bash.Host(None)
+  results = dict()
+  for backend in sorted(iperf.BACKENDS):
+    binary = iperf.BACKENDS[backend][0].split()[0]
+    if not host.Run('which %s' % binary, echo_error=False):
+      continue
+    ips = iperf.IperfSet(host, host, config.LOCAL_LOOPBACK, backend)
+    ips.Start(length)
+    results[backend] = ips.ParsedResults()[0].Throughput()
+  return results
+
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    bench_length = int(sys.argv[1])
+  else:
+    bench_length = 5
+  bench_results = Benchmark(bench_length)
+  for name in sorted(bench_results):
+    print '%-8s %10.1f Mbps' % (name, bench_results[name])
@@ -0,0 +1,115 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for netlib.net.trafgen.
+
+These run real clients and servers over the loopback interface, so they take a
+couple of seconds.
+"""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import StringIO
+import threading
+import unittest
+
+from netlib import config
+from netlib.net import iperf
+from netlib.net import trafgen
+
+
+class ParseSizeTest(unittest.TestCase):
+  """Test for ParseSize."""
+
+  def testUnits(self):
+    """Sizes are powers of 1024 and rates powers of 1000."""
+    self.assertEqual(trafgen.ParseSize('256K'), 256 * 1024)
+    self.assertEqual(trafgen.ParseSize('10M', 1000), 10000000)
+    self.assertEqual(trafgen.ParseSize('1.5G', 1000), 1500000000)
+    self.assertEqual(trafgen.ParseSize(1470), 1470)
+    self.assertRaises(ValueError, trafgen.ParseSize, 'lots')
+#END CLASS ParseSizeTest
+
+
+class FormatReportTest(unittest.TestCase):
+  """Test for FormatReport."""
+
+  def testRoundTrip(self):
+    """IperfResults should read back what we write."""
+    line = trafgen.FormatReport(3, 0.0, 2.0, 10 * 1024 * 1024)
+    record = iperf.IperfResults.ParseLine(line)
+    self.assertEqual(record.stream, 3)
+    self.assertEqual(record.end, 2.0)
+    self.assertAlmostEqual(record.bandwidth, 10 * 1024 * 1024 * 8 / 2e6,
+                           places=1)
+    line = trafgen.FormatReport(3, 0.0, 1.0, 125000, 0.5, 2, 100)
+    record = iperf.IperfResults.ParseLine(line)
+    self.assertAlmostEqual(record.jitter, 0.5)
+    self.assertEqual(record.lost, 2)
+    self.assertEqual(record.total, 100)
+#END CLASS FormatReportTest
+
+
+class LoopbackTest(unittest.TestCase):
+  """Runs a TrafficClient against a TrafficServer on the loopback."""
+
+  def Run(self, udp, rate=None, parallel=1):
+    """Runs a one second test and returns the parsed output."""
+    server_out = StringIO.StringIO()
+    client_out = StringIO.StringIO()
+    server = trafgen.TrafficServer(port=0, udp=udp, out=server_out)
+    thread = threading.Thread(target=server.Run)
+    thread.daemon = True
+    thread.start()
+    client = trafgen.TrafficClient(config.LOCAL_LOOPBACK, port=server.port,
+                                   udp=udp, length=1, interval=0.25,
+                                   rate=rate, out=client_out,
+                                   parallel=parallel)
+    client.Run()
+    server.Stop()
+    return (iperf.IperfResults(server_out.getvalue(), port=server.port),
+            iperf.IperfResults(client_out.getvalue(), port=server.port))
+
+  def testTCP(self):
+    """The client reports intervals and both sides agree on the total."""
+    server, client = self.Run(udp=False)
+    self.assertEqual(client.Streams(), [3])
+    self.assertGreaterEqual(len(client.Intervals()), 3)
+    self.assertGreater(client.Throughput(), 0)
+    self.assertIn(3, client.connections)
+
+  def testParallel(self):
+    """Parallel streams are reported one by one and as a SUM."""
+    server, client = self.Run(udp=False, parallel=3)
+    self.assertEqual(client.Streams(), [3, 4, 5])
+    self.assertIn('SUM', client.summaries)
+    self.assertGreaterEqual(len(client.Intervals('SUM')), 3)
+    self.assertEqual(len(server.Streams('recv')), 3)
+    self.assertEqual(len(client.Pairs(server)), 3)
+
+  def testUDP(self):
+    """The client gets the server report back with jitter and loss."""
+    server, client = self.Run(udp=True, rate='2M')
+    summary = client.summaries[3]
+    self.assertIsNotNone(summary.jitter)
+    self.assertGreater(summary.total, 0)
+    self.assertAlmostEqual(client.Throughput(), 2.0, delta=0.5)
+    self.assertEqual(len(server.summaries), 1)
+#END CLASS LoopbackTest
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -37,6 +37,8 @@ Simple object usage:
 __author__ = 'gavaletz@google.com (Eric Gavaletz)'
 
 import logging
+import os
+import select
 import shlex
 import socket
 import subprocess
@@ -209,6 +211,78 @@ class Host(object):
     if out:
       return out.strip()  # pylint: disable-msg=E1103
 
+  def ReadLine(self, pid):
+    """Method for reading output from a forked cmd as it is produced.
+
+    Use this to watch the output of a long running cmd without waiting for it
+    to finish.  Anything that is read here will not be returned by a later call
+    to Communicate so callers need to hang on to the lines they read.
+
+    Args:
+      pid: the process id returned by Host.Run(cmd, forked=True).
+
+    Returns:
+      The next line of output with trailing whitespace removed or None if the
+      cmd has closed its stdout.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    assert pid in self.process_dict
+    line = self.process_dict[pid].stdout.readline()
+    if line:
+      return line.rstrip()
+
+  def Read(self, pid, size=65536, timeout=None):
+    """Method for reading raw output from a forked cmd as it is produced.
+
+    Unlike ReadLine nothing is stripped so this works for binary output.  It
+    returns as soon as there is anything to read (which may be less than
+    size).  Like ReadLine anything that is read here will not be returned by
+    a later call to Communicate.
+
+    Args:
+      pid: the process id returned by Host.Run(cmd, forked=True).
+      size: the most Bytes to return.
+      timeout: seconds to wait for output (None waits until there is some).
+
+    Returns:
+      A string of output, an empty string if there was none within timeout or
+      None if the cmd has closed its stdout.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    assert pid in self.process_dict
+    stdout = self.process_dict[pid].stdout
+    if timeout is not None:
+      ready = select.select([stdout], [], [], timeout)[0]
+      if not ready:
+        return ''
+    data = os.read(stdout.fileno(), size)
+    if data:
+      return data
+
+  def Write(self, pid, data):
+    """Method for writing to the stdin of a forked cmd.
+
+    Communicate closes stdin, so a cmd reading it sees the end of its input.
+
+    Args:
+      pid: the process id returned by Host.Run(cmd, forked=True).
+      data: the string to write.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    assert pid in self.process_dict
+    stdin = self.process_dict[pid].stdin
+    stdin.write(data)
+    stdin.flush()
+
   def Kill(self, pid, kill_string=None):
     """Method for killing a cmd.
 
@@ -350,4 +424,51 @@ class Host(object):
       logging.warn('UP -- %s', self.host)
     else:
       logging.error('TIMEOUT -- %s', self.host)
+
+  def ClockOffset(self, samples=10):
+    """Instance method for estimating how far the host's clock is off.
+
+    One cmd is started that prints the time on the host each time it reads a
+    line, so every sample is one round trip over the same (ssh) connection
+    rather than a new one.  Each sample assumes the host read its clock half
+    way through the round trip, so the sample with the least delay has the
+    smallest possible error (half of its delay).
+
+    Simple usage:
+      offset, delay = host_obj.ClockOffset()
+      controller_time = host_time - offset
+
+    Args:
+      samples: how many round trips to time.
+
+    Returns:
+      A tuple of the offset (seconds the host's clock is ahead of ours) and
+      the delay of the round trip it was taken from or None if the host never
+      answered (or its clock readings could not be parsed).
+
+    Raises:
+      see Host.RunLocal
+    """
+    pid = self.Run('sh -c \'while read line; do date +%s.%N; done\'',
+                   fork=True)
+    best = None
+    for _ in range(samples):
+      sent = time.time()
+      self.Write(pid, '\n')
+      line = self.ReadLine(pid)
+      received = time.time()
+      if not line:
+        break
+      try:
+        host_time = float(line)
+      except ValueError:
+        # i.e. a date without %N (BSD, busybox) prints it as it is.
+        logging.warn('%s -- bad clock reading %r', self.host, line.strip())
+        best = None
+        break
+      delay = received - sent
+      if best is None or delay < best[1]:
+        best = (host_time - (sent + received) / 2.0, delay)
+    self.Communicate(pid, echo_error=True)
+    return best
 #END CLASS Host
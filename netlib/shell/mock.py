@@ -29,6 +29,8 @@ Simple object usage:
 
 __author__ = 'gavaletz@google.com (Eric Gavaletz)'
 
+import StringIO
+
 from netlib.shell import bash
 
 
@@ -48,6 +50,10 @@ class MockSubProcess(object):
     self.echo_error = echo_error
     self.fork = fork
     self.active = True
+    if cmd == 'hostname':
+      self.stdout = StringIO.StringIO(host)
+    else:
+      self.stdout = StringIO.StringIO(MockHost.results.get(cmd, ''))
 
   # overiding methods in the stdlib
   def wait(self):  # pylint: disable-msg=C6409
@@ -68,14 +74,12 @@ class MockSubProcess(object):
 
   # overiding methods in the stdlib
   def communicate(self):  # pylint: disable-msg=C6409
-    """For Host.Reboot to work we need to return the actual hostname."""
+    """For Host.Reboot to work we need to return the actual hostname.
+
+    Like the real thing anything already read from stdout is not returned.
+    """
     self.active = False
-    if self.cmd == 'hostname':
-      return (self.host, '')
-    elif self.cmd in MockHost.results:
-      return (MockHost.results[self.cmd], '')
-    else:
-      return ('', '')
+    return (self.stdout.read(), '')
 #END CLASS MockSubProcess
 
 
@@ -118,4 +122,15 @@ class MockHost(bash.Host):
       return sub_p.pid
     else:
       return self.Communicate(sub_p.pid, echo_error)
+
+  def Read(self, pid, size=65536, timeout=None):
+    """There is no pipe to wait on so just read from the fake output."""
+    assert pid in self.process_dict
+    data = self.process_dict[pid].stdout.read(size)
+    if data:
+      return data
+
+  def Write(self, pid, data):
+    """There is no pipe to write to so just drop it."""
+    assert pid in self.process_dict
 #END CLASS MockHost
@@ -0,0 +1,326 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Samples CPU, softirq and network counters on a host while tests run.
+
+A single shell loop is forked on the host (over one ssh connection for remote
+hosts) which dumps /proc/stat, /proc/softirqs and /proc/net/dev between two
+marker lines every interval.  Nothing is parsed on the host, the counters are
+turned into rates on the controller once the loop is stopped.
+
+  ResourceSample: Named tuple with the raw counters from one sample.
+  ResourceUsage: Named tuple with the rates between two samples.
+  ResourceSampler: Class that runs the sampling loop on a host.
+  ParseSamples: Parses the output of the sampling loop.
+  Usage: Turns two samples into a ResourceUsage.
+
+Simple usage:
+  sampler = ResourceSampler('a.remote_host.com', interval=0.5)
+  sampler.Start()
+  ... generate some traffic ...
+  sampler.Stop()
+  usage = sampler.Usage(start_time, end_time)
+  print usage.cpu['cpu'], usage.net['eth0']
+"""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import bisect
+import collections
+
+from netlib.shell import bash
+
+
+MARKER = '@netlib-sample'
+END_MARKER = '@netlib-sample-end'
+SAMPLE_FILES = ['/proc/stat', '/proc/softirqs', '/proc/net/dev']
+
+# The counters are 32 bits on some kernels so they can wrap during a run.
+COUNTER_WRAP = 2 ** 32
+
+
+class ResourceSample(collections.namedtuple('ResourceSample',
+                                            ['time', 'cpu', 'softirqs',
+                                             'net'])):
+  """Class to simplify working with the counters from one sample.
+
+  This works like a struct in C/C++.  See named tuple for more information.
+  http://docs.python.org/library/collections.html#collections.namedtuple
+
+  Attributes:
+    time: host time the sample was taken in seconds since the epoch (float)
+    cpu: maps 'cpu', 'cpu0'... to the /proc/stat jiffies (dict of tuples)
+    softirqs: maps 'NET_RX'... to the per CPU counts (dict of tuples)
+    net: maps an interface to (rx_bytes, rx_packets, tx_bytes, tx_packets)
+  """
+  pass
+#END CLASS ResourceSample
+
+
+class ResourceUsage(collections.namedtuple('ResourceUsage',
+                                           ['start', 'end', 'cpu', 'softirqs',
+                                            'net'])):
+  """Class to simplify working with the rates between two samples.
+
+  This works like a struct in C/C++.  See named tuple for more information.
+  http://docs.python.org/library/collections.html#collections.namedtuple
+
+  Attributes:
+    start: time of the first sample (float)
+    end: time of the second sample (float)
+    cpu: maps 'cpu', 'cpu0'... to the busy fraction 0.0 - 1.0 (dict)
+    softirqs: maps 'NET_RX'... to interrupts per second over all CPUs (dict)
+    net: maps an interface to (rx Mbps, tx Mbps) (dict of tuples)
+  """
+  pass
+#END CLASS ResourceUsage
+
+
+def __Delta(first, last):
+  """Difference of two counters allowing for a single 32 bit wrap."""
+  if last < first:
+    return last + COUNTER_WRAP - first
+  return last - first
+
+
+def ParseSamples(data):
+  """Parses the output of the sampling loop.
+
+  Samples that were cut short when the loop was stopped are dropped.
+
+  Args:
+    data: string output of ResourceSampler (see ResourceSampler.Command).
+
+  Returns:
+    list of ResourceSample objects in the order they were taken.
+
+  Raises:
+    No exceptions handled here.
+    No new exceptions generated here.
+  """
+  samples = list()
+  current = None
+  section = None
+  for line in (data or '').splitlines():
+    stripped = line.strip()
+    if stripped.startswith(END_MARKER):
+      if current is not None:
+        samples.append(ResourceSample(*current))
+      current = None
+      continue
+    if stripped.startswith(MARKER):
+      try:
+        current = (float(stripped.split()[1]), dict(), dict(), dict())
+      except (IndexError, ValueError):
+        current = None
+      section = 'stat'
+      continue
+    if current is None or not stripped:
+      continue
+    if stripped.startswith('CPU0'):
+      section = 'softirqs'
+      continue
+    if stripped.startswith('Inter-|'):
+      section = 'net'
+      continue
+    if section == 'stat':
+      fields = stripped.split()
+      if fields[0].startswith('cpu'):
+        current[1][fields[0]] = tuple([int(x) for x in fields[1:]])
+    elif section == 'softirqs':
+      name, _, counts = stripped.partition(':')
+      current[2][name] = tuple([int(x) for x in counts.split()])
+    elif section == 'net' and '|' not in stripped:
+      name, _, counts = stripped.partition(':')
+      fields = counts.split()
+      current[3][name] = (int(fields[0]), int(fields[1]), int(fields[8]),
+                          int(fields[9]))
+  return samples
+
+
+def Usage(first, last):
+  """Turns two samples into a ResourceUsage.
+
+  The CPU is busy for every jiffy that is not idle or iowait.  Only the first
+  eight /proc/stat fields are counted since guest time is already included in
+  user time.
+
+  Args:
+    first: the earlier ResourceSample.
+    last: the later ResourceSample.
+
+  Returns:
+    ResourceUsage or None if the samples are not in order.
+
+  Raises:
+    No exceptions handled here.
+    No new exceptions generated here.
+  """
+  elapsed = last.time - first.time
+  if elapsed <= 0:
+    return None
+  cpu = dict()
+  for name in last.cpu:
+    if name not in first.cpu:
+      continue
+    total = sum(last.cpu[name][:8]) - sum(first.cpu[name][:8])
+    idle = sum(last.cpu[name][3:5]) - sum(first.cpu[name][3:5])
+    if total > 0:
+      cpu[name] = 1.0 - float(idle) / total
+    else:
+      cpu[name] = 0.0
+  softirqs = dict()
+  for name in last.softirqs:
+    if name in first.softirqs:
+      softirqs[name] = (sum(last.softirqs[name]) -
+                        sum(first.softirqs[name])) / elapsed
+  net = dict()
+  for name in last.net:
+    if name in first.net:
+      rx = __Delta(first.net[name][0], last.net[name][0])
+      tx = __Delta(first.net[name][2], last.net[name][2])
+      net[name] = (rx * 8 / elapsed / 1000000.0,
+                   tx * 8 / elapsed / 1000000.0)
+  return ResourceUsage(start=first.time, end=last.time, cpu=cpu,
+                       softirqs=softirqs, net=net)
+
+
+class ResourceSampler(object):
+  """Class that runs the sampling loop on a host.
+
+  The loop is one long lived shell process so a sample costs a date and a cat
+  rather than a new ssh connection.  Times come from the host clock so lining
+  samples up with anything timed on the controller assumes the clocks are in
+  sync (i.e. NTP).
+
+  Attributes:
+    host: the bash.Host being sampled.
+    interval: seconds to sleep between samples.
+    samples: list of ResourceSamples (filled in by Stop).
+  """
+
+  def __init__(self, target, interval=1.0):
+    """Inits ResourceSampler with a target Host.
+
+    Args:
+      target: hostname or bash.Host object to sample.
+      interval: seconds to sleep between samples.
+
+    Returns:
+      ResourceSampler: an instance of the ResourceSampler class.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if isinstance(target, bash.Host):
+      self.host = target
+    else:
+      self.host = bash.Host(target)
+    assert interval > 0
+    self.interval = interval
+    self.child_pid = None
+    self.data = None
+    self.samples = list()
+
+  def __del__(self):
+    """Makes sure the loop does not outlive us."""
+    if self.child_pid:
+      self.host.Kill(self.child_pid, 'pkill -f %s' % MARKER)
+
+  def Command(self):
+    """Returns the shell command for the sampling loop.
+
+    There are no double quotes in here since remote commands are wrapped in
+    them by bash.Host.Run.
+    """
+    return ('sh -c \'while :; do echo %s $(date +%%s.%%N); cat %s; echo %s; '
+            'sleep %s; done\'' % (MARKER, ' '.join(SAMPLE_FILES), END_MARKER,
+                                  self.interval))
+
+  def Start(self):
+    """Forks the sampling loop on the host.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if not self.child_pid:
+      self.child_pid = self.host.Run(self.Command(), echo_error=True,
+                                     fork=True)
+
+  def Stop(self):
+    """Stops the sampling loop and parses what it printed.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if self.child_pid:
+      self.data = self.host.Communicate(self.child_pid, echo_error=False,
+                                        kill=True,
+                                        kill_string='pkill -f %s' % MARKER)
+      self.child_pid = None
+      self.samples = ParseSamples(self.data)
+
+  def Usage(self, start=None, end=None):
+    """Returns the usage over a period of time.
+
+    The period is widened to the closest samples at or before start and at or
+    after end so it is never shorter than asked for.
+
+    Args:
+      start: seconds since the epoch, by default the first sample.
+      end: seconds since the epoch, by default the last sample.
+
+    Returns:
+      ResourceUsage or None if there are not two samples covering the period.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    if len(self.samples) < 2:
+      return None
+    times = [x.time for x in self.samples]
+    first = 0
+    last = len(times) - 1
+    if start is not None:
+      first = bisect.bisect_right(times, start) - 1
+    if end is not None:
+      last = bisect.bisect_left(times, end)
+    if first < 0 or last >= len(times) or first >= last:
+      return None
+    return Usage(self.samples[first], self.samples[last])
+
+  def Align(self, records, start_time):
+    """Returns the usage for each of a list of intervals.
+
+    Args:
+      records: list of objects with start and end in seconds since start_time
+        (i.e. IperfRecords from IperfResults.Intervals()).
+      start_time: seconds since the epoch the records are relative to.
+
+    Returns:
+      list of ResourceUsage (or None) 1:1 with records.
+
+    Raises:
+      No exceptions handled here.
+      No new exceptions generated here.
+    """
+    return [self.Usage(start_time + x.start, start_time + x.end)
+            for x in records]
+#END CLASS ResourceSampler
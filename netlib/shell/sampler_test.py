@@ -0,0 +1,127 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for netlib.shell.sampler."""
+
+__author__ = 'gavaletz@google.com (Eric Gavaletz)'
+
+import unittest
+
+from netlib.shell import mock
+from netlib.shell import sampler
+
+
+sample_template = """@netlib-sample %(time)s
+cpu  %(busy)d 0 0 %(idle)d 0 0 0 0 0 0
+cpu0 %(busy)d 0 0 %(idle)d 0 0 0 0 0 0
+intr 1 2 3
+ctxt 100
+                    CPU0
+          HI:          0
+      NET_RX:      %(irq)d
+Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:       0       0    0    0    0     0          0         0        0       0    0    0    0     0       0          0
+  eth0: %(rx)d 10    0    0    0     0          0         0 %(tx)d 20    0    0    0     0       0          0
+@netlib-sample-end"""
+
+sample_result = '\n'.join([
+    sample_template % {'time': '1000.0', 'busy': 0, 'idle': 0, 'irq': 0,
+                       'rx': 0, 'tx': 0},
+    sample_template % {'time': '1001.0', 'busy': 25, 'idle': 75, 'irq': 500,
+                       'rx': 1250000, 'tx': 125000},
+    sample_template % {'time': '1002.0', 'busy': 125, 'idle': 75,
+                       'irq': 1500, 'rx': 2500000, 'tx': 250000},
+    # cut short when the loop was killed
+    '@netlib-sample 1003.0\ncpu  1 2 3'])
+
+
+class ParseTest(unittest.TestCase):
+  """Test for ParseSamples and Usage."""
+
+  def setUp(self):
+    self.samples = sampler.ParseSamples(sample_result)
+
+  def testParse(self):
+    """Complete samples are parsed and the partial one is dropped."""
+    self.assertEqual(len(self.samples), 3)
+    sample = self.samples[1]
+    self.assertEqual(sample.time, 1001.0)
+    self.assertEqual(sample.cpu['cpu0'][:4], (25, 0, 0, 75))
+    self.assertEqual(sample.softirqs['NET_RX'], (500,))
+    self.assertEqual(sample.net['eth0'], (1250000, 10, 125000, 20))
+    self.assertEqual(sample.net['lo'], (0, 0, 0, 0))
+
+  def testUsage(self):
+    """Counters become rates between samples."""
+    usage = sampler.Usage(self.samples[0], self.samples[1])
+    self.assertAlmostEqual(usage.cpu['cpu'], 0.25)
+    self.assertAlmostEqual(usage.softirqs['NET_RX'], 500.0)
+    self.assertAlmostEqual(usage.net['eth0'][0], 10.0)
+    self.assertAlmostEqual(usage.net['eth0'][1], 1.0)
+    usage = sampler.Usage(self.samples[1], self.samples[2])
+    self.assertAlmostEqual(usage.cpu['cpu'], 1.0)
+    self.assertEqual(sampler.Usage(self.samples[2], self.samples[1]), None)
+
+  def testWrap(self):
+    """A 32 bit counter that wraps is not a negative rate."""
+    first = self.samples[0]._replace(net={'eth0': (2 ** 32 - 125000, 0, 0,
+                                                   0)})
+    usage = sampler.Usage(first, self.samples[1])
+    self.assertAlmostEqual(usage.net['eth0'][0], 11.0)
+#END CLASS ParseTest
+
+
+class ResourceSamplerTest(unittest.TestCase):
+  """Test for ResourceSampler."""
+
+  def setUp(self):
+    self.sampler = sampler.ResourceSampler(mock.MockHost('a.src'))
+    mock.MockHost.results[self.sampler.Command()] = sample_result
+
+  def testCommand(self):
+    """One loop for all of the files and no double quotes for ssh."""
+    cmd = self.sampler.Command()
+    self.assertFalse('"' in cmd)
+    for name in sampler.SAMPLE_FILES:
+      self.assertTrue(name in cmd)
+    self.assertTrue('sleep 1.0' in cmd)
+
+  def testStartStop(self):
+    """Samples are parsed when the loop is stopped."""
+    self.sampler.Start()
+    self.sampler.Stop()
+    self.assertEqual(len(self.sampler.samples), 3)
+    self.assertEqual(self.sampler.child_pid, None)
+
+  def testUsage(self):
+    """Periods widen to the samples around them."""
+    self.sampler.Start()
+    self.sampler.Stop()
+    usage = self.sampler.Usage()
+    self.assertEqual((usage.start, usage.end), (1000.0, 1002.0))
+    usage = self.sampler.Usage(1000.5, 1000.9)
+    self.assertEqual((usage.start, usage.end), (1000.0, 1001.0))
+    usage = self.sampler.Usage(1001.0, 1002.0)
+    self.assertEqual((usage.start, usage.end), (1001.0, 1002.0))
+    self.assertEqual(self.sampler.Usage(1002.0, 1005.0), None)
+    self.assertEqual(self.sampler.Usage(999.5, 1001.0), None)
+    self.assertEqual(self.sampler.Usage(1000.5, 1002.5), None)
+#END CLASS ResourceSamplerTest
+
+
+if __name__ == '__main__':
+  unittest.main()